@@ -1,161 +1,250 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, g, send_file, stream_with_context, url_for
 import cv2
-import numpy as np
+import atexit
 import base64
+import functools
 import json
-import pickle
 import os
-from insightface.app import FaceAnalysis
+import tempfile
+from face_backends import create_backend
+from face_pipeline import (DEFAULT_PIPELINE, DET_SIZE, PIPELINE_PROFILES, analyze_faces, analyze_frames,
+                           detect_faces, enabled_profiles, profile_modules, supports_profile)
+from face_batching import InferenceBatcher
+from face_detection import AdaptiveDetector
+from face_results import age_identities, build_face_results, draw_face_results
+from face_tracker import FaceTracker
+from video_stream import AdaptiveScheduler, CameraCapture, VideoBroadcast
 import threading
 import time
-from io import BytesIO
-from PIL import Image
-from sklearn.metrics.pairwise import cosine_similarity
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from gallery_service import (SIMILARITY_THRESHOLD, GalleryService, GalleryUnavailable, RemoteGallery,
+                             default_db_file)
+from image_ingest import IMAGE_EXTENSIONS, UploadTooLarge, decode_bounded, read_limited, scale_boxes
+from metrics import Registry
+from process_threads import ProcessThread
+from profiling import ProfileStore, summarize
+from result_cache import ResultCache
+from video_analysis import analyze_video
+
+try:
+    from flask_sock import Sock
+except ImportError:  # Optional: only the /ws/analyze live channel needs it
+    Sock = None
 
 app = Flask(__name__)
+# Largest frame accepted on the /ws/analyze WebSocket
+WS_MAX_FRAME_BYTES = int(os.environ.get('WS_MAX_FRAME_BYTES', str(2 * 1024 * 1024)))
+app.config['SOCK_SERVER_OPTIONS'] = {'max_message_size': WS_MAX_FRAME_BYTES, 'ping_interval': 25}
+sock = Sock(app) if Sock is not None else None
 
 # Global variables
-model = None
+# FACE_BACKEND=stub swaps buffalo_l for a deterministic stand-in (see face_backends.py)
+face_backend = create_backend()
+model = None  # FaceAnalysis-shaped model loaded by face_backend
 camera = None
 camera_lock = threading.Lock()
-learned_faces = {}  # Store learned faces: {person_id: {'embedding': array, 'age': int, 'name': str, 'count': int}}
-face_id_counter = 0
-SIMILARITY_THRESHOLD = 0.6  # Threshold for face recognition
 # Use persistent disk path for Render deployment
-FACES_DB_FILE = '/opt/render/project/src/data/learned_faces.pkl' if os.environ.get('ENVIRONMENT') == 'production' else 'learned_faces.pkl'
-frame_skip_counter = 0  # For performance optimization
+FACES_DB_FILE = default_db_file()
+# With several gunicorn workers the gallery lives in a separate process that
+# every worker talks to over this Unix socket (set by gunicorn.conf.py). While
+# that process is down (it is restarted), requests that need it get a 503
+# after waiting at most GALLERY_CONNECT_TIMEOUT seconds.
+GALLERY_SOCKET = os.environ.get('GALLERY_SOCKET')
+GALLERY_CONNECT_TIMEOUT = float(os.environ.get('GALLERY_CONNECT_TIMEOUT', '2'))
+if GALLERY_SOCKET:
+    gallery_service = RemoteGallery(GALLERY_SOCKET, connect_timeout=GALLERY_CONNECT_TIMEOUT)
+else:
+    gallery_service = GalleryService(FACES_DB_FILE)
+    atexit.register(gallery_service.close)
+BATCH_MAX_IMAGES = int(os.environ.get('BATCH_MAX_IMAGES', '200'))  # Per /api/batch_upload request
+BATCH_MAX_BYTES = int(float(os.environ.get('BATCH_MAX_MB', '200')) * 1024 * 1024)  # Total, after decompression
+BATCH_DECODE_WORKERS = int(os.environ.get('BATCH_DECODE_WORKERS', str(min(8, os.cpu_count() or 1))))
+RESPONSE_MODES = ('json', 'data', 'jpeg', 'multipart')  # See response_mode()
+# Uploads over UPLOAD_MAX_MB or MAX_IMAGE_MEGAPIXELS are refused before decoding; larger
+# images are decoded (JPEGs at reduced scale) to WORKING_MAX_SIDE pixels on the long side
+UPLOAD_MAX_BYTES = int(float(os.environ.get('UPLOAD_MAX_MB', '25')) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(float(os.environ.get('MAX_IMAGE_MEGAPIXELS', '100')) * 1e6)
+WORKING_MAX_SIDE = int(os.environ.get('WORKING_MAX_SIDE', '1920'))  # 0 = analyse at full resolution
+# /api/analyze_video spools uploads to disk and decodes them frame by frame,
+# analysing VIDEO_SAMPLE_FPS frames per second of video
+VIDEO_MAX_BYTES = int(float(os.environ.get('VIDEO_MAX_MB', '500')) * 1024 * 1024)
+VIDEO_SAMPLE_FPS = float(os.environ.get('VIDEO_SAMPLE_FPS', '2'))
+# The model loads on a background thread; inference requests wait this many
+# seconds for it before failing fast with 503 (0 = do not wait)
+MODEL_WAIT_TIMEOUT = float(os.environ.get('MODEL_WAIT_TIMEOUT', '0'))
+model_ready = threading.Event()
+model_state = {'phase': 'pending', 'error': None, 'started_at': None, 'ready_at': None}
+# Concurrent requests share recognition/genderage batches: the batcher waits up
+# to INFERENCE_BATCH_WAIT_MS after the first queued face for up to
+# INFERENCE_BATCH_SIZE faces (see face_batching.py)
+INFERENCE_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', '32'))
+INFERENCE_BATCH_WAIT_MS = float(os.environ.get('INFERENCE_BATCH_WAIT_MS', '5'))
+INFERENCE_QUEUE_LIMIT = int(os.environ.get('INFERENCE_QUEUE_LIMIT', '1024'))
+if os.environ.get('INFERENCE_BATCHING', '1') != '0':
+    inference_batcher = InferenceBatcher(INFERENCE_BATCH_SIZE, INFERENCE_BATCH_WAIT_MS / 1000, INFERENCE_QUEUE_LIMIT)
+else:
+    inference_batcher = None
+# Repeated /upload_image bytes are answered from a bounded LRU cache
+# (RESULT_CACHE_SIZE=0 disables it)
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '256'))
+RESULT_CACHE_MAX_MB = float(os.environ.get('RESULT_CACHE_MAX_MB', '64'))
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', '300'))
+if RESULT_CACHE_SIZE > 0:
+    result_cache = ResultCache(RESULT_CACHE_SIZE, int(RESULT_CACHE_MAX_MB * 1024 * 1024), RESULT_CACHE_TTL)
+else:
+    result_cache = None
+# Realtime streams track faces between detections and only re-run recognition
+# for new, uncertain or stale tracks (see face_tracker.py)
+FACE_TRACKING = os.environ.get('FACE_TRACKING', '1') != '0'
+TRACKER_REFRESH_INTERVAL = int(os.environ.get('TRACKER_REFRESH_INTERVAL', '10'))  # In detection rounds
+TRACKER_OPTICAL_FLOW = os.environ.get('TRACKER_OPTICAL_FLOW', '1') != '0'
+# Streams detect in crops around tracked faces, with a full-frame scan every
+# FULL_SCAN_INTERVAL detections so new faces are still found
+ROI_DETECTION = os.environ.get('ROI_DETECTION', '1') != '0'
+FULL_SCAN_INTERVAL = int(os.environ.get('FULL_SCAN_INTERVAL', '5'))
+# Each video stream adapts its detection cadence and frame rate to these targets
+STREAM_TARGET_FPS = float(os.environ.get('STREAM_TARGET_FPS', '15'))
+STREAM_TARGET_LATENCY_MS = float(os.environ.get('STREAM_TARGET_LATENCY_MS', '250'))
+STREAM_MAX_DETECT_INTERVAL = int(os.environ.get('STREAM_MAX_DETECT_INTERVAL', '10'))
+# PROFILING=1 lets a request ask for a profile with ?profile= or an X-Profile header;
+# artifacts are kept in PROFILE_DIR and served from /api/profiles
+if os.environ.get('PROFILING', '0') == '1':
+    profile_store = ProfileStore(os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(FACES_DB_FILE), 'profiles')),
+                                 keep=int(os.environ.get('PROFILE_KEEP', '20')),
+                                 sample_interval=float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5')) / 1000)
+else:
+    profile_store = None
+PROFILE_STREAM_SECONDS = float(os.environ.get('PROFILE_STREAM_SECONDS', '10'))  # Default /video_feed profile length
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', '60'))
+
+# Prometheus metrics served on /metrics; each process (gunicorn worker) keeps its own
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram('face_app_stage_seconds', 'Time spent in each processing stage', ['stage'])
+STAGES = ('decode', 'detection', 'tracking', 'analysis', 'gallery', 'draw', 'encode',
+          'stream_infer', 'stream_encode', 'stream_latency')
+stage_timers = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+REQUEST_SECONDS = metrics.histogram('face_app_request_seconds', 'Request handling time (to the first byte for streams)',
+                                    ['endpoint', 'status'])
+FACES_PER_FRAME = metrics.histogram('face_app_faces_per_frame', 'Faces detected per analysed frame', [],
+                                    buckets=(0, 1, 2, 3, 5, 8, 13, 20, 50))
+IDENTITIES = metrics.counter('face_app_identities', 'Analysed faces by outcome (RECOGNIZED, LEARNING, DETECTED)',
+                             ['status'])
+GALLERY_FACES = metrics.gauge('face_app_gallery_faces', 'People in the learned-face gallery')
+GALLERY_EVICTED = metrics.counter('face_app_gallery_evicted', 'People evicted by the gallery size limit')
+GALLERY_MERGED = metrics.counter('face_app_gallery_merged', 'Duplicate identities merged')
+GALLERY_SNAPSHOTS = metrics.counter('face_app_gallery_snapshots', 'Gallery snapshots written to disk')
+GALLERY_SNAPSHOT_SECONDS = metrics.counter('face_app_gallery_snapshot_seconds', 'Time spent writing gallery snapshots')
+MODEL_READY = metrics.gauge('face_app_model_ready', '1 once the model is loaded and warmed up')
+VIDEO_VIEWERS = metrics.gauge('face_app_video_viewers', 'Connected /video_feed viewers', ['pipeline'])
+RESULT_CACHE_ENTRIES = metrics.gauge('face_app_result_cache_entries', 'Entries in the upload result cache')
+RESULT_CACHE_LOOKUPS = metrics.counter('face_app_result_cache_lookups', 'Upload result cache lookups', ['result'])
+BATCHER_QUEUE = metrics.gauge('face_app_inference_queue_faces', 'Face crops waiting for the inference batcher')
 
 
 def initialize_model():
-    """Initialize the InsightFace model"""
+    """Initialize the InsightFace model (blocking; see start_model_loading)"""
     global model
+    model_ready.clear()
+    model_state.update(phase='loading', error=None, started_at=time.time(), ready_at=None)
     try:
         print("Starting model initialization...")
-        model = FaceAnalysis(name="buffalo_l")
-        print("FaceAnalysis created, preparing model...")
-        model.prepare(ctx_id=-1)  # Use CPU for deployment compatibility
-        print("Model prepared successfully")
+        # Only load the InsightFace modules the enabled pipeline profiles use
+        modules = profile_modules(enabled_profiles())
+        print(f"Loading model modules: {', '.join(modules)} ({face_backend.name} backend)")
+        loaded_model = face_backend.load(modules)
+        print("Model prepared successfully, warming up...")
+        model_state['phase'] = 'warming'
+        face_backend.warm_up(loaded_model)
         load_learned_faces()
-        print("Model initialization completed successfully")
+        # Only publish the model once it is fully usable
+        model = loaded_model
+        model_state.update(phase='ready', ready_at=time.time())
+        model_ready.set()
+        print(f"Model initialization completed in {model_state['ready_at'] - model_state['started_at']:.1f}s")
         return True
     except Exception as e:
         print(f"Error initializing model: {e}")
         import traceback
         traceback.print_exc()
         model = None
+        model_state.update(phase='failed', error=str(e))
         return False
 
 
-def save_learned_faces():
-    """Save learned faces to disk"""
-    try:
-        # Ensure directory exists for persistent storage
-        os.makedirs(os.path.dirname(FACES_DB_FILE), exist_ok=True)
-        with open(FACES_DB_FILE, 'wb') as f:
-            pickle.dump(learned_faces, f)
-        print(f"Saved {len(learned_faces)} learned faces to disk")
-    except Exception as e:
-        print(f"Error saving learned faces: {e}")
+model_loader = ProcessThread(initialize_model, 'model-loader')
 
 
-def load_learned_faces():
-    """Load learned faces from disk"""
-    global learned_faces, face_id_counter
-    try:
-        if os.path.exists(FACES_DB_FILE):
-            with open(FACES_DB_FILE, 'rb') as f:
-                learned_faces = pickle.load(f)
-            face_id_counter = max(learned_faces.keys()) + 1 if learned_faces else 0
-            print(f"Loaded {len(learned_faces)} learned faces from disk")
-        else:
-            learned_faces = {}
-            face_id_counter = 0
-            print("No previous learned faces found")
-    except Exception as e:
-        print(f"Error loading learned faces: {e}")
-        learned_faces = {}
-        face_id_counter = 0
-
+def start_model_loading():
+    """Load the model on a background thread (once per process) so the server can bind immediately"""
+    if model_loader.started() and model_ready.is_set():
+        return
+    model_loader.ensure()
 
-# Initialize model after all functions are defined
-print("Initializing AI model...")
-try:
-    model_init_success = initialize_model()
-    if not model_init_success:
-        print("Warning: AI model initialization failed. Some features may not work.")
-    else:
-        print("AI model ready!")
-except Exception as e:
-    print(f"Critical error during model initialization: {e}")
-    model = None
 
+def request_pipeline():
+    """Pipeline profile requested via ?pipeline=, or None if it is not served"""
+    pipeline = request.args.get('pipeline', DEFAULT_PIPELINE)
+    if pipeline not in enabled_profiles() or (model is not None and not supports_profile(model, pipeline)):
+        return None
+    return pipeline
 
-def find_matching_face(face_embedding):
-    """Find if this face matches any learned face"""
-    if not learned_faces:
-        return None, 0
 
-    best_match_id = None
-    best_similarity = 0
+def invalid_pipeline_response():
+    return jsonify({'error': f"Unknown or disabled pipeline. Available: {', '.join(enabled_profiles())}"}), 400
 
-    for person_id, person_data in learned_faces.items():
-        stored_embedding = person_data['embedding']
 
-        # Calculate cosine similarity
-        similarity = cosine_similarity(
-            face_embedding.reshape(1, -1),
-            stored_embedding.reshape(1, -1)
-        )[0][0]
+@app.errorhandler(GalleryUnavailable)
+def gallery_unavailable_response(e):
+    """503 response for requests that need the gallery process while it is down"""
+    print(f"Gallery unavailable: {e}")
+    response = jsonify({'error': 'The face gallery is restarting. Please try again shortly.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
 
-        if similarity > SIMILARITY_THRESHOLD and similarity > best_similarity:
-            best_similarity = similarity
-            best_match_id = person_id
 
-    return best_match_id, best_similarity
+def model_unavailable_response():
+    """503 response for inference routes while the model is not ready, else None"""
+    if model_ready.wait(MODEL_WAIT_TIMEOUT) and model is not None:
+        return None
+    response = jsonify({
+        'error': f"AI model is not ready yet (phase: {model_state['phase']}). Please try again shortly.",
+        'phase': model_state['phase']
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
 
 
-def learn_new_face(face_embedding, age):
-    """Learn a new face and assign it an ID"""
-    global face_id_counter
-
-    person_id = face_id_counter
-    person_name = f"Person_{person_id}"
+def save_learned_faces():
+    """Ask the gallery to fold all changes into a fresh snapshot"""
+    gallery_service.save()
 
-    learned_faces[person_id] = {
-        'embedding': face_embedding,
-        'age': age,
-        'name': person_name,
-        'count': 1,
-        'last_seen': time.time()
-    }
 
-    face_id_counter += 1
-    save_learned_faces()
+def load_learned_faces():
+    """Load learned faces from disk (a no-op for workers using the gallery process)"""
+    gallery_service.load()
 
-    return person_id, person_name
 
+def find_matching_faces(face_embeddings):
+    """Match a batch of face embeddings against all learned faces at once"""
+    return gallery_service.match(face_embeddings)
 
-def update_learned_face(person_id, face_embedding, age):
-    """Update an existing learned face (running average of embeddings and age)"""
-    if person_id in learned_faces:
-        person_data = learned_faces[person_id]
 
-        # Update count
-        person_data['count'] += 1
+def find_matching_face(face_embedding):
+    """Find if this face matches any learned face"""
+    return find_matching_faces(face_embedding)[0]
 
-        # Running average of embeddings (for better stability)
-        alpha = 0.1  # Learning rate
-        person_data['embedding'] = (1 - alpha) * person_data['embedding'] + alpha * face_embedding
 
-        # Running average of age
-        person_data['age'] = int((person_data['age'] + age) / 2)
+def learn_new_face(face_embedding, age):
+    """Learn a new face and assign it an ID"""
+    return gallery_service.learn(face_embedding, age)
 
-        # Update last seen
-        person_data['last_seen'] = time.time()
 
-        # Save every 10 recognitions to avoid too frequent disk writes
-        if person_data['count'] % 10 == 0:
-            save_learned_faces()
+def update_learned_face(person_id, face_embedding, age):
+    """Update an existing learned face (running average of embeddings and age)"""
+    gallery_service.update(person_id, face_embedding, age)
 
 
 def get_camera():
@@ -164,6 +253,9 @@ def get_camera():
     with camera_lock:
         if camera is None:
             try:
+                camera = face_backend.open_camera()
+                if camera is not None:
+                    return camera
                 # Check if running on Render (no camera available)
                 if os.environ.get('ENVIRONMENT') == 'production':
                     print("Camera not available in production environment (Render)")
@@ -195,6 +287,13 @@ def get_camera():
         return camera
 
 
+# One capture thread feeds every video broadcast (see video_stream.py)
+camera_capture = CameraCapture(get_camera)
+video_broadcasts = {}
+video_broadcasts_lock = threading.Lock()
+stream_detectors = {}  # Pipeline -> AdaptiveDetector of its current broadcast run
+
+
 def release_camera():
     """Release camera resources"""
     global camera
@@ -205,91 +304,110 @@ def release_camera():
             print("Camera released")
 
 
-def process_frame_for_age_and_recognition(frame, skip_processing=False):
-    """Process a single frame for age prediction and face recognition"""
-    if model is None:
-        # Draw error message on frame
-        cv2.putText(frame, "Model not initialized", (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        return frame, []
+def estimate_ages(faces):
+    """Identities for the age-only pipeline: no embedding, so no gallery lookup"""
+    IDENTITIES.labels('DETECTED').inc(len(faces))
+    return age_identities(faces)
 
-    try:
-        # Skip face detection every few frames for performance (but still return the frame)
-        if skip_processing:
-            return frame, []
 
-        # Analyze faces
-        faces = model.get(frame)
-        results = []
+def identify_faces(faces, pipeline):
+    """Recognize faces when the pipeline computes embeddings, otherwise only report ages"""
+    if 'recognition' in PIPELINE_PROFILES[pipeline]:
+        return recognize_faces(faces)
+    return estimate_ages(faces)
 
-        if len(faces) == 0:
-            # Draw "No faces detected" message
-            cv2.putText(frame, "No faces detected", (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
 
-        for i, face in enumerate(faces):
-            age = int(face.age)
-            box = face.bbox.astype(int)
-            face_embedding = face.embedding
+def recognize_faces(faces):
+    """Match detected faces against the gallery in one batched step, learning unknown faces"""
+    if not faces:
+        return []
+    with stage_timers['gallery'].time():
+        identities = gallery_service.recognize([face.embedding for face in faces], [int(face.age) for face in faces])
+    for identity in identities:
+        IDENTITIES.labels(identity['status']).inc()
+    return identities
 
-            # Check if this face matches any learned face
-            match_id, similarity = find_matching_face(face_embedding)
 
-            if match_id is not None:
-                # Found a match - use stored information
-                person_data = learned_faces[match_id]
-                stored_age = person_data['age']
-                person_name = person_data['name']
+def create_face_tracker():
+    """New tracker for one video stream, or None when tracking is disabled"""
+    if not FACE_TRACKING:
+        return None
+    return FaceTracker(refresh_interval=TRACKER_REFRESH_INTERVAL,
+                       confident_similarity=SIMILARITY_THRESHOLD + 0.1,
+                       use_flow=TRACKER_OPTICAL_FLOW)
 
-                # Update the learned face
-                update_learned_face(match_id, face_embedding, age)
 
-                # Use stored age for stability
-                display_age = stored_age
-                status = "RECOGNIZED"
-                color = (0, 255, 0)  # Green for recognized
+def create_face_detector():
+    """New region-of-interest detector for one video stream, or None to always scan the full frame"""
+    if not ROI_DETECTION:
+        return None
+    return AdaptiveDetector(full_scan_interval=FULL_SCAN_INTERVAL, load_budget=1.0 / STREAM_TARGET_FPS)
 
-                label = f"{person_name}: Age {display_age}"
-                confidence_label = f"Confidence: {similarity:.2f}"
 
+def track_faces(frame, tracker, skip_processing, pipeline, detector=None, detected_only=False):
+    """Detect on processed frames and move tracked boxes on skipped ones, reusing known identities"""
+    if skip_processing:
+        with stage_timers['tracking'].time():
+            tracker.propagate(frame)
+    else:
+        with stage_timers['detection'].time():
+            if detector is not None:
+                detections = detector.detect(model, frame, [track.bbox for track in tracker.tracks])
             else:
-                # New face - learn it
-                person_id, person_name = learn_new_face(face_embedding, age)
-                display_age = age
-                status = "LEARNING"
-                color = (0, 165, 255)  # Orange for learning
-
-                label = f"{person_name}: Age {display_age}"
-                confidence_label = "LEARNING NEW FACE"
-
-            # Ensure box coordinates are within frame bounds
-            h, w = frame.shape[:2]
-            box[0] = max(0, min(box[0], w - 1))
-            box[1] = max(0, min(box[1], h - 1))
-            box[2] = max(0, min(box[2], w - 1))
-            box[3] = max(0, min(box[3], h - 1))
-
-            # Draw rectangle and labels
-            cv2.rectangle(frame, (box[0], box[1]), (box[2], box[3]), color, 2)
-
-            # Main age label
-            cv2.putText(frame, label, (box[0], max(box[1] - 10, 20)),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-
-            # Status/confidence indicator
-            cv2.putText(frame, confidence_label, (box[0], min(box[3] + 20, h - 10)),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
-
-            results.append({
-                'person_id': match_id if match_id is not None else person_id,
-                'name': person_name,
-                'age': display_age,
-                'bbox': box.tolist(),
-                'status': status,
-                'similarity': similarity if match_id is not None else 0.0
-            })
-
-        return frame, results
+                detections = detect_faces(model, frame)
+        FACES_PER_FRAME.observe(len(detections))
+        with stage_timers['tracking'].time():
+            tracks = tracker.update(frame, detections)
+        pending = [track for track in tracks if tracker.needs_identity(track)]
+        with stage_timers['analysis'].time():
+            faces = analyze_faces(model, frame, [track.face for track in pending], pipeline, inference_batcher)
+        tracker.assign(pending, identify_faces(faces, pipeline))
+    tracked = tracker.results(detected_only)
+    return build_face_results([track for track, _ in tracked], [identity for _, identity in tracked], frame.shape)
+
+
+def detect_and_analyze(frame, pipeline):
+    """Detected faces with the pipeline's per-face outputs (run_pipeline in timed steps)"""
+    with stage_timers['detection'].time():
+        faces = detect_faces(model, frame)
+    FACES_PER_FRAME.observe(len(faces))
+    with stage_timers['analysis'].time():
+        analyze_faces(model, frame, faces, pipeline, inference_batcher)
+    return faces
+
+
+def face_results_for(frame, faces, pipeline, draw=True):
+    """Identify analysed faces and build their results, drawing them onto the frame if asked"""
+    results = build_face_results(faces, identify_faces(faces, pipeline), frame.shape)
+    if draw:
+        with stage_timers['draw'].time():
+            draw_face_results(frame, results)
+    return results
+
+
+def process_frame_for_age_and_recognition(frame, skip_processing=False, pipeline=DEFAULT_PIPELINE, tracker=None,
+                                          detector=None):
+    """Process and annotate a single frame of the live view; errors are drawn onto the frame"""
+    if model is None:
+        # Draw error message on frame
+        message = "Model loading..." if model_state['phase'] in ('loading', 'warming') else "Model not initialized"
+        cv2.putText(frame, message, (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        return frame, []
+
+    try:
+        if tracker is not None:
+            results = track_faces(frame, tracker, skip_processing, pipeline, detector)
+            with stage_timers['draw'].time():
+                draw_face_results(frame, results)
+            return frame, results
+
+        # Skip face detection every few frames for performance (but still return the frame)
+        if skip_processing:
+            return frame, []
+
+        faces = detect_and_analyze(frame, pipeline)
+        return frame, face_results_for(frame, faces, pipeline)
     except Exception as e:
         print(f"Error processing frame: {e}")
         # Draw error message on frame
@@ -326,28 +444,14 @@ def learned_faces_page():
 @app.route('/api/learned_faces')
 def get_learned_faces():
     """Get all learned faces data"""
-    faces_data = []
-    for person_id, data in learned_faces.items():
-        faces_data.append({
-            'id': person_id,
-            'name': data['name'],
-            'age': data['age'],
-            'count': data['count'],
-            'last_seen': data['last_seen']
-        })
+    faces_data = gallery_service.list_faces()
     return jsonify({'faces': faces_data, 'total': len(faces_data)})
 
 
 @app.route('/api/reset_learned_faces', methods=['POST'])
 def reset_learned_faces():
     """Reset all learned faces"""
-    global learned_faces, face_id_counter
-    learned_faces = {}
-    face_id_counter = 0
-
-    # Remove the file
-    if os.path.exists(FACES_DB_FILE):
-        os.remove(FACES_DB_FILE)
+    gallery_service.reset()
 
     return jsonify({'status': 'success', 'message': 'All learned faces have been reset'})
 
@@ -359,9 +463,7 @@ def rename_person():
     person_id = data.get('person_id')
     new_name = data.get('new_name', '').strip()
 
-    if person_id in learned_faces and new_name:
-        learned_faces[person_id]['name'] = new_name
-        save_learned_faces()
+    if new_name and gallery_service.rename(person_id, new_name):
         return jsonify({'status': 'success', 'message': f'Person renamed to {new_name}'})
 
     return jsonify({'status': 'error', 'message': 'Invalid person ID or name'}), 400
@@ -372,25 +474,88 @@ def model_status():
     """Check if model is properly initialized"""
     return jsonify({
         'model_initialized': model is not None,
-        'learned_faces_count': len(learned_faces)
+        'phase': model_state['phase'],
+        'backend': face_backend.name,
+        'learned_faces_count': gallery_service.count()
     })
 
 
 @app.route('/api/initialize_model', methods=['POST'])
 def initialize_model_api():
-    """Initialize the model on demand"""
+    """Initialize the model on demand (restarts a failed background load)"""
     try:
-        if initialize_model():
+        if model_ready.is_set():
             return jsonify({'status': 'success', 'message': 'Model initialized successfully'})
-        else:
-            return jsonify({'status': 'error', 'message': 'Failed to initialize model'}), 500
+        start_model_loading()
+        return jsonify({'status': 'loading', 'message': 'Model is loading in the background',
+                        'phase': model_state['phase']}), 202
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving, whatever the model is doing"""
+    return jsonify({'status': 'ok', 'phase': model_state['phase']})
+
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 once the model is loaded and warmed up, 503 before"""
+    ready = model_ready.is_set() and model is not None
+    body = {'ready': ready, 'phase': model_state['phase']}
+    if model_state['error']:
+        body['error'] = model_state['error']
+    if model_state['ready_at']:
+        body['load_seconds'] = round(model_state['ready_at'] - model_state['started_at'], 2)
+    return jsonify(body), 200 if ready else 503
+
+
+def requested_profile():
+    """Value of ?profile= or the X-Profile header; always None unless PROFILING=1"""
+    if profile_store is None:
+        return None
+    value = request.args.get('profile') or request.headers.get('X-Profile')
+    if not value or value.lower() in ('0', 'false', 'no'):
+        return None
+    return value
+
+
+def profiled(view):
+    """Profile one request when asked to; the artifact URL is returned in the X-Profile header.
+
+    ``profile=sample`` samples every thread (including the inference batcher);
+    any other value uses cProfile on the request thread.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        value = requested_profile()
+        if value is None:
+            return view(*args, **kwargs)
+        mode = 'sample' if value.lower() == 'sample' else 'cprofile'
+        g.profile_name, finish = profile_store.start(request.endpoint, mode)
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        finally:
+            finish()
+        response.headers['X-Profile'] = url_for('download_profile', name=g.profile_name)
+        return response
+    return wrapper
+
+
 @app.route('/capture_image', methods=['POST'])
+@profiled
 def capture_image():
     """Capture and process a single image"""
+    unavailable = model_unavailable_response()
+    if unavailable:
+        return unavailable
+    pipeline = request_pipeline()
+    if pipeline is None:
+        return invalid_pipeline_response()
+    mode = response_mode()
+    if mode is None:
+        return invalid_response_mode_response()
     try:
         # Check if camera is available
         if os.environ.get('ENVIRONMENT') == 'production':
@@ -406,25 +571,37 @@ def capture_image():
             return jsonify({'error': 'Failed to capture image'}), 500
 
         # Process frame for age prediction and recognition
-        processed_frame, results = process_frame_for_age_and_recognition(frame.copy())
-
-        # Convert to base64 for web display
-        _, buffer = cv2.imencode('.jpg', processed_frame)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
+        draw = mode != 'data'
+        if draw:
+            frame = frame.copy()
+        faces = detect_and_analyze(frame, pipeline)
+        results = face_results_for(frame, faces, pipeline, draw)
 
-        return jsonify({
-            'image': img_base64,
-            'faces': results
-        })
+        return face_results_response(results, mode, encode_jpeg(frame) if draw else None)
 
+    except GalleryUnavailable as e:
+        return gallery_unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/upload_image', methods=['POST'])
+@profiled
 def upload_image():
     """Process uploaded image"""
+    unavailable = model_unavailable_response()
+    if unavailable:
+        return unavailable
+    pipeline = request_pipeline()
+    if pipeline is None:
+        return invalid_pipeline_response()
+    mode = response_mode()
+    if mode is None:
+        return invalid_response_mode_response()
     try:
+        # Refuse oversized bodies before the multipart form is parsed and spooled
+        if UPLOAD_MAX_BYTES and (request.content_length or 0) > UPLOAD_MAX_BYTES + 64 * 1024:
+            raise UploadTooLarge(f"Image is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
         if 'image' not in request.files:
             return jsonify({'error': 'No image uploaded'}), 400
 
@@ -432,80 +609,563 @@ def upload_image():
         if file.filename == '':
             return jsonify({'error': 'No image selected'}), 400
 
-        # Read and decode image
-        image_bytes = file.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if frame is None:
+        image_bytes = read_limited(file.stream, UPLOAD_MAX_BYTES)
+        original_coords = request.args.get('coords') == 'original'
+
+        # Repeated uploads of the same bytes are answered from the result cache
+        # (except when profiling, which is about the uncached path)
+        cache_key = None
+        if result_cache is not None and 'profile_name' not in g:
+            cache_key = ResultCache.key(image_bytes, pipeline, face_backend.model_name, DET_SIZE, WORKING_MAX_SIDE)
+            cached = cached_face_results(cache_key, mode, pipeline)
+            if cached is not None:
+                results, jpeg, scale, original_size = cached
+                if original_coords:
+                    results = scale_boxes(results, scale, original_size)
+                response = face_results_response(results, mode, jpeg)
+                response.headers['X-Cache'] = 'HIT'
+                response.headers['X-Image-Scale'] = f"{scale:.4f}"
+                return response
+
+        # Decode at working resolution; the frame is ours, so it is drawn on in place
+        image = ingest_image(image_bytes)
+        if image is None:
             return jsonify({'error': 'Invalid image format'}), 400
 
         # Process frame for age prediction and recognition
-        processed_frame, results = process_frame_for_age_and_recognition(frame.copy())
+        draw = mode != 'data'
+        faces = detect_and_analyze(image.frame, pipeline)
+        results = face_results_for(image.frame, faces, pipeline, draw)
+
+        jpeg = encode_jpeg(image.frame) if draw else None
+        if cache_key is not None:
+            store_face_results(cache_key, image_bytes, faces, image.frame.shape, results, jpeg, image.scale,
+                               image.original_size)
+        if original_coords:
+            results = scale_boxes(results, image.scale, image.original_size)
+        response = face_results_response(results, mode, jpeg)
+        if cache_key is not None:
+            response.headers['X-Cache'] = 'MISS'
+        response.headers['X-Image-Scale'] = f"{image.scale:.4f}"
+        return response
+
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except GalleryUnavailable as e:
+        return gallery_unavailable_response(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def response_mode():
+    """Response mode from ?response= or else the Accept header; None if unsupported.
+
+    json (default): face results plus the annotated image as base64
+    data: face results only, nothing is drawn or encoded
+    jpeg: the annotated image as raw JPEG, face results in the X-Faces header
+    multipart: multipart/mixed with a JSON part and a raw JPEG part
+    """
+    mode = request.args.get('response')
+    if mode is not None:
+        return mode if mode in RESPONSE_MODES else None
+    best = request.accept_mimetypes.best_match(['application/json', 'image/jpeg', 'multipart/mixed'])
+    return {'image/jpeg': 'jpeg', 'multipart/mixed': 'multipart'}.get(best, 'json')
+
+
+def invalid_response_mode_response():
+    return jsonify({'error': f"Unknown response mode. Available: {', '.join(RESPONSE_MODES)}"}), 400
 
-        # Convert to base64
-        _, buffer = cv2.imencode('.jpg', processed_frame)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
 
-        return jsonify({
-            'image': img_base64,
-            'faces': results
-        })
+def encode_jpeg(frame):
+    with stage_timers['encode'].time():
+        _, buffer = cv2.imencode('.jpg', frame)
+    return buffer.tobytes()
 
+
+def face_results_response(results, mode, jpeg=None):
+    """Build the response for one analysed image; jpeg is the annotated image unless mode is 'data'"""
+    if mode == 'data':
+        return jsonify({'faces': results})
+
+    if mode == 'jpeg':
+        response = Response(jpeg, mimetype='image/jpeg')
+        response.headers['X-Faces'] = json.dumps(results)
+        return response
+    if mode == 'multipart':
+        boundary = os.urandom(12).hex()
+        body = b''.join([
+            f'--{boundary}\r\nContent-Type: application/json\r\n\r\n'.encode(),
+            json.dumps({'faces': results}).encode(),
+            f'\r\n--{boundary}\r\nContent-Type: image/jpeg\r\n\r\n'.encode(),
+            jpeg,
+            f'\r\n--{boundary}--\r\n'.encode(),
+        ])
+        return Response(body, mimetype=f'multipart/mixed; boundary={boundary}')
+
+    return jsonify({
+        'image': base64.b64encode(jpeg).decode('utf-8'),
+        'faces': results
+    })
+
+
+def drawn_labels(results):
+    """What draw_face_results writes for each face, to tell whether an overlay is still current"""
+    return [(result['name'], result['age'], result['status'], round(result['similarity'], 2)) for result in results]
+
+
+def store_face_results(key, image_bytes, faces, frame_shape, results, jpeg, scale=1.0, original_size=None):
+    """Remember an upload's analysed faces (and annotated image, if one was made) in the result cache"""
+    entry = {'image_bytes': image_bytes, 'faces': faces, 'frame_shape': frame_shape,
+             'labels': drawn_labels(results), 'annotated': jpeg, 'scale': scale, 'original_size': original_size}
+    size = len(image_bytes) + len(jpeg or b'') + 4096 * len(faces)
+    result_cache.put(key, entry, size)
+
+
+def cached_face_results(key, mode, pipeline):
+    """(results, annotated JPEG, scale, original size) for a repeated upload, or None on a miss.
+
+    Only the model's work is cached: the faces are identified against the
+    gallery again on every hit, exactly as for a new upload, so people are
+    learned and updated (count, last_seen) and status, similarity and names
+    are current, also after a rename or reset in another worker. The overlay
+    is redrawn from the original upload when its labels changed (or when the
+    entry was stored by a data-only request).
+    """
+    entry = result_cache.get(key)
+    if entry is None:
+        return None
+    results = build_face_results(entry['faces'], identify_faces(entry['faces'], pipeline), entry['frame_shape'])
+
+    jpeg = entry['annotated']
+    if mode != 'data' and (jpeg is None or drawn_labels(results) != entry['labels']):
+        with stage_timers['draw'].time():
+            frame = draw_face_results(decode_image(entry['image_bytes']), results)
+        jpeg = encode_jpeg(frame)
+        store_face_results(key, entry['image_bytes'], entry['faces'], entry['frame_shape'], results, jpeg,
+                           entry['scale'], entry['original_size'])
+    return results, jpeg, entry['scale'], entry['original_size']
+
+
+def ingest_image(image_bytes):
+    """Decode to working resolution (see image_ingest.py); None if the bytes are not an image"""
+    with stage_timers['decode'].time():
+        return decode_bounded(image_bytes, WORKING_MAX_SIDE, MAX_IMAGE_PIXELS)
+
+
+def decode_image(image_bytes):
+    """Decode encoded image bytes to a BGR frame at working resolution, or None if they are not an image"""
+    image = ingest_image(image_bytes)
+    return image.frame if image is not None else None
+
+
+def list_batch_images():
+    """(filename, size, read) for every image in the multipart 'images' files and zip archives.
+
+    Nothing is read or decompressed yet: sizes come from the zip directory
+    and the spooled uploads, so the batch limits can be checked first.
+    ``read()`` returns the bytes, or None for an image over UPLOAD_MAX_MB.
+    """
+    entries = []
+    for file in request.files.getlist('images') + request.files.getlist('archive'):
+        if file.filename == '':
+            continue
+        if file.filename.lower().endswith('.zip'):
+            archive = zipfile.ZipFile(file.stream)
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    entries.append((info.filename, info.file_size, functools.partial(archive.read, info)))
+        else:
+            file.stream.seek(0, os.SEEK_END)
+            size = file.stream.tell()
+            file.stream.seek(0)
+            entries.append((file.filename, size, file.stream.read))
+
+    def limited(size, read):
+        # zipfile stops at the declared size, so file_size bounds what read() returns
+        return (lambda: None) if UPLOAD_MAX_BYTES and size > UPLOAD_MAX_BYTES else read
+
+    return [(filename, size, limited(size, read)) for filename, size, read in entries]
+
+
+def ingest_upload(image_bytes):
+    """(DecodedImage, None) for one uploaded image, or (None, error message); bytes are None if over the limit"""
+    if image_bytes is None:
+        return None, f"Image is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MB"
+    try:
+        image = ingest_image(image_bytes)
+    except UploadTooLarge as e:
+        return None, str(e)
+    return (image, None) if image is not None else (None, 'Invalid image format')
+
+
+@app.route('/api/batch_upload', methods=['POST'])
+def batch_upload():
+    """Analyze many images (multipart files or a zip archive) in one request"""
+    unavailable = model_unavailable_response()
+    if unavailable:
+        return unavailable
+    pipeline = request_pipeline()
+    if pipeline is None:
+        return invalid_pipeline_response()
+    try:
+        items = list_batch_images()
+        if not items:
+            return jsonify({'error': 'No images uploaded'}), 400
+        if len(items) > BATCH_MAX_IMAGES:
+            return jsonify({'error': f'Too many images (maximum {BATCH_MAX_IMAGES} per request)'}), 400
+        total_bytes = sum(size for _, size, _ in items if not UPLOAD_MAX_BYTES or size <= UPLOAD_MAX_BYTES)
+        if BATCH_MAX_BYTES and total_bytes > BATCH_MAX_BYTES:
+            return jsonify({'error': f'Images total {total_bytes // (1024 * 1024)} MB '
+                                     f'(maximum {BATCH_MAX_BYTES // (1024 * 1024)} MB per request)'}), 413
+
+        annotate = request.args.get('annotate', '').lower() in ('1', 'true', 'yes')
+        original_coords = request.args.get('coords') == 'original'
+
+        # Each image is read (decompressed) and decoded on a pool thread and its
+        # bytes dropped right after; cv2.imdecode releases the GIL
+        with ThreadPoolExecutor(max_workers=BATCH_DECODE_WORKERS) as executor:
+            decoded = list(executor.map(lambda item: ingest_upload(item[2]()), items))
+        frames = [image.frame if image is not None else None for image, _ in decoded]
+
+        # Detect in every image, then embed all faces of the set together and
+        # match them against the gallery in one batched step
+        with stage_timers['detection'].time():
+            detections = [detect_faces(model, frame) if frame is not None else [] for frame in frames]
+        with stage_timers['analysis'].time():
+            analyze_frames(model, frames, detections, pipeline, max_batch=INFERENCE_BATCH_SIZE)
+        all_faces = [face for faces in detections for face in faces]
+        all_identities = identify_faces(all_faces, pipeline)
+
+        images = []
+        offset = 0
+        for (filename, _, _), (image, error), faces in zip(items, decoded, detections):
+            if image is None:
+                images.append({'filename': filename, 'error': error, 'faces': []})
+                continue
+
+            identities = all_identities[offset:offset + len(faces)]
+            offset += len(faces)
+            results = build_face_results(faces, identities, image.frame.shape)
+            entry = {'filename': filename,
+                     'faces': scale_boxes(results, image.scale, image.original_size) if original_coords else results,
+                     'scale': round(image.scale, 4)}
+            if annotate:
+                _, buffer = cv2.imencode('.jpg', draw_face_results(image.frame, results))
+                entry['image'] = base64.b64encode(buffer).decode('utf-8')
+            images.append(entry)
+
+        return jsonify({'images': images, 'total_images': len(images), 'total_faces': len(all_faces)})
+
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'Invalid zip archive'}), 400
+    except GalleryUnavailable as e:
+        return gallery_unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-def generate_frames():
-    """Generate frames for video streaming with face recognition"""
-    global frame_skip_counter
-    camera = get_camera()
+def create_frame_processor(pipeline):
+    """Per-run frame processor for a video broadcast; the stream scheduler decides when to detect"""
+    tracker = create_face_tracker()
+    detector = create_face_detector() if tracker is not None else None
+    stream_detectors[pipeline] = detector
 
-    if camera is None:
-        print("Camera not available for streaming")
-        return
+    def process(frame, detect):
+        processed_frame, _ = process_frame_for_age_and_recognition(frame, not detect, pipeline, tracker, detector)
+        return processed_frame
 
-    print("Starting video stream generation...")
+    return process
 
-    while True:
-        try:
-            ret, frame = camera.read()
-            if not ret:
-                print("Failed to read frame from camera")
-                break
 
-            # Skip face processing every few frames for better performance
-            frame_skip_counter += 1
-            skip_processing = (frame_skip_counter % 3 != 0)  # Process every 3rd frame
+def create_video_frame_analyzer(pipeline):
+    """Per-file frame analyzer for video_analysis: detection on every sampled frame, identities kept by a tracker"""
+    # Sampled frames are too far apart for optical flow or region-of-interest detection,
+    # and for a track to keep its identity: samples are recognised afresh every time
+    tracker = FaceTracker(refresh_interval=1,
+                          confident_similarity=SIMILARITY_THRESHOLD + 0.1, use_flow=False)
 
-            # Process frame for age prediction and recognition
-            processed_frame, _ = process_frame_for_age_and_recognition(frame.copy(), skip_processing)
+    def analyze(frame):
+        # Errors propagate, so a failed sample ends the run instead of looking like a frame without faces.
+        # Tracks held over a missed detection are left out; they would stretch intervals past an exit.
+        results = track_faces(frame, tracker, False, pipeline, detected_only=True)
+        # Results follow tracker order; the track id keys people the pipeline does not recognise
+        for result, (track, _) in zip(results, tracker.results(detected_only=True)):
+            result['track_id'] = track.track_id
+        return results
 
-            # Encode frame
-            ret, buffer = cv2.imencode('.jpg', processed_frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            if not ret:
-                continue
+    return analyze
 
-            frame_bytes = buffer.tobytes()
 
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+def create_stream_scheduler():
+    return AdaptiveScheduler(target_fps=STREAM_TARGET_FPS,
+                             target_latency=STREAM_TARGET_LATENCY_MS / 1000,
+                             max_detect_interval=STREAM_MAX_DETECT_INTERVAL)
 
-            # Small delay to prevent overwhelming the CPU
-            time.sleep(0.05)  # ~20 FPS for better stability
 
-        except Exception as e:
-            print(f"Error in frame generation: {e}")
-            break
+def observe_stream_stage(stage, seconds):
+    stage_timers['stream_' + stage].observe(seconds)
+
+
+def get_video_broadcast(pipeline):
+    """Shared broadcast for a pipeline; every viewer of it reads the same encoded frames"""
+    with video_broadcasts_lock:
+        if pipeline not in video_broadcasts:
+            video_broadcasts[pipeline] = VideoBroadcast(camera_capture, lambda: create_frame_processor(pipeline),
+                                                        create_stream_scheduler, observe=observe_stream_stage)
+        return video_broadcasts[pipeline]
+
 
-    print("Video stream generation ended")
+def generate_frames(pipeline=DEFAULT_PIPELINE):
+    """Generate frames for video streaming with face recognition"""
+    print("Video viewer connected")
+    try:
+        yield from get_video_broadcast(pipeline).subscribe()
+    finally:
+        print("Video viewer disconnected")
 
 
 @app.route('/video_feed')
 def video_feed():
     """Video streaming route"""
-    return Response(generate_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    pipeline = request_pipeline()
+    if pipeline is None:
+        return invalid_pipeline_response()
+    response = Response(generate_frames(pipeline),
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+    value = requested_profile()
+    if value is not None:
+        # The stream runs on background threads, so sample all threads for a while
+        try:
+            seconds = float(value)
+        except ValueError:
+            seconds = PROFILE_STREAM_SECONDS
+        seconds = min(max(seconds, 1.0), PROFILE_MAX_SECONDS)
+        name = profile_store.profile_for('video_feed', seconds)
+        response.headers['X-Profile'] = url_for('download_profile', name=name)
+    return response
+
+
+@app.route('/api/analyze_video', methods=['POST'])
+def analyze_video_upload():
+    """Per-person appearance intervals and ages for an uploaded video, streamed as JSON lines"""
+    unavailable = model_unavailable_response()
+    if unavailable:
+        return unavailable
+    pipeline = request_pipeline()
+    if pipeline is None:
+        return invalid_pipeline_response()
+    try:
+        sample_fps = float(request.args.get('sample_fps', VIDEO_SAMPLE_FPS))
+        max_gap = float(request.args['max_gap']) if 'max_gap' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'sample_fps and max_gap must be numbers'}), 400
+    if VIDEO_MAX_BYTES and (request.content_length or 0) > VIDEO_MAX_BYTES + 64 * 1024:
+        return jsonify({'error': f"Video is larger than {VIDEO_MAX_BYTES // (1024 * 1024)} MB"}), 413
+    if 'video' not in request.files or request.files['video'].filename == '':
+        return jsonify({'error': 'No video uploaded'}), 400
+
+    # VideoCapture needs a file, so the upload is copied to disk in chunks
+    file = request.files['video']
+    handle, path = tempfile.mkstemp(suffix=os.path.splitext(file.filename)[1][:10])
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            size = 0
+            while True:
+                chunk = file.stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if VIDEO_MAX_BYTES and size > VIDEO_MAX_BYTES:
+                    raise UploadTooLarge(f"Video is larger than {VIDEO_MAX_BYTES // (1024 * 1024)} MB")
+                f.write(chunk)
+        events = analyze_video(path, create_video_frame_analyzer(pipeline), sample_fps=sample_fps, max_gap=max_gap)
+        first = next(events)  # Opens the video, so unreadable files still get a plain 400
+    except UploadTooLarge as e:
+        os.remove(path)
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        os.remove(path)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        os.remove(path)
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        try:
+            yield json.dumps(first) + '\n'
+            for event in events:
+                yield json.dumps(event) + '\n'
+        except Exception as e:
+            print(f"Error analysing video: {e}")
+            yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+        finally:
+            events.close()
+            os.remove(path)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/api/profiles')
+def list_profiles():
+    """Stored profile artifacts, newest first (404 unless PROFILING=1)"""
+    if profile_store is None:
+        return jsonify({'error': 'Profiling is disabled (set PROFILING=1)'}), 404
+    return jsonify({'profiles': [dict(artifact, url=url_for('download_profile', name=artifact['name']))
+                                 for artifact in profile_store.list()]})
+
+
+@app.route('/api/profiles/<name>')
+def download_profile(name):
+    """Download a profile artifact; ?format=text summarises a cProfile artifact instead"""
+    if profile_store is None:
+        return jsonify({'error': 'Profiling is disabled (set PROFILING=1)'}), 404
+    path = profile_store.path(name)
+    if path is None:
+        return jsonify({'error': 'Profile not found (a stream profile appears once it has finished)'}), 404
+    if request.args.get('format') == 'text' and name.endswith('.prof'):
+        return Response(summarize(path), mimetype='text/plain')
+    return send_file(path, as_attachment=True, download_name=name)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def observe_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None and request.endpoint != 'metrics_endpoint':
+        REQUEST_SECONDS.labels(request.endpoint or 'unmatched', response.status_code).observe(
+            time.perf_counter() - started)
+    return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics: stage latency histograms, face counters and gallery/stream gauges"""
+    stats = gallery_service.stats()
+    GALLERY_FACES.set(stats['size'])
+    GALLERY_EVICTED.set(stats['evicted'])
+    GALLERY_MERGED.set(stats['merged'])
+    GALLERY_SNAPSHOTS.set(stats['snapshots'])
+    GALLERY_SNAPSHOT_SECONDS.set(stats['snapshot_seconds'])
+    MODEL_READY.set(1 if model_ready.is_set() and model is not None else 0)
+    with video_broadcasts_lock:
+        broadcasts = dict(video_broadcasts)
+    for pipeline, broadcast in broadcasts.items():
+        VIDEO_VIEWERS.labels(pipeline).set(broadcast.stats()['viewers'])
+    if result_cache is not None:
+        cache_stats = result_cache.snapshot()
+        RESULT_CACHE_ENTRIES.set(cache_stats['entries'])
+        RESULT_CACHE_LOOKUPS.labels('hit').set(cache_stats['hits'])
+        RESULT_CACHE_LOOKUPS.labels('miss').set(cache_stats['misses'])
+    if inference_batcher is not None:
+        BATCHER_QUEUE.set(inference_batcher.snapshot()['queue_depth'])
+    return Response(metrics.render(), content_type=Registry.CONTENT_TYPE)
+
+
+@app.route('/api/gallery_stats')
+def gallery_stats():
+    """Gallery size, capacity evictions and duplicate merges"""
+    return jsonify(gallery_service.stats())
+
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    """Hit/miss counters and size of the upload result cache"""
+    if result_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **result_cache.snapshot()})
+
+
+@app.route('/api/inference_stats')
+def inference_stats():
+    """Queue depth, batch sizes and wait/run times of the inference batcher"""
+    if inference_batcher is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **inference_batcher.snapshot()})
+
+
+@app.route('/api/stream_stats')
+def stream_stats():
+    """Current scheduling decisions and stage latencies of each video stream"""
+    with video_broadcasts_lock:
+        broadcasts = dict(video_broadcasts)
+    streams = {}
+    for pipeline, broadcast in broadcasts.items():
+        streams[pipeline] = broadcast.stats()
+        if stream_detectors.get(pipeline) is not None:
+            streams[pipeline]['detector'] = stream_detectors[pipeline].snapshot()
+    return jsonify({'streams': streams})
+
+
+def analyze_socket(ws):
+    """Live analysis channel: JPEG frames in, compact face results out.
+
+    Frames that arrive while a frame is being analysed are dropped (only the
+    newest one is kept), so a fast client never builds up a backlog. Each
+    reply carries ``seq``, the number of frames received so far, so the
+    client can tell which of its frames have been answered or skipped.
+    """
+    if model_unavailable_response() is not None:
+        ws.close(reason=1013, message=f"AI model is not ready yet (phase: {model_state['phase']})")
+        return
+    pipeline = request_pipeline()
+    if pipeline is None:
+        ws.close(reason=1008, message=f"Unknown or disabled pipeline. Available: {', '.join(enabled_profiles())}")
+        return
+
+    tracker = create_face_tracker()
+    detector = create_face_detector() if tracker is not None else None
+    received = dropped = 0
+    while True:
+        data = ws.receive()
+        received += 1
+        # Backpressure: skip to the newest frame that queued up during the last analysis
+        while True:
+            newer = ws.receive(timeout=0)
+            if newer is None:
+                break
+            data = newer
+            received += 1
+            dropped += 1
+        # Every message gets a reply, so clients counting frames in flight never stall
+        if not isinstance(data, bytes):
+            ws.send(json.dumps({'seq': received, 'error': 'Send frames as binary JPEG messages'}))
+            continue
+
+        started = time.perf_counter()
+        image, error = ingest_upload(data)
+        if image is None:
+            ws.send(json.dumps({'seq': received, 'error': error}))
+            continue
+        # Failures get an error reply, so clients can tell them from frames without faces
+        try:
+            if tracker is not None:
+                results = track_faces(image.frame, tracker, False, pipeline, detector)
+            else:
+                results = face_results_for(image.frame, detect_and_analyze(image.frame, pipeline), pipeline,
+                                           draw=False)
+        except GalleryUnavailable as e:
+            print(f"Gallery unavailable: {e}")
+            ws.send(json.dumps({'seq': received, 'error': 'The face gallery is restarting. Please try again shortly.',
+                                'retry_after': 5}))
+            continue
+        except Exception as e:
+            print(f"Error analysing WebSocket frame: {e}")
+            ws.send(json.dumps({'seq': received, 'error': str(e)}))
+            continue
+        ws.send(json.dumps({
+            'seq': received,
+            'faces': results,
+            'dropped': dropped,
+            'inference_ms': round((time.perf_counter() - started) * 1000, 1)
+        }))
+
+
+if sock is not None:
+    sock.route('/ws/analyze')(analyze_socket)
 
 
 @app.route('/start_camera')
@@ -534,13 +1194,12 @@ def stop_camera():
         return jsonify({'error': str(e)}), 500
 
 
-if __name__ == '__main__':
-    # Initialize model on startup
-    print("Initializing model...")
-    if initialize_model():
-        print("Model initialized successfully. Starting Flask app...")
-    else:
-        print("Failed to initialize model. App may not work properly.")
+# Load the model in the background once all functions are defined; the server
+# binds immediately and /readyz reports when inference is available
+print("Initializing AI model in the background...")
+start_model_loading()
 
+
+if __name__ == '__main__':
     # Run the app
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
\ No newline at end of file
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Headless batch analysis of image directories: images are sharded across a
+process pool, each worker running its own face model, and one record per image
+is appended to a JSON lines or CSV file as soon as it is analysed.
+
+Runs are resumable: images already in the output file are skipped, so after a
+crash or Ctrl-C the same command picks up where it stopped.
+
+With --gallery, faces are matched against the persisted learned-face gallery
+(``match``) or matched and learned into it (``enroll``). The gallery runs in
+its own process, as under gunicorn, so ids stay consistent across workers;
+``match`` opens it read-only. The gallery files are locked by whichever
+process owns them, so next to a running server pass --gallery-socket (or set
+GALLERY_SOCKET) to use the server's gallery process instead.
+
+Usage: python batch_analysis.py photos/ [more.jpg ...] --output results.jsonl
+       [--workers 4] [--gallery match|enroll] [--gallery-socket /tmp/gallery.sock]
+       [--annotate-dir annotated/] [--file-list paths.txt]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+
+from face_backends import create_backend
+from face_pipeline import profile_modules, run_pipeline, supports_profile
+from face_results import age_identities, build_face_results, draw_face_results
+from gallery_service import (GalleryUnavailable, RemoteGallery, default_db_file, start_gallery_server,
+                             stop_gallery_server, wait_for_gallery_server)
+from image_ingest import IMAGE_EXTENSIONS, UploadTooLarge, decode_bounded, scale_boxes
+from session_config import available_cores
+
+CSV_FIELDS = ('path', 'width', 'height', 'face', 'x1', 'y1', 'x2', 'y2', 'age', 'person_id', 'name', 'status',
+              'similarity', 'error')
+
+# Per-process state of a pool worker (see init_worker)
+worker = {}
+
+
+def init_worker(pipeline, gallery_mode, gallery_socket, max_side, max_pixels, annotate_dir):
+    """Load this worker's model and connect it to the gallery process"""
+    cv2.setNumThreads(1)  # Parallelism comes from the pool
+    model = create_backend().load(profile_modules([pipeline]))
+    if not supports_profile(model, pipeline):
+        raise RuntimeError(f"The face model cannot run the {pipeline} pipeline")
+    worker.update(model=model, pipeline=pipeline, gallery_mode=gallery_mode,
+                  gallery=RemoteGallery(gallery_socket) if gallery_socket else None,
+                  max_side=max_side, max_pixels=max_pixels, annotate_dir=annotate_dir)
+
+
+def identify(faces):
+    """Identities for one image's faces according to the gallery mode"""
+    if worker['gallery'] is None:
+        return age_identities(faces)
+    if not faces:
+        return []
+    embeddings = [face.embedding for face in faces]
+    if worker['gallery_mode'] == 'enroll':
+        return worker['gallery'].recognize(embeddings, [int(face.age) for face in faces])
+
+    # Match only: the gallery is not changed, unmatched faces stay unknown
+    matches = worker['gallery'].match(embeddings)
+    names = worker['gallery'].names([person_id for person_id, _ in matches if person_id is not None])
+    identities = []
+    for face, (person_id, similarity) in zip(faces, matches):
+        known = person_id in names
+        identities.append({
+            'person_id': person_id if known else None,
+            'name': names.get(person_id),
+            'age': int(face.age),
+            'status': 'RECOGNIZED' if known else 'UNKNOWN',
+            'similarity': similarity if known else 0.0
+        })
+    return identities
+
+
+def analyze_image(path, annotate_name):
+    """Result record for one image; unreadable or undecodable files are recorded with an error"""
+    try:
+        with open(path, 'rb') as f:
+            image = decode_bounded(f.read(), worker['max_side'], worker['max_pixels'])
+    except (OSError, UploadTooLarge) as e:
+        return {'path': path, 'error': str(e)}
+    if image is None:
+        return {'path': path, 'error': 'Invalid image format'}
+
+    faces = run_pipeline(worker['model'], image.frame, worker['pipeline'])
+    results = build_face_results(faces, identify(faces), image.frame.shape)
+    if worker['annotate_dir']:
+        annotated_path = os.path.join(worker['annotate_dir'], annotate_name)
+        os.makedirs(os.path.dirname(annotated_path), exist_ok=True)
+        cv2.imwrite(annotated_path, draw_face_results(image.frame, results))
+    width, height = image.original_size
+    return {'path': path, 'width': width, 'height': height,
+            'faces': scale_boxes(results, image.scale, image.original_size)}
+
+
+def analyze_chunk(tasks):
+    return [analyze_image(path, annotate_name) for path, annotate_name in tasks]
+
+
+def find_images(inputs, file_list=None):
+    """``(path, annotated name)`` for every image in the inputs, directories walked in sorted order.
+
+    The annotated name is the path relative to the input directory, or the
+    file name for images given directly or in the file list.
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        path = os.path.join(root, name)
+                        yield path, os.path.relpath(path, item)
+        else:
+            yield item, os.path.basename(item)
+    if file_list:
+        with open(file_list) as f:
+            for line in f:
+                path = line.strip()
+                if path:
+                    yield path, os.path.basename(path)
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def truncate_partial_line(path):
+    """Cut off a last line left incomplete by a crash, so appending starts on a fresh line"""
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            block = min(65536, position)
+            f.seek(position - block)
+            data = f.read(block)
+            if position == end and data.endswith(b'\n'):
+                return
+            newline = data.rfind(b'\n')
+            if newline >= 0:
+                f.truncate(position - block + newline + 1)
+                return
+            position -= block
+        f.truncate(0)
+
+
+def completed_paths(path, output_format):
+    """Paths that already have a record in an existing output file"""
+    if not os.path.exists(path):
+        return set()
+    truncate_partial_line(path)
+    done = set()
+    with open(path, newline='') as f:
+        if output_format == 'csv':
+            for row in csv.DictReader(f):
+                done.add(row['path'])
+        else:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['path'])
+                except (ValueError, KeyError):
+                    continue
+    return done
+
+
+class JsonLinesWriter:
+    """One JSON object per image"""
+
+    def __init__(self, f):
+        self.file = f
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+
+
+class CsvWriter:
+    """One row per face; images without faces (or with an error) get a single row with empty face columns"""
+
+    def __init__(self, f):
+        self.file = f
+        if f.tell() == 0:
+            csv.writer(f).writerow(CSV_FIELDS)
+
+    def write(self, record):
+        # All rows of an image go out in one write, so a crash cannot split them
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, CSV_FIELDS)
+        base = {key: record.get(key, '') for key in ('path', 'width', 'height', 'error')}
+        faces = record.get('faces') or []
+        if not faces:
+            writer.writerow(base)
+        for index, face in enumerate(faces):
+            x1, y1, x2, y2 = face['bbox']
+            writer.writerow(dict(base, face=index, x1=x1, y1=y1, x2=x2, y2=y2, age=face['age'],
+                                 person_id='' if face['person_id'] is None else face['person_id'],
+                                 name=face['name'] or '', status=face['status'],
+                                 similarity=round(face['similarity'], 4)))
+        self.file.write(buffer.getvalue())
+
+
+def run(args):
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    if args.overwrite and os.path.exists(args.output):
+        os.remove(args.output)
+    done = completed_paths(args.output, output_format)
+    if done:
+        print(f"Resuming: {len(done)} images already in {args.output}")
+    skipped = 0
+
+    def remaining():
+        nonlocal skipped
+        for path, annotate_name in find_images(args.inputs, args.file_list):
+            if path in done:
+                skipped += 1
+                continue
+            yield path, annotate_name
+
+    # Each worker runs its own model; split the cores between them instead of oversubscribing
+    os.environ.setdefault('ORT_INTRA_OP_THREADS', str(max(1, available_cores() // args.workers)))
+    os.environ.setdefault('ORT_ALLOW_SPINNING', '1' if args.workers == 1 else '0')
+
+    gallery_socket = gallery_process = None
+    if args.gallery != 'none' and args.gallery_socket:
+        gallery_socket = args.gallery_socket  # A running server's gallery process
+    elif args.gallery != 'none':
+        gallery_socket = os.path.join(tempfile.gettempdir(), f"batch_analysis_gallery_{os.getpid()}.sock")
+        # Fail at once if a server owns the gallery rather than waiting for its lock
+        os.environ.setdefault('GALLERY_LOCK_TIMEOUT', '0')
+        gallery_process = start_gallery_server(gallery_socket, args.gallery_db or default_db_file(),
+                                               read_only=args.gallery == 'match')
+        try:
+            wait_for_gallery_server(gallery_socket, gallery_process)
+        except GalleryUnavailable as e:
+            stop_gallery_server(gallery_socket, gallery_process)
+            print(f"Cannot open the gallery ({e}); if a server is running, pass its --gallery-socket")
+            return 1
+    pipeline = 'age' if args.gallery == 'none' else 'recognize'
+
+    images = faces = errors = 0
+    started = last_report = time.perf_counter()
+    output = open(args.output, 'a', newline='')
+    writer = CsvWriter(output) if output_format == 'csv' else JsonLinesWriter(output)
+    executor = ProcessPoolExecutor(args.workers, initializer=init_worker,
+                                   initargs=(pipeline, args.gallery, gallery_socket, args.max_side,
+                                             int(args.max_megapixels * 1e6), args.annotate_dir))
+    try:
+        # Only a few chunks per worker are in flight, so memory does not grow with the input
+        tasks = chunked(remaining(), args.chunk_size)
+        pending = set()
+        while True:
+            for chunk in tasks:
+                pending.add(executor.submit(analyze_chunk, chunk))
+                if len(pending) >= args.workers * 4:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for record in future.result():
+                    writer.write(record)
+                    images += 1
+                    faces += len(record.get('faces', []))
+                    errors += 'error' in record
+            output.flush()
+
+            now = time.perf_counter()
+            if now - last_report >= args.progress_every:
+                last_report = now
+                print(f"{images} images ({images / (now - started):.1f}/s), {faces} faces, {errors} errors")
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume")
+        return 130
+    except BrokenProcessPool as e:
+        print(f"A worker died ({e}); run the same command again to resume")
+        return 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        output.close()
+        if gallery_process is not None:
+            stop_gallery_server(gallery_socket, gallery_process)
+
+    elapsed = time.perf_counter() - started
+    print(f"Done: {images} images in {elapsed:.1f}s ({images / elapsed if elapsed else 0:.1f}/s), "
+          f"{faces} faces, {errors} errors, {skipped} skipped as already done")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='*', help='Image files and directories (walked recursively)')
+    parser.add_argument('--file-list', help='Text file with one image path per line')
+    parser.add_argument('--output', required=True, help='Results file; appended to and resumed if it exists')
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help='Output format (default: from the file extension)')
+    parser.add_argument('--overwrite', action='store_true', help='Start over instead of resuming')
+    parser.add_argument('--workers', type=int, default=max(1, available_cores() // 2), help='Worker processes')
+    parser.add_argument('--chunk-size', type=int, default=8, help='Images per task sent to a worker')
+    parser.add_argument('--gallery', choices=('none', 'match', 'enroll'), default='none',
+                        help='Match faces against the learned-face gallery, or match and learn new faces')
+    parser.add_argument('--gallery-db', help='Gallery file (default: the app\'s learned_faces.pkl)')
+    parser.add_argument('--gallery-socket', default=os.environ.get('GALLERY_SOCKET'),
+                        help='Use a running server\'s gallery process instead of opening the gallery file')
+    parser.add_argument('--annotate-dir', help='Write annotated copies of the images here')
+    parser.add_argument('--max-side', type=int, default=1920, help='Long side images are analysed at (0 = full size)')
+    parser.add_argument('--max-megapixels', type=float, default=100, help='Larger images are recorded as errors')
+    parser.add_argument('--progress-every', type=float, default=10, help='Seconds between progress lines')
+    args = parser.parse_args()
+    if not args.inputs and not args.file_list:
+        parser.error('give image files, directories or --file-list')
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error('--workers and --chunk-size must be at least 1')
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Detector cost per frame: fixed 640x640 full-frame scans (the old behaviour)
+versus AdaptiveDetector (aspect-matched input, crops around known faces,
+periodic full scans) on a simulated camera pan over one image.
+
+Usage: python benchmarks/adaptive_detection.py [--image photo.jpg] [--frames 100]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def simulated_frames(image, count, size=(640, 480), step=2):
+    """Crops of ``image`` sliding ``step`` pixels per frame, like a slow pan"""
+    import cv2
+    w, h = size
+    scale = max(w / image.shape[1], h / image.shape[0]) * 1.2
+    image = cv2.resize(image, (int(image.shape[1] * scale) + 1, int(image.shape[0] * scale) + 1))
+    max_x = image.shape[1] - w
+    for i in range(count):
+        x = (i * step) % max(max_x, 1)
+        yield np.ascontiguousarray(image[:h, x:x + w])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', help='Image to pan over (default: insightface sample group photo)')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--full-scan-interval', type=int, default=5)
+    args = parser.parse_args()
+
+    import cv2
+    from face_detection import AdaptiveDetector
+    from face_pipeline import DET_SIZE, PIPELINE_PROFILES, detect_faces, load_face_model, warm_up_model
+
+    if args.image:
+        image = cv2.imread(args.image)
+    else:
+        from insightface.data import get_image
+        image = get_image('t1')
+
+    model = load_face_model(PIPELINE_PROFILES['age'])
+    warm_up_model(model)
+    frames = list(simulated_frames(image, args.frames))
+
+    start = time.perf_counter()
+    fixed_faces = [len(detect_faces(model, frame, input_size=(DET_SIZE, DET_SIZE))) for frame in frames]
+    fixed_ms = (time.perf_counter() - start) * 1000 / len(frames)
+
+    detector = AdaptiveDetector(full_scan_interval=args.full_scan_interval)
+    adaptive_faces = []
+    hints = []
+    start = time.perf_counter()
+    for frame in frames:
+        faces = detector.detect(model, frame, hints)
+        hints = [face.bbox for face in faces]
+        adaptive_faces.append(len(faces))
+    adaptive_ms = (time.perf_counter() - start) * 1000 / len(frames)
+
+    result = {
+        'frames': len(frames),
+        'fixed_ms_per_frame': round(fixed_ms, 2),
+        'adaptive_ms_per_frame': round(adaptive_ms, 2),
+        'speedup': round(fixed_ms / adaptive_ms, 2) if adaptive_ms else None,
+        'fixed_faces_per_frame': round(float(np.mean(fixed_faces)), 2),
+        'adaptive_faces_per_frame': round(float(np.mean(adaptive_faces)), 2),
+        'detector': detector.snapshot(),
+    }
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
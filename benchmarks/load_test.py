@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Load generator for a running server: drives /upload_image, /api/learned_faces
+and /video_feed from concurrent workers and reports throughput and latency
+percentiles per scenario.
+
+Start the server with the stub backend to load-test the app itself (locking,
+gallery, persistence, encoding) without buffalo_l or inference cost:
+
+    FACE_BACKEND=stub STUB_FACES=3 STUB_DETECT_MS=20 STUB_FACE_MS=5 python app.py
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --concurrency 16 --duration 30
+
+Each worker repeatedly picks a scenario from ``--mix`` (weights). Uploads use
+the images in ``--images`` or synthetic frames; ``--unique`` makes every
+upload distinct so the result cache is bypassed. A /video_feed request reads
+``--stream-frames`` frames and records the time to the first frame and the
+average frame interval.
+
+Usage: python benchmarks/load_test.py [--mix upload=8,learned_faces=1,video_feed=0] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import numpy as np
+
+SCENARIOS = ('upload', 'learned_faces', 'video_feed')
+
+
+def synthetic_images(count, width=640, height=480):
+    """Distinct JPEG frames with a few bright blobs, so a real detector has something to look at"""
+    import cv2
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        frame = np.full((height, width, 3), rng.integers(40, 200, 3), dtype=np.uint8)
+        for _ in range(3):
+            center = (int(rng.integers(60, width - 60)), int(rng.integers(60, height - 60)))
+            cv2.circle(frame, center, int(rng.integers(30, 60)), tuple(int(c) for c in rng.integers(0, 255, 3)), -1)
+        images.append(cv2.imencode('.jpg', frame)[1].tobytes())
+    return images
+
+
+def load_images(directory, limit):
+    extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.lower().endswith(extensions))[:limit]
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    return images
+
+
+def unique_jpeg(image_bytes):
+    """Same image, different bytes: a JPEG comment segment right after the SOI marker"""
+    comment = uuid.uuid4().hex.encode()
+    if image_bytes[:2] != b'\xff\xd8':
+        return image_bytes + comment
+    return image_bytes[:2] + b'\xff\xfe' + (len(comment) + 2).to_bytes(2, 'big') + comment + image_bytes[2:]
+
+
+def multipart_body(field, filename, content):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class Results:
+    """Latency samples and outcome counts per scenario, shared by all workers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {scenario: [] for scenario in SCENARIOS}
+        self.statuses = {scenario: {} for scenario in SCENARIOS}
+        self.extra = {scenario: [] for scenario in SCENARIOS}
+
+    def record(self, scenario, seconds, status, extra=None):
+        with self._lock:
+            self.latencies[scenario].append(seconds)
+            self.statuses[scenario][status] = self.statuses[scenario].get(status, 0) + 1
+            if extra is not None:
+                self.extra[scenario].append(extra)
+
+    def summary(self, elapsed):
+        report = {}
+        for scenario in SCENARIOS:
+            samples = np.array(self.latencies[scenario]) * 1000
+            if not len(samples):
+                continue
+            statuses = self.statuses[scenario]
+            errors = sum(count for status, count in statuses.items() if status != 200)
+            report[scenario] = {
+                'requests': len(samples),
+                'errors': errors,
+                'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+                'throughput_rps': round(len(samples) / elapsed, 2),
+                'mean_ms': round(float(samples.mean()), 1),
+                'p50_ms': round(float(np.percentile(samples, 50)), 1),
+                'p90_ms': round(float(np.percentile(samples, 90)), 1),
+                'p99_ms': round(float(np.percentile(samples, 99)), 1),
+                'max_ms': round(float(samples.max()), 1),
+            }
+            if scenario == 'video_feed' and self.extra[scenario]:
+                first_frame = np.array([extra['first_frame'] for extra in self.extra[scenario]]) * 1000
+                intervals = [extra['frame_interval'] for extra in self.extra[scenario] if extra['frame_interval']]
+                report[scenario]['first_frame_p50_ms'] = round(float(np.percentile(first_frame, 50)), 1)
+                if intervals:
+                    report[scenario]['stream_fps'] = round(1 / float(np.mean(intervals)), 2)
+        return report
+
+
+class LoadGenerator:
+    def __init__(self, url, images, mix, unique=False, pipeline=None, response='data', stream_frames=30,
+                 timeout=60):
+        self.url = url.rstrip('/')
+        self.images = images
+        self.scenarios, self.weights = zip(*mix.items())
+        self.unique = unique
+        self.pipeline = pipeline
+        self.response = response
+        self.stream_frames = stream_frames
+        self.timeout = timeout
+        self.results = Results()
+
+    def _query(self, **params):
+        params = {key: value for key, value in params.items() if value}
+        return '?' + '&'.join(f"{key}={value}" for key, value in params.items()) if params else ''
+
+    def upload(self, rng):
+        image = self.images[rng.randrange(len(self.images))]
+        if self.unique:
+            image = unique_jpeg(image)
+        body, content_type = multipart_body('image', 'frame.jpg', image)
+        request = urllib.request.Request(
+            self.url + '/upload_image' + self._query(response=self.response, pipeline=self.pipeline),
+            data=body, headers={'Content-Type': content_type}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as reply:
+            reply.read()
+            return reply.status, None
+
+    def learned_faces(self, rng):
+        with urllib.request.urlopen(self.url + '/api/learned_faces', timeout=self.timeout) as reply:
+            reply.read()
+            return reply.status, None
+
+    def video_feed(self, rng):
+        started = time.perf_counter()
+        first_frame = None
+        frames = 0
+        url = self.url + '/video_feed' + self._query(pipeline=self.pipeline)
+        with urllib.request.urlopen(url, timeout=self.timeout) as reply:
+            # Count multipart boundaries; each one starts a frame
+            while frames < self.stream_frames:
+                line = reply.readline()
+                if not line:
+                    break
+                if line.startswith(b'--frame'):
+                    frames += 1
+                    if first_frame is None:
+                        first_frame = time.perf_counter() - started
+            status = reply.status if frames else 'no_frames'
+        elapsed = time.perf_counter() - started
+        interval = (elapsed - first_frame) / (frames - 1) if first_frame is not None and frames > 1 else None
+        if first_frame is None:
+            return status, None
+        return status, {'first_frame': first_frame, 'frame_interval': interval}
+
+    def worker(self, seed, deadline, remaining):
+        rng = random.Random(seed)
+        while time.time() < deadline:
+            if remaining is not None:
+                with remaining['lock']:
+                    if remaining['count'] <= 0:
+                        return
+                    remaining['count'] -= 1
+            scenario = rng.choices(self.scenarios, self.weights)[0]
+            started = time.perf_counter()
+            extra = None
+            try:
+                status, extra = getattr(self, scenario)(rng)
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except Exception as e:
+                status = type(e).__name__
+            self.results.record(scenario, time.perf_counter() - started, status, extra)
+
+    def run(self, concurrency, duration, requests=None):
+        deadline = time.time() + duration
+        remaining = {'count': requests, 'lock': threading.Lock()} if requests else None
+        threads = [threading.Thread(target=self.worker, args=(i, deadline, remaining), daemon=True)
+                   for i in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"unknown scenario {name!r} (expected one of {', '.join(SCENARIOS)})")
+        if float(weight or 1) > 0:
+            mix[name] = float(weight or 1)
+    if not mix:
+        raise ValueError('the mix has no scenario with a positive weight')
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent workers')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--requests', type=int, help='Stop after this many requests in total')
+    parser.add_argument('--mix', default='upload=8,learned_faces=1', help='Scenario weights')
+    parser.add_argument('--images', help='Directory of images to upload (default: synthetic frames)')
+    parser.add_argument('--image-count', type=int, default=50, help='Images to load or generate')
+    parser.add_argument('--unique', action='store_true', help='Make every upload distinct (bypasses the result cache)')
+    parser.add_argument('--pipeline', help='?pipeline= for uploads and streams')
+    parser.add_argument('--response', default='data', help='?response= for uploads (default: data)')
+    parser.add_argument('--stream-frames', type=int, default=30, help='Frames read per /video_feed request')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON only')
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    images = load_images(args.images, args.image_count) if args.images else synthetic_images(args.image_count)
+    if 'upload' in mix and not images:
+        parser.error(f"no images found in {args.images}")
+
+    generator = LoadGenerator(args.url, images, mix, unique=args.unique, pipeline=args.pipeline,
+                              response=args.response, stream_frames=args.stream_frames)
+    if not args.json:
+        print(f"Running {args.concurrency} workers against {args.url} for up to {args.duration:g}s "
+              f"(mix: {', '.join(f'{name}={weight:g}' for name, weight in mix.items())})", file=sys.stderr)
+    elapsed = generator.run(args.concurrency, args.duration, args.requests)
+    report = {'url': args.url, 'concurrency': args.concurrency, 'seconds': round(elapsed, 2),
+              'scenarios': generator.results.summary(elapsed)}
+
+    if not args.json:
+        print(f"{'scenario':<14} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} "
+              f"{'p99 ms':>8} {'max ms':>8}")
+        for scenario, row in report['scenarios'].items():
+            print(f"{scenario:<14} {row['requests']:>8} {row['errors']:>6} {row['throughput_rps']:>8.1f} "
+                  f"{row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+    print(json.dumps(report, indent=None if not args.json else 2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
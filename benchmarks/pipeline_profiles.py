@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Per-profile cost of the InsightFace pipeline: load time, resident memory and
+per-face inference time. Each profile runs in its own subprocess so memory
+figures are not polluted by the other profiles.
+
+Usage: python benchmarks/pipeline_profiles.py [--image photo.jpg] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure_profile(profile, image_path, repeat):
+    """Load one profile and time it (runs inside the worker subprocess)"""
+    import cv2
+    from face_pipeline import PIPELINE_PROFILES, load_face_model, run_pipeline, warm_up_model
+
+    if image_path:
+        frame = cv2.imread(image_path)
+    else:
+        from insightface.data import get_image
+        frame = get_image('t1')  # Group photo bundled with insightface
+
+    start = time.perf_counter()
+    model = load_face_model(PIPELINE_PROFILES[profile])
+    warm_up_model(model)
+    load_seconds = time.perf_counter() - start
+
+    faces = run_pipeline(model, frame, profile)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run_pipeline(model, frame, profile)
+    frame_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    return {
+        'profile': profile,
+        'modules': list(PIPELINE_PROFILES[profile]),
+        'load_seconds': round(load_seconds, 3),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'faces': len(faces),
+        'ms_per_frame': round(frame_ms, 2),
+        'ms_per_face': round(frame_ms / max(len(faces), 1), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', help='Image to analyse (default: insightface sample group photo)')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per profile')
+    parser.add_argument('--profiles', default='full,recognize,age', help='Comma separated profiles')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure_profile(args.worker, args.image, args.repeat)))
+        return 0
+
+    results = []
+    for profile in args.profiles.split(','):
+        command = [sys.executable, os.path.abspath(__file__), '--worker', profile, '--repeat', str(args.repeat)]
+        if args.image:
+            command += ['--image', args.image]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    baseline = next((r for r in results if r['profile'] == 'full'), results[0])
+    print(f"{'profile':<10} {'faces':>5} {'ms/frame':>9} {'ms/face':>8} {'speedup':>8} {'rss MB':>8} {'load s':>7}")
+    for r in results:
+        speedup = baseline['ms_per_frame'] / r['ms_per_frame'] if r['ms_per_frame'] else 0
+        print(f"{r['profile']:<10} {r['faces']:>5} {r['ms_per_frame']:>9.1f} {r['ms_per_face']:>8.1f} "
+              f"{speedup:>7.2f}x {r['max_rss_mb']:>8.0f} {r['load_seconds']:>7.1f}")
+    print(json.dumps(results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
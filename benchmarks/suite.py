@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Offline performance suite: times each stage on its own and writes the
+results as JSON so runs can be compared over time.
+
+Stages:
+  gallery      batched matching against 100 .. 100k synthetic embeddings (exact and IVF)
+  persistence  snapshot write, store open + journal replay, learning new faces
+  codec        JPEG/PNG decode and JPEG encode at common frame sizes
+  upload       end-to-end /upload_image latency through the Flask test client
+
+``--backend stub`` (default) runs the upload stage with the deterministic stub
+backend (FACE_BACKEND=stub, see face_backends.py), so only the app's own
+overhead is measured; ``--backend insightface`` loads buffalo_l. Everything
+runs in a temporary directory; no existing gallery is touched.
+
+Usage: python benchmarks/suite.py [--stages gallery,codec] [--output results.json]
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STAGES = ('gallery', 'persistence', 'codec', 'upload')
+FRAME_SIZES = ((640, 480), (1280, 720), (1920, 1080), (4032, 3024))
+
+
+def timings(function, repeat, warmup=1):
+    """Run ``function`` ``repeat`` times and summarise the wall time in milliseconds"""
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples = np.array(samples)
+    return {
+        'runs': repeat,
+        'mean_ms': round(float(samples.mean()), 3),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples, 95)), 3),
+        'min_ms': round(float(samples.min()), 3),
+    }
+
+
+def synthetic_embeddings(count, seed=0):
+    from face_gallery import EMBEDDING_DIM, normalize_embeddings
+    return normalize_embeddings(np.random.default_rng(seed).normal(size=(count, EMBEDDING_DIM)).astype(np.float32))
+
+
+def synthetic_frame(width, height, seed=0):
+    """Smooth gradient plus noise: compresses like a photo, unlike pure noise"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                      (x + y) / 2], axis=2)
+    frame = frame + rng.normal(0, 8, frame.shape)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def bench_gallery(sizes, repeat, queries=8):
+    """Match ``queries`` faces (one frame's worth) against galleries of each size"""
+    from face_gallery import FaceGallery
+    from face_index import IVFIndex
+    from gallery_service import SIMILARITY_THRESHOLD
+
+    results = []
+    for size in sizes:
+        embeddings = synthetic_embeddings(size)
+        # Half the queries are noisy copies of stored faces, half are strangers
+        rng = np.random.default_rng(1)
+        probes = np.concatenate([embeddings[rng.integers(0, size, queries // 2)]
+                                 + rng.normal(0, 0.02, (queries // 2, embeddings.shape[1])),
+                                 synthetic_embeddings(queries - queries // 2, seed=2)]).astype(np.float32)
+        row = {'size': size, 'queries': queries}
+        for name, index in (('exact', None), ('ivf', IVFIndex(min_size=0))):
+            gallery = FaceGallery(index=index, capacity=size)
+            start = time.perf_counter()
+            for person_id, embedding in enumerate(embeddings):
+                gallery.add(person_id, embedding)
+            build_ms = (time.perf_counter() - start) * 1000
+            if index is not None:
+                # The index trains on a background thread; wait so the timed runs use the
+                # final lists and do not compete with a retraining pass for the CPU
+                deadline = time.time() + 300
+                while (index.training or not index.ready(len(gallery))) and time.time() < deadline:
+                    time.sleep(0.01)
+                if not index.ready(len(gallery)):
+                    continue
+            row[name] = dict(timings(lambda: gallery.match(probes, SIMILARITY_THRESHOLD), repeat),
+                             build_ms=round(build_ms, 1))
+        results.append(row)
+    return results
+
+
+def bench_persistence(sizes, repeat, learn=200):
+    """Snapshot write, cold open plus journal replay, and journalled learning at each gallery size"""
+    from gallery_service import GalleryService
+
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            db_file = os.path.join(directory, 'learned_faces.pkl')
+            service = GalleryService(db_file)
+            now = time.time()
+            for person_id, embedding in enumerate(synthetic_embeddings(size)):
+                service.gallery.add(person_id, embedding)
+                service.learned_faces[person_id] = {'age': 30, 'name': f"Person_{person_id}",
+                                                    'count': 1, 'last_seen': now}
+            service.face_id_counter = size
+            write = timings(service.write_snapshot, repeat, warmup=0)
+
+            new_faces = synthetic_embeddings(learn, seed=3)
+            start = time.perf_counter()
+            for embedding in new_faces:
+                service.learn(embedding, 30)
+            learn_ms = (time.perf_counter() - start) * 1000 / learn
+            service.close()
+
+            def cold_load():
+                loaded = GalleryService(db_file)
+                loaded.load()
+                loaded.match(new_faces[:1])  # First lookup pages the embeddings in
+                loaded.close()
+
+            load = timings(cold_load, repeat, warmup=0)
+            store_mb = sum(os.path.getsize(os.path.join(path, name))
+                           for path, _, names in os.walk(directory) for name in names) / 1024 / 1024
+        results.append({'size': size, 'snapshot_write': write, 'load_and_first_match': load,
+                        'journal_records': learn, 'learn_ms_per_face': round(learn_ms, 3),
+                        'disk_mb': round(store_mb, 2)})
+    return results
+
+
+def bench_codec(repeat):
+    import cv2
+
+    results = []
+    for width, height in FRAME_SIZES:
+        frame = synthetic_frame(width, height)
+        jpeg = cv2.imencode('.jpg', frame)[1]
+        png = cv2.imencode('.png', frame)[1]
+        results.append({
+            'width': width,
+            'height': height,
+            'jpeg_kb': round(len(jpeg) / 1024, 1),
+            'decode_jpeg': timings(lambda: cv2.imdecode(jpeg, cv2.IMREAD_COLOR), repeat),
+            'decode_png': timings(lambda: cv2.imdecode(png, cv2.IMREAD_COLOR), repeat),
+            'encode_jpeg': timings(lambda: cv2.imencode('.jpg', frame), repeat),
+            'copy': timings(frame.copy, repeat),
+        })
+    return results
+
+
+def load_app(backend):
+    """Import app.py with the chosen backend and wait until its model is ready"""
+    os.environ['FACE_BACKEND'] = backend
+    import app
+    app.model_loader.join()
+    if not app.model_ready.is_set():
+        raise RuntimeError(f"Model failed to load: {app.model_state['error']}")
+    return app
+
+
+def bench_upload(backend, repeat, faces):
+    """POST /upload_image through the test client; misses and result-cache hits are timed separately"""
+    import cv2
+
+    app = load_app(backend)
+    client = app.app.test_client()
+    results = []
+    for width, height in FRAME_SIZES[:3]:
+        images = [cv2.imencode('.jpg', synthetic_frame(width, height, seed))[1].tobytes()
+                  for seed in range(repeat + 1)]
+        for response in ('json', 'data'):
+            pending = iter(images)
+
+            def post(image_bytes=None):
+                body = image_bytes if image_bytes is not None else next(pending)
+                reply = client.post(f'/upload_image?response={response}',
+                                    data={'image': (BytesIO(body), 'frame.jpg')})
+                if reply.status_code != 200:
+                    raise RuntimeError(f"/upload_image returned {reply.status_code}: {reply.data[:200]!r}")
+
+            app.gallery_service.reset()
+            if app.result_cache is not None:
+                app.result_cache.clear()
+            results.append({
+                'width': width,
+                'height': height,
+                'response': response,
+                'faces': faces if backend == 'stub' else None,
+                'miss': timings(post, repeat),
+                'cache_hit': timings(lambda: post(images[0]), repeat) if app.result_cache is not None else None,
+            })
+    return results
+
+
+def environment(args):
+    import cv2
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'backend': args.backend,
+        'repeat': args.repeat,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', default=','.join(STAGES), help='Comma separated stages to run')
+    parser.add_argument('--sizes', default='100,1000,10000,100000', help='Gallery sizes')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement')
+    parser.add_argument('--backend', choices=('stub', 'insightface'), default='stub')
+    parser.add_argument('--stub-faces', type=int, default=3, help='Faces the stub detects per image')
+    parser.add_argument('--stub-detect-ms', type=float, default=0.0, help='Simulated detection time per image')
+    parser.add_argument('--stub-face-ms', type=float, default=0.0, help='Simulated time per face and model')
+    parser.add_argument('--output', help='Write the JSON results here (default: stdout only)')
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.sizes.split(',')]
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    # The app and gallery write next to the working directory; keep that out of the repo
+    workdir = tempfile.mkdtemp(prefix='benchmark-')
+    os.chdir(workdir)
+    os.environ.setdefault('GALLERY_MERGE_INTERVAL', '0')
+    os.environ.update(STUB_FACES=str(args.stub_faces), STUB_DETECT_MS=str(args.stub_detect_ms),
+                      STUB_FACE_MS=str(args.stub_face_ms))
+
+    results = {'environment': environment(args), 'stages': {}}
+    # The app and gallery log with print; keep stdout for the JSON results
+    with contextlib.redirect_stdout(sys.stderr):
+        for stage in stages:
+            print(f"Running {stage}...")
+            start = time.perf_counter()
+            if stage == 'gallery':
+                results['stages'][stage] = bench_gallery(sizes, args.repeat)
+            elif stage == 'persistence':
+                results['stages'][stage] = bench_persistence(sizes, max(1, args.repeat // 4))
+            elif stage == 'codec':
+                results['stages'][stage] = bench_codec(args.repeat)
+            elif stage == 'upload':
+                results['stages'][stage] = bench_upload(args.backend, args.repeat, args.stub_faces)
+            print(f"  {stage} took {time.perf_counter() - start:.1f}s")
+
+    output = json.dumps(results, indent=2)
+    if output_path:
+        with open(output_path, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
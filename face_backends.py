@@ -0,0 +1,198 @@
+import hashlib
+import os
+import time
+
+import cv2
+import numpy as np
+from insightface.utils.face_align import arcface_dst
+
+from face_gallery import EMBEDDING_DIM
+from face_pipeline import MODEL_NAME, load_face_model, warm_up_model
+
+
+class FaceBackend:
+    """Source of the face model the app runs its pipelines on.
+
+    ``load(modules)`` returns an object shaped like InsightFace's
+    ``FaceAnalysis``: a ``det_model`` with ``detect(img, input_size, max_num,
+    metric)`` returning ``(bboxes, kpss)``, and a ``models`` dict of per-face
+    models whose ``get(img, face)`` sets ``embedding`` or ``age``/``gender``.
+    Everything in face_pipeline, face_detection and face_batching works on
+    that shape, so a backend only has to provide it.
+    """
+
+    name = None
+    model_name = None  # Part of the result cache key; differs between backends
+
+    def load(self, modules):
+        raise NotImplementedError
+
+    def warm_up(self, face_model):
+        warm_up_model(face_model)
+
+    def open_camera(self):
+        """Capture source for /video_feed, or None to open the local camera"""
+        return None
+
+
+class InsightFaceBackend(FaceBackend):
+    """buffalo_l through InsightFace and ONNX Runtime (the default)"""
+
+    name = 'insightface'
+    model_name = MODEL_NAME
+
+    def load(self, modules):
+        return load_face_model(modules)
+
+
+def content_seed(pixels):
+    """Seed derived from a small grey thumbnail, stable under re-encoding noise"""
+    grey = cv2.cvtColor(pixels, cv2.COLOR_BGR2GRAY) if pixels.ndim == 3 else pixels
+    thumbnail = cv2.resize(grey, (8, 8), interpolation=cv2.INTER_AREA) // 32
+    return int.from_bytes(hashlib.sha1(thumbnail.tobytes()).digest()[:8], 'little')
+
+
+class _StubPart:
+    def __init__(self, taskname, latency):
+        self.taskname = taskname
+        self.latency = latency
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class StubDetector(_StubPart):
+    """Places ``faces`` boxes on a grid; box size follows the image size"""
+
+    def __init__(self, faces, latency):
+        super().__init__('detection', latency)
+        self.faces = faces
+
+    def detect(self, img, input_size=None, max_num=0, metric='default'):
+        self._wait()
+        h, w = img.shape[:2]
+        count = self.faces if not max_num else min(self.faces, max_num)
+        columns = max(1, int(np.ceil(np.sqrt(count))))
+        size = min(w, h) / (columns + 1)
+        bboxes = np.zeros((count, 5), dtype=np.float32)
+        kpss = np.zeros((count, 5, 2), dtype=np.float32)
+        for i in range(count):
+            x = (i % columns + 0.5) * w / columns - size / 2
+            y = (i // columns + 0.5) * h / columns - size / 2
+            bboxes[i] = x, y, x + size, y + size, 0.9
+            kpss[i] = arcface_dst * (size / 112) + np.array([x, y], dtype=np.float32)
+        return bboxes, kpss
+
+
+class StubRecognition(_StubPart):
+    """Embedding seeded by the face crop: the same crop is always the same person"""
+
+    def __init__(self, latency):
+        super().__init__('recognition', latency)
+
+    def get(self, img, face):
+        self._wait()
+        x1, y1, x2, y2 = np.clip(face.bbox[:4], 0, [img.shape[1], img.shape[0]] * 2).astype(int)
+        crop = img[y1:max(y2, y1 + 1), x1:max(x2, x1 + 1)]
+        embedding = np.random.default_rng(content_seed(crop)).normal(size=EMBEDDING_DIM)
+        face.embedding = embedding.astype(np.float32)
+        return face.embedding
+
+
+class StubGenderAge(_StubPart):
+    def __init__(self, latency):
+        super().__init__('genderage', latency)
+
+    def get(self, img, face):
+        self._wait()
+        seed = content_seed(img) ^ int(face.bbox[0] * 31 + face.bbox[1])
+        face['gender'] = seed % 2
+        face['age'] = 18 + seed % 50
+        return face['gender'], face['age']
+
+
+class StubFaceModel:
+    """FaceAnalysis-shaped model with synthetic, content-derived results.
+
+    Detection finds ``faces`` faces per image and sleeps ``detect_latency``
+    seconds; each per-face model call sleeps ``face_latency`` seconds.
+    """
+
+    def __init__(self, modules=('detection', 'recognition', 'genderage'), faces=1, detect_latency=0.0,
+                 face_latency=0.0):
+        self.det_model = StubDetector(faces, detect_latency)
+        parts = {'detection': self.det_model, 'recognition': StubRecognition(face_latency),
+                 'genderage': StubGenderAge(face_latency)}
+        self.models = {name: part for name, part in parts.items() if name in modules}
+
+
+class SyntheticCamera:
+    """cv2.VideoCapture stand-in that serves generated 640x480 frames at ``fps``.
+
+    The picture is fixed except for a frame counter in the corner, so the
+    stub's faces keep their identities while every frame is still new.
+    """
+
+    def __init__(self, width=640, height=480, fps=30.0):
+        self.fps = fps
+        ramp = np.linspace(40, 200, width, dtype=np.float32)
+        self.background = np.dstack([np.tile(ramp, (height, 1))] * 3).astype(np.uint8)
+        self.frames = 0
+        self._next_frame_at = None
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return False
+
+    def read(self):
+        now = time.perf_counter()
+        if self._next_frame_at is not None and self._next_frame_at > now:
+            time.sleep(self._next_frame_at - now)
+        self._next_frame_at = max(now, self._next_frame_at or now) + 1.0 / self.fps
+        self.frames += 1
+        frame = self.background.copy()
+        cv2.putText(frame, str(self.frames), (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    (255, 255, 255), 1)
+        return True, frame
+
+    def release(self):
+        pass
+
+
+class StubBackend(FaceBackend):
+    """Deterministic stand-in for buffalo_l: no download, no inference cost beyond the configured latency.
+
+    Results depend only on the image content, so the same image always yields
+    the same faces and identities. For load tests and benchmarks of the app's
+    own overhead (locking, gallery, persistence, encoding).
+    """
+
+    name = 'stub'
+    model_name = 'stub'
+
+    def __init__(self, faces=1, detect_ms=0.0, face_ms=0.0):
+        self.faces = faces
+        self.detect_ms = detect_ms
+        self.face_ms = face_ms
+
+    def load(self, modules):
+        return StubFaceModel(modules, self.faces, self.detect_ms / 1000, self.face_ms / 1000)
+
+    def open_camera(self):
+        # Servers under load test usually have no camera
+        return SyntheticCamera()
+
+
+def create_backend(name=None):
+    """Backend selected by name or FACE_BACKEND; the stub is configured by STUB_* env vars"""
+    name = name or os.environ.get('FACE_BACKEND', 'insightface')
+    if name == 'insightface':
+        return InsightFaceBackend()
+    if name == 'stub':
+        return StubBackend(faces=int(os.environ.get('STUB_FACES', '1')),
+                           detect_ms=float(os.environ.get('STUB_DETECT_MS', '0')),
+                           face_ms=float(os.environ.get('STUB_FACE_MS', '0')))
+    raise ValueError(f"Unknown face backend: {name} (expected 'insightface' or 'stub')")
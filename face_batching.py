@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+from insightface.utils import face_align
+
+from process_threads import ProcessThread
+
+# Per-face models whose preprocessing is replicated here so they can run batched
+BATCHED_TASKS = ('recognition', 'genderage')
+
+
+def supports_batching(model_part):
+    """Whether a per-face model can run on a batch of crops in one session call"""
+    if getattr(model_part, 'taskname', None) not in BATCHED_TASKS or not hasattr(model_part, 'session'):
+        return False
+    batch_dim = model_part.session.get_inputs()[0].shape[0]
+    return not isinstance(batch_dim, int) or batch_dim != 1
+
+
+def align_face(model_part, frame, face):
+    """Aligned input crop for one face, exactly as the model's own get() prepares it"""
+    size = model_part.input_size[0]
+    if model_part.taskname == 'recognition':
+        return face_align.norm_crop(frame, landmark=face.kps, image_size=size)
+    bbox = face.bbox
+    center = (bbox[2] + bbox[0]) / 2, (bbox[3] + bbox[1]) / 2
+    scale = size / (max(bbox[2] - bbox[0], bbox[3] - bbox[1]) * 1.5)
+    crop, _ = face_align.transform(frame, center, size, scale, 0)
+    return crop
+
+
+def run_face_model(model_part, crops):
+    """One ONNX Runtime call over a list of aligned crops; one output row per crop"""
+    mean = model_part.input_mean
+    blob = cv2.dnn.blobFromImages(crops, 1.0 / model_part.input_std, model_part.input_size,
+                                  (mean, mean, mean), swapRB=True)
+    return model_part.session.run(model_part.output_names, {model_part.input_name: blob})[0]
+
+
+def apply_face_output(model_part, face, output):
+    """Store one output row on the face the way the model's own get() does"""
+    if model_part.taskname == 'recognition':
+        face.embedding = output.flatten()
+    else:
+        face['gender'] = np.argmax(output[:2])
+        face['age'] = int(np.round(output[2] * 100))
+
+
+class _BatchRequest:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.size = sum(len(crops) for _, crops in jobs)
+        self.queued_at = time.perf_counter()
+        self.outputs = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceBatcher:
+    """Runs per-face models for concurrent requests in shared batches.
+
+    Callers hand over aligned crops with ``run`` and block until their
+    outputs are ready. A worker thread waits up to ``max_wait`` seconds after
+    the oldest queued request (or until ``max_batch_size`` crops are queued),
+    then runs each model once over all collected crops and hands every
+    request its slice of the outputs. With more than ``max_queue`` crops
+    waiting, callers run their crops themselves instead of queueing.
+    """
+
+    def __init__(self, max_batch_size=32, max_wait=0.005, max_queue=1024):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._queued_crops = 0
+        self._worker = ProcessThread(self._run, 'inference-batcher')
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.batched_requests = 0
+        self.batched_crops = 0
+        self.overflow_runs = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self.largest_batch = 0
+
+    def run(self, jobs):
+        """Outputs for ``[(model_part, crops), ...]``, one array per job, shared with concurrent callers"""
+        request = _BatchRequest(jobs)
+        if request.size == 0:
+            return [[] for _ in jobs]
+        with self._condition:
+            overflow = self._queued_crops + request.size > self.max_queue
+        if overflow:
+            with self._stats_lock:
+                self.overflow_runs += 1
+            return [run_face_model(model_part, crops) if crops else [] for model_part, crops in jobs]
+
+        self._worker.ensure()
+        with self._condition:
+            self._pending.append(request)
+            self._queued_crops += request.size
+            self._condition.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.outputs
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                deadline = self._pending[0].queued_at + self.max_wait
+                while self._queued_crops < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch, size = [], 0
+                while self._pending and (not batch or size + self._pending[0].size <= self.max_batch_size):
+                    request = self._pending.popleft()
+                    batch.append(request)
+                    size += request.size
+                self._queued_crops -= size
+            self._execute(batch, size)
+
+    def _execute(self, batch, size):
+        started = time.perf_counter()
+        groups = {}  # id(model_part) -> (model_part, [(request, job index, crops)])
+        for request in batch:
+            request.outputs = [[] for _ in request.jobs]
+            for j, (model_part, crops) in enumerate(request.jobs):
+                if crops:
+                    groups.setdefault(id(model_part), (model_part, []))[1].append((request, j, crops))
+        try:
+            for model_part, entries in groups.values():
+                outputs = run_face_model(model_part, [crop for _, _, crops in entries for crop in crops])
+                offset = 0
+                for request, j, crops in entries:
+                    request.outputs[j] = outputs[offset:offset + len(crops)]
+                    offset += len(crops)
+        except Exception as e:
+            for request in batch:
+                request.error = e
+
+        finished = time.perf_counter()
+        with self._stats_lock:
+            self.batches += 1
+            self.batched_requests += len(batch)
+            self.batched_crops += size
+            self.largest_batch = max(self.largest_batch, size)
+            self.wait_seconds += sum(started - request.queued_at for request in batch)
+            self.run_seconds += finished - started
+        for request in batch:
+            request.done.set()
+
+    def snapshot(self):
+        with self._condition:
+            queue_depth = self._queued_crops
+            queued_requests = len(self._pending)
+        with self._stats_lock:
+            batches, requests = self.batches, self.batched_requests
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+                'max_queue': self.max_queue,
+                'queue_depth': queue_depth,
+                'queued_requests': queued_requests,
+                'batches': batches,
+                'requests': requests,
+                'crops': self.batched_crops,
+                'average_batch_size': round(self.batched_crops / batches, 2) if batches else None,
+                'largest_batch': self.largest_batch,
+                'average_wait_ms': round(self.wait_seconds * 1000 / requests, 2) if requests else None,
+                'average_run_ms': round(self.run_seconds * 1000 / batches, 2) if batches else None,
+                'overflow_runs': self.overflow_runs,
+            }
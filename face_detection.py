@@ -0,0 +1,121 @@
+import time
+
+import numpy as np
+
+from face_pipeline import DET_SIZE, detect_faces, frame_input_size, round_up
+from metrics import moving_average, to_ms
+
+
+def expand_box(box, margin, frame_shape):
+    """Integer (x1, y1, x2, y2) box grown by ``margin`` times its size on each side, clipped to the frame"""
+    h, w = frame_shape[:2]
+    x1, y1, x2, y2 = (float(v) for v in box[:4])
+    pad = margin * max(x2 - x1, y2 - y1)
+    return [max(0, int(x1 - pad)), max(0, int(y1 - pad)), min(w, int(x2 + pad)), min(h, int(y2 + pad))]
+
+
+def merge_regions(regions):
+    """Union overlapping rectangles until none overlap"""
+    regions = [list(region) for region in regions]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+class AdaptiveDetector:
+    """Face detection that only looks where it has to, at the resolution it needs.
+
+    With ``hints`` (boxes where faces are expected, e.g. tracker
+    predictions), it detects inside crops around them, each downscaled so the
+    expected face is about ``roi_face_px`` pixels. A full-frame scan still runs
+    every ``full_scan_interval`` calls, when there are no hints, or when the
+    crops would cover most of the frame, so faces that enter the scene are
+    found. Full scans run at ``base_size``, so small new faces are not missed,
+    unless the average full scan takes longer than ``load_budget`` seconds.
+    Keep one instance per video stream.
+    """
+
+    def __init__(self, base_size=DET_SIZE, min_size=320, roi_face_px=80,
+                 roi_margin=0.75, full_scan_interval=5, load_budget=None, smoothing=0.2):
+        self.base_size = base_size
+        self.min_size = min_size
+        self.roi_face_px = roi_face_px
+        self.roi_margin = roi_margin
+        self.full_scan_interval = full_scan_interval
+        self.load_budget = load_budget
+        self.smoothing = smoothing
+        self.calls = 0
+        self.full_scans = 0
+        self.roi_scans = 0
+        self.full_scan_time = None
+        self.roi_scan_time = None
+        self.last_input_sizes = []
+
+    @property
+    def high_load(self):
+        return self.load_budget is not None and (self.full_scan_time or 0.0) > self.load_budget
+
+    def full_scan_size(self):
+        """Long side of the detector input for a full-frame scan"""
+        if self.high_load:
+            return max(self.min_size, round_up(self.base_size * 3 // 4))
+        return self.base_size
+
+    def detect(self, face_model, frame, hints=None):
+        """Faces in ``frame`` with bbox and kps in frame coordinates"""
+        self.calls += 1
+        hints = [np.asarray(box, dtype=np.float32) for box in (hints or [])]
+        started = time.perf_counter()
+
+        regions = merge_regions([expand_box(box, self.roi_margin, frame.shape) for box in hints])
+        area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+        full_scan = (not hints or self.calls % self.full_scan_interval == 1 or self.full_scan_interval <= 1
+                     or area > 0.5 * frame.shape[0] * frame.shape[1])
+
+        if full_scan:
+            input_size = frame_input_size(frame.shape, self.full_scan_size())
+            faces = detect_faces(face_model, frame, input_size=input_size)
+            self.last_input_sizes = [input_size]
+            self.full_scans += 1
+            self.full_scan_time = moving_average(self.full_scan_time, time.perf_counter() - started, self.smoothing)
+            return faces
+
+        faces = []
+        self.last_input_sizes = []
+        for x1, y1, x2, y2 in regions:
+            expected = [min(b[2] - b[0], b[3] - b[1]) for b in hints
+                        if x1 <= b[0] and y1 <= b[1] and b[2] <= x2 and b[3] <= y2]
+            crop = frame[y1:y2, x1:x2]
+            scale = min(1.0, self.roi_face_px / max(min(expected, default=self.roi_face_px), 1.0))
+            input_size = frame_input_size(crop.shape, max(64, round_up(max(crop.shape[:2]) * scale)))
+            self.last_input_sizes.append(input_size)
+            offset = np.array([x1, y1], dtype=np.float32)
+            for face in detect_faces(face_model, crop, input_size=input_size):
+                face.bbox = face.bbox + np.concatenate([offset, offset])
+                if face.kps is not None:
+                    face.kps = face.kps + offset
+                faces.append(face)
+        self.roi_scans += 1
+        self.roi_scan_time = moving_average(self.roi_scan_time, time.perf_counter() - started, self.smoothing)
+        return faces
+
+    def snapshot(self):
+        return {
+            'full_scans': self.full_scans,
+            'roi_scans': self.roi_scans,
+            'full_scan_ms': to_ms(self.full_scan_time),
+            'roi_scan_ms': to_ms(self.roi_scan_time),
+            'high_load': self.high_load,
+            'last_input_sizes': [list(size) for size in self.last_input_sizes],
+        }
@@ -0,0 +1,172 @@
+import threading
+
+import numpy as np
+
+EMBEDDING_DIM = 512  # ArcFace (buffalo_l w600k_r50) embedding size
+
+
+def normalize_embeddings(embeddings):
+    """L2-normalise a single embedding or a stack of embeddings as float32"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class FaceGallery:
+    """All learned embeddings in one contiguous, L2-normalised matrix.
+
+    Row ``i`` of the matrix belongs to ``ids[i]``. Because every row has unit
+    length, cosine similarity against the whole gallery is a single matrix
+    product, and the best match for every face in a frame is an argmax.
+
+    An optional ANN ``index`` (see ``face_index.IVFIndex``) narrows each query
+    to a subset of rows once the gallery is large; small galleries are always
+    scanned exactly.
+
+    ``ids``/``embeddings``/``size`` adopt existing arrays (for example
+    memory-mapped ones from ``face_store.FaceStore``) instead of allocating.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, capacity=64, index=None, ids=None, embeddings=None, size=0):
+        self.dim = dim
+        if embeddings is not None:
+            self._embeddings, self._ids, self._size = embeddings, ids, size
+            self._row_map = None  # Built on first use so adopting a mapped store stays O(1)
+        else:
+            self._embeddings = np.zeros((capacity, dim), dtype=np.float32)
+            self._ids = np.full(capacity, -1, dtype=np.int64)
+            self._size = 0
+            self._row_map = {}
+        self.lock = threading.RLock()
+        self.index = index
+        if index is not None:
+            index.attach(self)
+            index.adopt(self._size)
+
+    @property
+    def _rows(self):
+        """person_id -> row index"""
+        if self._row_map is None:
+            self._row_map = dict(zip(self._ids[:self._size].tolist(), range(self._size)))
+        return self._row_map
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, person_id):
+        return person_id in self._rows
+
+    @property
+    def ids(self):
+        """Person ids in row order (a view, do not modify)"""
+        return self._ids[:self._size]
+
+    @property
+    def embeddings(self):
+        """Normalised embedding matrix in row order (a view, do not modify)"""
+        return self._embeddings[:self._size]
+
+    def _grow(self):
+        capacity = max(64, 2 * len(self._ids))
+        embeddings = np.zeros((capacity, self.dim), dtype=np.float32)
+        embeddings[:self._size] = self._embeddings[:self._size]
+        ids = np.full(capacity, -1, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._embeddings, self._ids = embeddings, ids
+
+    def add(self, person_id, embedding):
+        """Append a new person, or overwrite the row of an existing one"""
+        with self.lock:
+            row = self._rows.get(person_id)
+            if row is None:
+                if self._size == len(self._ids):
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._rows[person_id] = row
+                self._ids[row] = person_id
+            self._embeddings[row] = normalize_embeddings(embedding)
+            if self.index is not None:
+                self.index.add(row, self._embeddings[row], self._size)
+            return row
+
+    def update(self, person_id, embedding, alpha=0.1):
+        """Move a stored embedding towards a new observation (running average)"""
+        with self.lock:
+            row = self._rows[person_id]
+            vector = self._embeddings[row]
+            vector *= 1 - alpha
+            vector += alpha * normalize_embeddings(embedding)
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+            if self.index is not None:
+                self.index.update(row, vector)
+            return row
+
+    def remove(self, person_id):
+        """Drop a person, moving the last row into the freed slot"""
+        with self.lock:
+            row = self._rows.pop(person_id)
+            last = self._size - 1
+            if self.index is not None:
+                self.index.remove(row)
+            if row != last:
+                moved_id = int(self._ids[last])
+                self._embeddings[row] = self._embeddings[last]
+                self._ids[row] = moved_id
+                self._rows[moved_id] = row
+                if self.index is not None:
+                    self.index.move(last, row)
+            self._ids[last] = -1
+            self._size = last
+
+    def clear(self):
+        with self.lock:
+            self._row_map = {}
+            self._ids[:] = -1
+            self._size = 0
+            if self.index is not None:
+                self.index.clear()
+
+    def get(self, person_id):
+        """Return a copy of a person's normalised embedding"""
+        with self.lock:
+            return self._embeddings[self._rows[person_id]].copy()
+
+    def search(self, queries):
+        """Best gallery row for every query: one matrix product plus an argmax.
+
+        Returns ``(person_ids, similarities)`` arrays with one entry per query
+        row. Callers must check ``len(gallery)`` first; an empty gallery has
+        nothing to return. With a trained index a query whose probed buckets
+        are empty gets id ``-1`` and similarity ``-1``.
+        """
+        queries = normalize_embeddings(np.atleast_2d(queries))
+        with self.lock:
+            if self.index is not None and self.index.ready(self._size):
+                return self.index.search(queries, self._ids)
+            similarities = queries @ self._embeddings[:self._size].T
+            best_rows = np.argmax(similarities, axis=1)
+            best_ids = self._ids[best_rows]
+        best_similarities = similarities[np.arange(len(queries)), best_rows]
+        return best_ids, best_similarities
+
+    def match(self, queries, threshold):
+        """Match every query against the gallery.
+
+        Returns a list of ``(person_id, similarity)`` tuples; ``person_id`` is
+        ``None`` when the best similarity does not exceed ``threshold``.
+        """
+        queries = np.atleast_2d(queries)
+        if len(queries) == 0:
+            return []
+        with self.lock:
+            if self._size == 0:
+                return [(None, 0) for _ in range(len(queries))]
+            best_ids, best_similarities = self.search(queries)
+        matches = []
+        for person_id, similarity in zip(best_ids, best_similarities):
+            if similarity > threshold:
+                matches.append((int(person_id), float(similarity)))
+            else:
+                matches.append((None, 0))
+        return matches
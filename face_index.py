@@ -0,0 +1,263 @@
+import threading
+
+import numpy as np
+
+from face_gallery import normalize_embeddings
+
+
+def spherical_kmeans(vectors, k, iterations=10, seed=0):
+    """k-means on unit vectors using cosine similarity; returns unit centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        present = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[present])[:-1]))
+        sums[present] = np.add.reduceat(vectors[order], starts, axis=0)
+        # Re-seed empty clusters from random vectors so every list stays useful
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty))]
+        centroids = normalize_embeddings(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file ANN index over the rows of a FaceGallery.
+
+    Rows are bucketed by their nearest k-means centroid. Each bucket (inverted
+    list) keeps its row numbers and a contiguous copy of their embeddings, so
+    a query scores only the rows in its ``nprobe`` closest lists without
+    gathering them from the gallery matrix; the copies double the memory the
+    embeddings take. ``nprobe`` is the recall/latency knob: higher finds more
+    true matches, lower is faster. Until the gallery reaches ``min_size`` rows
+    (and while the first training pass runs) ``ready()`` is False and the
+    gallery falls back to an exact scan.
+
+    All methods except the background trainer are called by the gallery with
+    ``gallery.lock`` held.
+    """
+
+    def __init__(self, nprobe=8, min_size=5000, train_sample=20000, train_iterations=10):
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.train_sample = train_sample
+        self.train_iterations = train_iterations
+        self.centroids = None
+        self._list_rows = []      # list -> gallery rows (with spare capacity)
+        self._list_vectors = []   # list -> embeddings of those rows, same order
+        self._list_sizes = np.zeros(0, dtype=np.int64)
+        self._assignments = np.full(0, -1, dtype=np.int32)  # row -> list, -1 when not filed
+        self._positions = np.zeros(0, dtype=np.int32)       # row -> slot in its list
+        self._trained_size = 0
+        self._training = False
+        self._dirty = set()  # Rows changed while a training pass is running
+        self._generation = 0
+        self._gallery = None
+
+    def attach(self, gallery):
+        self._gallery = gallery
+
+    def ready(self, size):
+        return self.centroids is not None and size >= self.min_size
+
+    @property
+    def training(self):
+        return self._training
+
+    def _ensure_capacity(self, row):
+        if row >= len(self._assignments):
+            extra = max(64, 2 * (row + 1)) - len(self._assignments)
+            self._assignments = np.concatenate([self._assignments, np.full(extra, -1, dtype=np.int32)])
+            self._positions = np.concatenate([self._positions, np.zeros(extra, dtype=np.int32)])
+
+    def _file(self, row, list_id, vector):
+        """Append a row to an inverted list, growing the list if it is full"""
+        size = int(self._list_sizes[list_id])
+        if size == len(self._list_rows[list_id]):
+            capacity = max(16, 2 * size)
+            rows = np.empty(capacity, dtype=np.int32)
+            rows[:size] = self._list_rows[list_id][:size]
+            vectors = np.empty((capacity, len(vector)), dtype=np.float32)
+            vectors[:size] = self._list_vectors[list_id][:size]
+            self._list_rows[list_id], self._list_vectors[list_id] = rows, vectors
+        self._list_rows[list_id][size] = row
+        self._list_vectors[list_id][size] = vector
+        self._list_sizes[list_id] = size + 1
+        self._assignments[row] = list_id
+        self._positions[row] = size
+
+    def _unfile(self, row):
+        """Take a row out of its list, moving the list's last entry into its slot"""
+        if row >= len(self._assignments) or self._assignments[row] < 0:
+            return
+        list_id = self._assignments[row]
+        position = self._positions[row]
+        last = int(self._list_sizes[list_id]) - 1
+        if position != last:
+            moved_row = self._list_rows[list_id][last]
+            self._list_rows[list_id][position] = moved_row
+            self._list_vectors[list_id][position] = self._list_vectors[list_id][last]
+            self._positions[moved_row] = position
+        self._list_sizes[list_id] = last
+        self._assignments[row] = -1
+
+    def _assign(self, row, vector):
+        self._ensure_capacity(row)
+        if self.centroids is not None:
+            list_id = int(np.argmax(self.centroids @ vector))
+            if list_id == self._assignments[row]:
+                self._list_vectors[list_id][self._positions[row]] = vector
+            else:
+                self._unfile(row)
+                self._file(row, list_id, vector)
+        if self._training:
+            self._dirty.add(row)
+
+    def add(self, row, vector, size):
+        """Incremental insert: file a new row under its nearest centroid"""
+        self._assign(row, vector)
+        self._maybe_train(size)
+
+    def adopt(self, size):
+        """Take over ``size`` existing gallery rows; the next training pass files them"""
+        if size:
+            self._ensure_capacity(size - 1)
+            self._maybe_train(size)
+
+    def update(self, row, vector):
+        """Re-file a row whose embedding moved after a running-average update"""
+        self._assign(row, vector)
+
+    def remove(self, row):
+        """Forget a row the gallery removed"""
+        self._unfile(row)
+
+    def move(self, src_row, dst_row):
+        """The gallery moved its last row into a freed slot; relabel it in place"""
+        self._ensure_capacity(dst_row)
+        self._unfile(dst_row)
+        list_id = self._assignments[src_row]
+        if list_id >= 0:
+            position = self._positions[src_row]
+            self._list_rows[list_id][position] = dst_row
+            self._assignments[dst_row] = list_id
+            self._positions[dst_row] = position
+            self._assignments[src_row] = -1
+        if self._training:
+            self._dirty.add(dst_row)
+
+    def clear(self):
+        self.centroids = None
+        self._list_rows, self._list_vectors = [], []
+        self._list_sizes = np.zeros(0, dtype=np.int64)
+        self._assignments[:] = -1
+        self._trained_size = 0
+        self._dirty.clear()
+        self._generation += 1
+
+    def search(self, queries, ids):
+        """Best row in each unit query's ``nprobe`` closest lists.
+
+        Every probed list is scored once, in one matrix product against all
+        the queries that probe it. Returns ``(person_ids, similarities)``
+        like ``FaceGallery.search``; a query whose lists are all empty gets
+        id ``-1`` and similarity ``-1``.
+        """
+        count = len(queries)
+        best_rows = np.full(count, -1, dtype=np.int64)
+        best_similarities = np.full(count, -1.0, dtype=np.float32)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        for list_id in np.unique(probes):
+            size = self._list_sizes[list_id]
+            if not size:
+                continue
+            members = np.flatnonzero((probes == list_id).any(axis=1))
+            similarities = queries[members] @ self._list_vectors[list_id][:size].T
+            best = np.argmax(similarities, axis=1)
+            scores = similarities[np.arange(len(members)), best]
+            better = scores > best_similarities[members]
+            best_similarities[members[better]] = scores[better]
+            best_rows[members[better]] = self._list_rows[list_id][best[better]]
+        best_ids = np.full(count, -1, dtype=np.int64)
+        found = best_rows >= 0
+        best_ids[found] = ids[best_rows[found]]
+        return best_ids, best_similarities
+
+    def _maybe_train(self, size):
+        # Train once the gallery is large enough, and retrain every time it
+        # doubles so bucket sizes stay balanced as faces keep being learned
+        if self._training or size < self.min_size or size < 2 * self._trained_size:
+            return
+        self._training = True
+        self._dirty.clear()
+        threading.Thread(target=self._train, args=(self._generation,), daemon=True).start()
+
+    def _train(self, generation):
+        gallery = self._gallery
+        chunk = 4096
+        try:
+            with gallery.lock:
+                size = len(gallery)
+                rng = np.random.default_rng(size)
+                sample_rows = rng.choice(size, min(size, self.train_sample), replace=False)
+                sample = gallery.embeddings[np.sort(sample_rows)].copy()
+            nlist = int(np.clip(np.sqrt(size), 16, 4096))
+            centroids = spherical_kmeans(sample, min(nlist, len(sample)), self.train_iterations)
+            nlist = len(centroids)
+
+            # Both passes copy the rows in chunks so the gallery lock is only held
+            # briefly; rows that change meanwhile are in _dirty and re-filed below
+            assignments = np.zeros(size, dtype=np.int32)
+            for start in range(0, size, chunk):
+                with gallery.lock:
+                    block = gallery.embeddings[start:min(start + chunk, size)].copy()
+                assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+            counts = np.bincount(assignments, minlength=nlist)
+            list_rows = [np.empty(max(16, int(n * 1.25)), dtype=np.int32) for n in counts]
+            list_vectors = [np.empty((len(rows), centroids.shape[1]), dtype=np.float32) for rows in list_rows]
+            list_sizes = np.zeros(nlist, dtype=np.int64)
+            positions = np.zeros(size, dtype=np.int32)
+            for start in range(0, size, chunk):
+                with gallery.lock:
+                    block = gallery.embeddings[start:min(start + chunk, size)].copy()
+                labels = assignments[start:start + len(block)]
+                order = np.argsort(labels, kind='stable')
+                present, first = np.unique(labels[order], return_index=True)
+                for list_id, rows in zip(present, np.split(order, first[1:])):
+                    begin = list_sizes[list_id]
+                    end = begin + len(rows)
+                    list_rows[list_id][begin:end] = start + rows
+                    list_vectors[list_id][begin:end] = block[rows]
+                    positions[start + rows] = np.arange(begin, end)
+                    list_sizes[list_id] = end
+
+            with gallery.lock:
+                if generation != self._generation:
+                    return
+                current_size = len(gallery)
+                self.centroids = centroids
+                self._list_rows, self._list_vectors, self._list_sizes = list_rows, list_vectors, list_sizes
+                self._ensure_capacity(max(size, current_size) - 1)
+                self._assignments[:] = -1
+                self._assignments[:size] = assignments
+                self._positions[:size] = positions
+                self._trained_size = current_size
+                # Rows removed during training are gone; rows added, moved or
+                # updated during training were filed from stale embeddings
+                for row in range(current_size, size):
+                    self._unfile(row)
+                for row in sorted(self._dirty | set(range(size, current_size))):
+                    if row < current_size:
+                        self._assign(row, gallery.embeddings[row])
+                self._dirty.clear()
+                print(f"Face index trained: {nlist} lists over {current_size} faces")
+        except Exception as e:
+            print(f"Error training face index: {e}")
+        finally:
+            self._training = False
@@ -0,0 +1,127 @@
+import os
+import pickle
+import queue
+import time
+
+from process_threads import ProcessThread
+
+_COMPACT = object()  # Queue marker asking the writer to compact now
+_STOP = object()
+
+
+class GalleryJournal:
+    """Append-only journal of gallery changes with background snapshot compaction.
+
+    Records are small tuples such as ``('learn', person_id, entry)``. They
+    carry absolute values (not deltas), so replaying a record that is
+    already reflected in the snapshot is harmless. ``append`` only enqueues;
+    a writer thread appends the records to ``path`` and, every
+    ``compact_every`` records or ``compact_interval`` seconds, folds the
+    journal into a snapshot by calling ``write_snapshot()``.
+
+    Compaction first moves the journal aside to ``path + '.old'`` and opens
+    a fresh one, then writes the snapshot, then deletes the old journal.
+    Startup replays the snapshot, then ``.old`` (left over if we crashed
+    mid-compaction), then the live journal.
+    """
+
+    def __init__(self, path, write_snapshot, compact_every=1000, compact_interval=300):
+        self.path = path
+        self.old_path = path + '.old'
+        self.write_snapshot = write_snapshot
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self._queue = queue.Queue()
+        self._writer = ProcessThread(self._run, 'gallery-journal')
+        self._pending = 0  # Records written since the last snapshot
+        self._last_compaction = time.time()
+
+    def read_records(self):
+        """Yield journal records in order, ignoring a truncated trailing record"""
+        for path in (self.old_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                while True:
+                    try:
+                        yield pickle.load(f)
+                    except EOFError:
+                        break
+                    except (pickle.UnpicklingError, ValueError, AttributeError) as e:
+                        print(f"Stopping journal replay at a damaged record in {path}: {e}")
+                        break
+
+    def append(self, record):
+        """Queue a record for the writer thread; never blocks on disk"""
+        self._writer.ensure()
+        self._queue.put(record)
+
+    def request_compaction(self):
+        self._writer.ensure()
+        self._queue.put(_COMPACT)
+
+    def close(self):
+        """Flush queued records and stop the writer thread"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout=30)
+
+    def _run(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        journal_file = open(self.path, 'ab')
+        try:
+            while True:
+                timeout = max(0.0, self._last_compaction + self.compact_interval - time.time())
+                try:
+                    item = self._queue.get(timeout=timeout if self._pending else None)
+                except queue.Empty:
+                    item = _COMPACT
+
+                # Drain whatever else is queued so one flush covers a burst of records
+                items = [item]
+                while True:
+                    try:
+                        items.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                compact = stop = False
+                for item in items:
+                    if item is _COMPACT:
+                        compact = True
+                    elif item is _STOP:
+                        stop = True
+                    else:
+                        pickle.dump(item, journal_file, protocol=pickle.HIGHEST_PROTOCOL)
+                        self._pending += 1
+                journal_file.flush()
+
+                if compact or self._pending >= self.compact_every:
+                    journal_file = self._compact(journal_file)
+                if stop:
+                    break
+        except Exception as e:
+            print(f"Gallery journal writer stopped: {e}")
+        finally:
+            journal_file.close()
+
+    def _compact(self, journal_file):
+        journal_file.close()
+        if os.path.exists(self.old_path):
+            # A previous compaction failed; keep its records ahead of ours
+            with open(self.old_path, 'ab') as old_file, open(self.path, 'rb') as current:
+                old_file.write(current.read())
+            os.remove(self.path)
+        elif os.path.exists(self.path):
+            os.replace(self.path, self.old_path)
+        journal_file = open(self.path, 'ab')
+
+        try:
+            self.write_snapshot()
+            if os.path.exists(self.old_path):
+                os.remove(self.old_path)
+            self._pending = 0
+        except Exception as e:
+            print(f"Error compacting gallery journal: {e}")
+        self._last_compaction = time.time()
+        return journal_file
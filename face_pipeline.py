@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils.face_align import arcface_dst
+
+from face_batching import align_face, apply_face_output, run_face_model, supports_batching
+from session_config import configure_sessions, describe_settings
+
+MODEL_NAME = 'buffalo_l'
+DET_SIZE = 640  # Longest side of the detector input
+
+# InsightFace modules each pipeline profile runs per frame. The app only uses
+# bbox, age and embedding, so the two landmark models are never needed except
+# by the 'full' profile (kept for comparison benchmarks).
+PIPELINE_PROFILES = {
+    'age': ('detection', 'genderage'),
+    'recognize': ('detection', 'recognition', 'genderage'),
+    'full': ('detection', 'landmark_3d_68', 'landmark_2d_106', 'recognition', 'genderage'),
+}
+DEFAULT_PIPELINE = os.environ.get('DEFAULT_PIPELINE', 'recognize')
+
+
+def enabled_profiles():
+    """Profiles this process serves (PIPELINE_PROFILES env, comma separated)"""
+    names = os.environ.get('PIPELINE_PROFILES', 'age,recognize').split(',')
+    return [name.strip() for name in names if name.strip() in PIPELINE_PROFILES]
+
+
+def profile_modules(profiles):
+    """Union of InsightFace modules needed by the given profiles"""
+    modules = []
+    for profile in profiles:
+        for module in PIPELINE_PROFILES[profile]:
+            if module not in modules:
+                modules.append(module)
+    return modules
+
+
+def load_face_model(modules, ctx_id=-1, det_size=(DET_SIZE, DET_SIZE)):
+    """Load and prepare only the given InsightFace modules, with sessions tuned by session_config"""
+    model = FaceAnalysis(name=MODEL_NAME, allowed_modules=list(modules))
+    print(describe_settings(configure_sessions(model)))
+    model.prepare(ctx_id=ctx_id, det_size=det_size)  # ctx_id=-1: CPU for deployment compatibility
+    return model
+
+
+def warm_up_model(face_model):
+    """Run one dummy inference through every model so ONNX Runtime is primed before serving"""
+    dummy = np.zeros((480, 640, 3), dtype=np.uint8)
+    face_model.det_model.detect(dummy, input_size=frame_input_size(dummy.shape), max_num=0, metric='default')
+    # A black frame has no faces, so feed the per-face models a synthetic one
+    face = Face(bbox=np.array([200, 120, 440, 360], dtype=np.float32),
+                kps=arcface_dst * 2 + np.array([208, 128], dtype=np.float32), det_score=1.0)
+    for taskname, face_model_part in face_model.models.items():
+        if taskname != 'detection':
+            face_model_part.get(dummy, face)
+
+
+def supports_profile(face_model, profile):
+    return all(module in face_model.models for module in PIPELINE_PROFILES[profile])
+
+
+def round_up(value, multiple=32):
+    return int(-(-value // multiple) * multiple)
+
+
+def frame_input_size(frame_shape, max_size=DET_SIZE):
+    """Detector input (width, height) with the frame's aspect ratio and a long side of max_size.
+
+    The detector letterboxes into its input, so a square 640x640 input spends
+    a quarter of its work on padding for a 4:3 frame. Small images are still
+    upscaled to max_size, as with the square input, so their small faces are
+    found. Sides are multiples of the largest stride (32).
+    """
+    h, w = frame_shape[:2]
+    scale = max_size / max(h, w)
+    return max(32, round_up(w * scale)), max(32, round_up(h * scale))
+
+
+def detect_faces(face_model, frame, max_num=0, input_size=None):
+    """Run only the detector; the returned faces have bbox, kps and det_score"""
+    if input_size is None:
+        input_size = frame_input_size(frame.shape)
+    bboxes, kpss = face_model.det_model.detect(frame, input_size=input_size, max_num=max_num, metric='default')
+    return [Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+            for i in range(bboxes.shape[0])]
+
+
+def analyze_faces(face_model, frame, faces, profile=DEFAULT_PIPELINE, batcher=None):
+    """Run the per-face models of one profile on already detected faces.
+
+    Recognition and genderage run once over all faces of the frame; with an
+    InferenceBatcher their crops also share batches with concurrent requests.
+    """
+    analyze_frames(face_model, [frame], [faces], profile, batcher)
+    return faces
+
+
+def analyze_frames(face_model, frames, detections, profile=DEFAULT_PIPELINE, batcher=None, max_batch=0):
+    """Like analyze_faces for the detected faces of several frames at once.
+
+    The crops of every frame go through each batched model together, in
+    calls of at most ``max_batch`` crops (0 = a single call) or through the
+    batcher, so a set of images is embedded in a few large calls rather than
+    image by image. Returns ``detections`` with the faces filled in.
+    """
+    pairs = [(frame, face) for frame, faces in zip(frames, detections) for face in faces]
+    if not pairs:
+        return detections
+    tasks = [module for module in PIPELINE_PROFILES[profile] if module != 'detection']
+    batched = [task for task in tasks if supports_batching(face_model.models[task])]
+    jobs = [(face_model.models[task], [align_face(face_model.models[task], frame, face) for frame, face in pairs])
+            for task in batched]
+    if batcher is not None:
+        outputs = batcher.run(jobs)
+    else:
+        step = max_batch or len(pairs)
+        outputs = [np.concatenate([run_face_model(model_part, crops[i:i + step]) for i in range(0, len(crops), step)])
+                   for model_part, crops in jobs]
+    for (model_part, _), task_outputs in zip(jobs, outputs):
+        for (_, face), output in zip(pairs, task_outputs):
+            apply_face_output(model_part, face, output)
+
+    for task in tasks:
+        if task not in batched:
+            for frame, face in pairs:
+                face_model.models[task].get(frame, face)
+    return detections
+
+
+def run_pipeline(face_model, frame, profile=DEFAULT_PIPELINE, max_num=0, batcher=None):
+    """Like FaceAnalysis.get, but only runs the per-face models of one profile"""
+    return analyze_faces(face_model, frame, detect_faces(face_model, frame, max_num), profile, batcher)
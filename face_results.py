@@ -0,0 +1,79 @@
+import cv2
+
+
+def age_identities(faces):
+    """Identities for faces without an embedding: age only, no gallery lookup"""
+    return [{
+        'person_id': None,
+        'name': None,
+        'age': int(face.age),
+        'status': 'DETECTED',
+        'similarity': 0.0
+    } for face in faces]
+
+
+def clamp_box(box, frame_shape):
+    """Ensure box coordinates are within frame bounds"""
+    h, w = frame_shape[:2]
+    box[0] = max(0, min(box[0], w - 1))
+    box[1] = max(0, min(box[1], h - 1))
+    box[2] = max(0, min(box[2], w - 1))
+    box[3] = max(0, min(box[3], h - 1))
+    return box
+
+
+def build_face_results(faces, identities, frame_shape):
+    """Combine detections and identities into the JSON results returned to clients"""
+    results = []
+    for face, identity in zip(faces, identities):
+        box = clamp_box(face.bbox.astype(int), frame_shape)
+        results.append({
+            'person_id': identity['person_id'],
+            'name': identity['name'],
+            'age': identity['age'],
+            'bbox': box.tolist(),
+            'status': identity['status'],
+            'similarity': identity['similarity']
+        })
+    return results
+
+
+def draw_face_results(frame, results):
+    """Draw boxes and labels for face results onto the frame"""
+    if len(results) == 0:
+        # Draw "No faces detected" message
+        cv2.putText(frame, "No faces detected", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+
+    h = frame.shape[0]
+    for result in results:
+        box = result['bbox']
+        label = f"{result['name']}: Age {result['age']}"
+        if result['status'] == 'DETECTED':
+            color = (255, 200, 0)  # Blue for age-only detections
+            label = f"Age {result['age']}"
+            confidence_label = ""
+        elif result['status'] == 'UNKNOWN':
+            color = (0, 0, 255)  # Red for faces not in the gallery (match-only batches)
+            label = f"Unknown: Age {result['age']}"
+            confidence_label = ""
+        elif result['status'] == 'RECOGNIZED':
+            color = (0, 255, 0)  # Green for recognized
+            confidence_label = f"Confidence: {result['similarity']:.2f}"
+        else:
+            color = (0, 165, 255)  # Orange for learning
+            confidence_label = "LEARNING NEW FACE"
+
+        # Draw rectangle and labels
+        cv2.rectangle(frame, (box[0], box[1]), (box[2], box[3]), color, 2)
+
+        # Main age label
+        cv2.putText(frame, label, (box[0], max(box[1] - 10, 20)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        # Status/confidence indicator
+        if confidence_label:
+            cv2.putText(frame, confidence_label, (box[0], min(box[3] + 20, h - 10)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
+
+    return frame
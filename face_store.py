@@ -0,0 +1,234 @@
+import json
+import os
+from collections.abc import MutableMapping
+
+import numpy as np
+
+from face_gallery import EMBEDDING_DIM
+
+# Per-person side table; names live in a separate UTF-8 blob addressed by offset/length
+META_DTYPE = np.dtype([
+    ('age', '<i4'),
+    ('count', '<i8'),
+    ('last_seen', '<f8'),
+    ('name_offset', '<i8'),
+    ('name_length', '<i4'),
+])
+
+
+class FaceStore:
+    """On-disk gallery snapshot that opens in constant time through np.memmap.
+
+    A snapshot generation ``g`` in ``directory`` consists of:
+
+    - ``ids-g.i64``: person ids, sorted, ``capacity`` slots
+    - ``embeddings-g.f32``: normalised embeddings, fixed stride of ``dim``
+      float32 values per row, ``capacity`` rows
+    - ``meta-g.npy``: ``META_DTYPE`` side table, one row per stored person
+    - ``names-g.bin``: UTF-8 names referenced by the side table
+    - ``manifest.json``: the current generation, row count, capacity and next id
+
+    Rows past ``count`` are spare zero-filled capacity, so faces learned after
+    startup can be written into the copy-on-write mapping without reallocating.
+    A new generation only becomes visible when ``manifest.json`` is replaced.
+    """
+
+    def __init__(self, directory, dim=EMBEDDING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def _path(self, kind, generation):
+        extension = {'ids': 'i64', 'embeddings': 'f32', 'meta': 'npy', 'names': 'bin'}[kind]
+        return os.path.join(self.directory, f"{kind}-{generation}.{extension}")
+
+    def open(self):
+        """Map the current generation; only pages that are touched get read"""
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        generation, count, capacity = manifest['generation'], manifest['count'], manifest['capacity']
+
+        # Copy-on-write: the app may modify these in memory, the files stay untouched
+        ids = np.memmap(self._path('ids', generation), dtype='<i8', mode='c', shape=(capacity,))
+        embeddings = np.memmap(self._path('embeddings', generation), dtype='<f4', mode='c',
+                               shape=(capacity, manifest['dim']))
+        # Separate read-only view of the sorted ids for id -> side-table lookups
+        if count:
+            base_ids = np.memmap(self._path('ids', generation), dtype='<i8', mode='r', shape=(count,))
+        else:
+            base_ids = np.zeros(0, dtype=np.int64)
+        meta = np.load(self._path('meta', generation), mmap_mode='r') if count else np.zeros(0, META_DTYPE)
+        names_path = self._path('names', generation)
+        if os.path.getsize(names_path):
+            names = np.memmap(names_path, dtype=np.uint8, mode='r')
+        else:
+            names = np.zeros(0, dtype=np.uint8)
+        return {
+            'ids': ids,
+            'embeddings': embeddings,
+            'count': count,
+            'base_ids': base_ids,
+            'meta': meta,
+            'names': names,
+            'next_id': manifest['next_id'],
+        }
+
+    def write(self, ids, embeddings, ages, counts, last_seen, names, next_id):
+        """Write a new generation sorted by id and switch the manifest to it"""
+        os.makedirs(self.directory, exist_ok=True)
+        previous = None
+        if self.exists():
+            with open(self.manifest_path) as f:
+                previous = json.load(f)['generation']
+        generation = 0 if previous is None else previous + 1
+
+        order = np.argsort(ids, kind='stable')
+        count = len(ids)
+        capacity = count + max(1024, count // 2)
+
+        sorted_ids = np.zeros(capacity, dtype='<i8')
+        sorted_ids[:count] = np.asarray(ids, dtype='<i8')[order]
+        sorted_ids.tofile(self._path('ids', generation))
+
+        with open(self._path('embeddings', generation), 'wb') as f:
+            np.asarray(embeddings, dtype='<f4')[order].tofile(f)
+            # Spare rows are a sparse hole rather than written zeros
+            f.truncate(capacity * self.dim * 4)
+
+        encoded_names = [names[i].encode('utf-8') for i in order]
+        meta = np.zeros(count, dtype=META_DTYPE)
+        meta['age'] = np.asarray(ages)[order]
+        meta['count'] = np.asarray(counts)[order]
+        meta['last_seen'] = np.asarray(last_seen)[order]
+        lengths = np.array([len(name) for name in encoded_names], dtype=np.int64)
+        meta['name_length'] = lengths
+        meta['name_offset'] = np.cumsum(lengths) - lengths
+        np.save(self._path('meta', generation), meta)
+        with open(self._path('names', generation), 'wb') as f:
+            f.write(b''.join(encoded_names))
+
+        manifest = {'generation': generation, 'count': count, 'capacity': capacity,
+                    'dim': self.dim, 'next_id': int(next_id)}
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.manifest_path)
+
+        if previous is not None:
+            for kind in ('ids', 'embeddings', 'meta', 'names'):
+                try:
+                    os.remove(self._path(kind, previous))
+                except OSError:
+                    pass
+        return generation
+
+
+class FaceRecords(MutableMapping):
+    """``person_id -> {'age', 'name', 'count', 'last_seen'}`` backed by a FaceStore side table.
+
+    Entries are decoded from the memory-mapped table the first time they are
+    accessed and then kept in an in-memory overlay, so mutating the returned
+    dict behaves like the plain dict ``learned_faces`` used to be.
+    """
+
+    def __init__(self, base_ids=None, meta=None, names=None):
+        self._base_ids = base_ids if base_ids is not None else np.zeros(0, dtype=np.int64)
+        self._meta = meta if meta is not None else np.zeros(0, dtype=META_DTYPE)
+        self._names = names if names is not None else np.zeros(0, dtype=np.uint8)
+        self._overlay = {}
+        self._removed = set()
+        self._count = len(self._base_ids)  # Kept up to date, so len() is O(1)
+
+    def _base_index(self, person_id):
+        i = int(np.searchsorted(self._base_ids, person_id))
+        if i < len(self._base_ids) and self._base_ids[i] == person_id and person_id not in self._removed:
+            return i
+        return None
+
+    def _decode(self, i):
+        row = self._meta[i]
+        offset, length = int(row['name_offset']), int(row['name_length'])
+        return {
+            'age': int(row['age']),
+            'name': bytes(self._names[offset:offset + length]).decode('utf-8'),
+            'count': int(row['count']),
+            'last_seen': float(row['last_seen']),
+        }
+
+    def __getitem__(self, person_id):
+        entry = self._overlay.get(person_id)
+        if entry is not None:
+            return entry
+        i = self._base_index(person_id)
+        if i is None:
+            raise KeyError(person_id)
+        entry = self._overlay[person_id] = self._decode(i)
+        return entry
+
+    def __setitem__(self, person_id, entry):
+        if person_id not in self:
+            self._count += 1
+        self._overlay[person_id] = entry
+
+    def __delitem__(self, person_id):
+        if person_id not in self:
+            raise KeyError(person_id)
+        self._count -= 1
+        self._overlay.pop(person_id, None)
+        if self._base_index(person_id) is not None:
+            self._removed.add(person_id)
+
+    def __contains__(self, person_id):
+        return person_id in self._overlay or self._base_index(person_id) is not None
+
+    def __iter__(self):
+        for person_id in self._base_ids.tolist():
+            if person_id not in self._removed:
+                yield person_id
+        for person_id in list(self._overlay):
+            if self._base_index(person_id) is None:
+                yield person_id
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._base_ids = np.zeros(0, dtype=np.int64)
+        self._meta = np.zeros(0, dtype=META_DTYPE)
+        self._names = np.zeros(0, dtype=np.uint8)
+        self._overlay.clear()
+        self._removed.clear()
+        self._count = 0
+
+    def max_id(self):
+        """Largest person id present, or -1; does not scan the base table"""
+        candidates = [int(self._base_ids[-1])] if len(self._base_ids) else []
+        candidates.extend(self._overlay)
+        return max(candidates, default=-1)
+
+    def copy_view(self):
+        """Cheap point-in-time copy for writing a snapshot outside the gallery lock"""
+        view = FaceRecords(self._base_ids, self._meta, self._names)
+        view._overlay = {person_id: dict(entry) for person_id, entry in self._overlay.items()}
+        view._removed = set(self._removed)
+        view._count = self._count
+        return view
+
+    def columns(self, person_ids):
+        """Ages, counts, last_seen and names aligned to ``person_ids``"""
+        ages = np.zeros(len(person_ids), dtype=np.int32)
+        counts = np.zeros(len(person_ids), dtype=np.int64)
+        last_seen = np.zeros(len(person_ids), dtype=np.float64)
+        names = []
+        for i, person_id in enumerate(np.asarray(person_ids).tolist()):
+            entry = self._overlay.get(person_id)
+            if entry is None:
+                entry = self._decode(self._base_index(person_id))
+            ages[i], counts[i], last_seen[i] = entry['age'], entry['count'], entry['last_seen']
+            names.append(entry['name'])
+        return ages, counts, last_seen, names
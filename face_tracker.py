@@ -0,0 +1,143 @@
+import itertools
+
+import cv2
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of two (N, 4) / (M, 4) arrays of x1, y1, x2, y2 boxes"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    """One face followed across frames, with the identity last computed for it"""
+
+    def __init__(self, track_id, face):
+        self.track_id = track_id
+        self.bbox = np.asarray(face.bbox, dtype=np.float32).copy()
+        self.face = face  # Latest detection; only valid on the frame it came from
+        self.identity = None
+        self.recognized_at = None  # Detection round of the last recognition
+        self.misses = 0
+
+
+class FaceTracker:
+    """IoU tracker that keeps face identities between detections.
+
+    ``update`` associates the detections of a processed frame with existing
+    tracks (greedy, highest IoU first); ``propagate`` moves the boxes on
+    frames that skip detection, optionally following sparse optical flow.
+    Callers only need to re-run recognition and age estimation for the
+    tracks ``needs_identity`` returns: new ones, ones whose last match was
+    uncertain, and ones not refreshed for ``refresh_interval`` detections.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=2, refresh_interval=10,
+                 confident_similarity=0.7, use_flow=True):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.refresh_interval = refresh_interval
+        self.confident_similarity = confident_similarity
+        self.use_flow = use_flow
+        self.tracks = []
+        self.rounds = 0  # Detection rounds seen so far
+        self._next_id = itertools.count(1)
+        self._previous_gray = None
+
+    def update(self, frame, faces):
+        """Associate a frame's detections with tracks; returns the live tracks"""
+        self.rounds += 1
+        unmatched_faces = set(range(len(faces)))
+        unmatched_tracks = set(range(len(self.tracks)))
+
+        if faces and self.tracks:
+            iou = box_iou([track.bbox for track in self.tracks], [face.bbox for face in faces])
+            for t, f in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[t, f] < self.iou_threshold:
+                    break
+                if t in unmatched_tracks and f in unmatched_faces:
+                    track = self.tracks[t]
+                    track.bbox = np.asarray(faces[f].bbox, dtype=np.float32).copy()
+                    track.face = faces[f]
+                    track.misses = 0
+                    unmatched_tracks.discard(t)
+                    unmatched_faces.discard(f)
+
+        for t in unmatched_tracks:
+            self.tracks[t].misses += 1
+            self.tracks[t].face = None
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+        for f in sorted(unmatched_faces):
+            self.tracks.append(Track(next(self._next_id), faces[f]))
+
+        if self.use_flow:
+            self._previous_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return self.tracks
+
+    def needs_identity(self, track):
+        """Whether a detected track's identity must be (re)computed on this frame"""
+        if track.face is None:
+            return False
+        identity = track.identity
+        if identity is None or track.recognized_at is None:
+            return True
+        if self.rounds - track.recognized_at >= self.refresh_interval:
+            return True
+        return identity['status'] == 'LEARNING' or (
+            identity['person_id'] is not None and identity['similarity'] < self.confident_similarity)
+
+    def assign(self, tracks, identities):
+        for track, identity in zip(tracks, identities):
+            track.identity = identity
+            track.recognized_at = self.rounds
+
+    def propagate(self, frame):
+        """Move track boxes to a frame that was not run through detection"""
+        if not self.use_flow or not self.tracks:
+            return self.tracks
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self._previous_gray is not None and self._previous_gray.shape == gray.shape:
+            for track in self.tracks:
+                shift = self._flow_shift(self._previous_gray, gray, track.bbox)
+                if shift is not None:
+                    track.bbox += np.array([shift[0], shift[1], shift[0], shift[1]], dtype=np.float32)
+        self._previous_gray = gray
+        return self.tracks
+
+    def _flow_shift(self, previous_gray, gray, box):
+        """Median Lucas-Kanade displacement of corners inside the box, or None"""
+        h, w = gray.shape
+        x1, y1 = max(0, int(box[0])), max(0, int(box[1]))
+        x2, y2 = min(w, int(box[2])), min(h, int(box[3]))
+        if x2 - x1 < 8 or y2 - y1 < 8:
+            return None
+        points = cv2.goodFeaturesToTrack(previous_gray[y1:y2, x1:x2], maxCorners=20,
+                                         qualityLevel=0.01, minDistance=5)
+        if points is None:
+            return None
+        points = points.astype(np.float32) + np.array([x1, y1], dtype=np.float32)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(previous_gray, gray, points, None,
+                                                     winSize=(15, 15), maxLevel=2)
+        found = status.reshape(-1) == 1
+        if not found.any():
+            return None
+        return np.median((moved - points).reshape(-1, 2)[found], axis=0)
+
+    def results(self, detected_only=False):
+        """(track, identity) pairs for every track that has an identity.
+
+        Tracks missed by the last detection are kept for ``max_misses`` rounds
+        so a live view does not flicker; ``detected_only`` leaves them out.
+        """
+        return [(track, track.identity) for track in self.tracks
+                if track.identity is not None and (track.face is not None or not detected_only)]
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import numpy as np
+
+from process_threads import ProcessThread
+
+
+def eviction_order(ids, counts, last_seen, protected, count_weight=3600.0):
+    """Ids ordered from first to last to evict: least recently seen first.
+
+    Each doubling of a person's sighting count counts as ``count_weight``
+    seconds of recency, so regulars outlive one-off passers-by that were
+    seen slightly later. Protected ids are never returned.
+    """
+    ids = np.asarray(ids)
+    scores = np.asarray(last_seen, dtype=np.float64) + count_weight * np.log2(np.maximum(counts, 1))
+    order = np.argsort(scores, kind='stable')
+    return [int(person_id) for person_id in ids[order] if int(person_id) not in protected]
+
+
+def find_duplicate_groups(ids, embeddings, counts, threshold, max_block=16_000_000):
+    """Groups of ids whose embeddings are near-duplicates, as ``[(keep_id, [merge_ids])]``.
+
+    Pairs at or above ``threshold`` cosine similarity are found with blocked
+    matrix products of at most ``max_block`` similarities (64 MB) each, so
+    memory stays flat as the gallery grows. People are then visited by
+    descending count; each one not yet grouped becomes a leader and takes
+    every ungrouped neighbour of its own, so groups never chain through
+    intermediate faces.
+    """
+    n = len(ids)
+    if n < 2:
+        return []
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    neighbours = {}
+    chunk_size = max(1, max_block // n)
+    for start in range(0, n, chunk_size):
+        similarities = embeddings[start:start + chunk_size] @ embeddings.T
+        rows, cols = np.nonzero(similarities >= threshold)
+        for row, col in zip((rows + start).tolist(), cols.tolist()):
+            if row != col:
+                neighbours.setdefault(row, []).append(col)
+    if not neighbours:
+        return []
+
+    grouped = np.zeros(n, dtype=bool)
+    groups = []
+    for leader in np.argsort(-np.asarray(counts), kind='stable').tolist():
+        if grouped[leader] or leader not in neighbours:
+            continue
+        members = [member for member in neighbours[leader] if not grouped[member]]
+        if not members:
+            continue
+        grouped[leader] = True
+        grouped[members] = True
+        groups.append((int(ids[leader]), [int(ids[member]) for member in members]))
+    return groups
+
+
+class GalleryMaintenance:
+    """Background duplicate merging for a GalleryService.
+
+    Every ``interval`` seconds a thread asks the service to merge
+    near-duplicate identities. Capacity limits are enforced by the service
+    itself when it learns a face.
+    """
+
+    def __init__(self, service, interval=600):
+        self.service = service
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = ProcessThread(self._run, 'gallery-maintenance')
+
+    def start(self):
+        if self.interval <= 0 or self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread.ensure()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                started = time.time()
+                merged = self.service.merge_duplicates()
+                if merged:
+                    print(f"Merged {merged} duplicate identities in {time.time() - started:.1f}s")
+            except Exception as e:
+                print(f"Error merging duplicate identities: {e}")
@@ -0,0 +1,749 @@
+import argparse
+import os
+import pickle
+import signal
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no gallery file lock
+    fcntl = None
+
+from face_gallery import FaceGallery, normalize_embeddings
+from face_index import IVFIndex
+from face_journal import GalleryJournal
+from gallery_maintenance import GalleryMaintenance, eviction_order, find_duplicate_groups
+from face_store import FaceRecords, FaceStore
+
+SIMILARITY_THRESHOLD = 0.6  # Threshold for face recognition
+
+
+class GalleryUnavailable(RuntimeError):
+    """The gallery process cannot be reached (not started yet, or restarting)"""
+
+
+class GalleryLocked(RuntimeError):
+    """Another process owns the gallery files"""
+
+
+def default_db_file():
+    """Legacy pickle path; the store and journal live next to it"""
+    # Use persistent disk path for Render deployment
+    if os.environ.get('ENVIRONMENT') == 'production':
+        return '/opt/render/project/src/data/learned_faces.pkl'
+    return 'learned_faces.pkl'
+
+
+class GalleryService:
+    """Owns the learned-face gallery: matching, learning, persistence.
+
+    One instance exists per deployment. With a single process it lives
+    inside the Flask app; with several gunicorn workers it runs in its own
+    process (see ``serve_gallery``) and workers reach it through
+    ``RemoteGallery``, so ids and recognition stay consistent across workers.
+
+    ``load`` takes an exclusive lock on the gallery files, so a second owner
+    (a CLI next to a running server) fails instead of interleaving journal
+    writes and snapshots. A ``read_only`` service takes no lock and refuses
+    changes; it sees the gallery as it was when loaded.
+    """
+
+    def __init__(self, db_file=None, similarity_threshold=SIMILARITY_THRESHOLD, read_only=False):
+        self.db_file = db_file or default_db_file()
+        self.read_only = read_only
+        # Seconds load() waits for another owner to let go, e.g. a worker being replaced
+        self.lock_timeout = float(os.environ.get('GALLERY_LOCK_TIMEOUT', '30'))
+        self._lock_file = None
+        # Memory-mapped snapshot directory; a legacy db_file pickle is migrated into it once
+        self.store_dir = os.path.splitext(self.db_file)[0] + '.store'
+        self.similarity_threshold = similarity_threshold
+
+        # Optional approximate index for large galleries: FACE_INDEX=ivf enables it,
+        # ANN_NPROBE trades recall for latency, ANN_MIN_SIZE is the exact-scan cutoff
+        self.face_index = os.environ.get('FACE_INDEX', 'exact').lower()
+        self.ann_nprobe = int(os.environ.get('ANN_NPROBE', '8'))
+        self.ann_min_size = int(os.environ.get('ANN_MIN_SIZE', '5000'))
+
+        # Size limit and clean-up: GALLERY_MAX_FACES caps the gallery (0 = no limit) by
+        # evicting the least recently seen unnamed people; every GALLERY_MERGE_INTERVAL
+        # seconds identities closer than GALLERY_MERGE_THRESHOLD are merged
+        self.max_faces = int(os.environ.get('GALLERY_MAX_FACES', '0'))
+        self.eviction_count_weight = float(os.environ.get('GALLERY_EVICTION_COUNT_WEIGHT', '3600'))
+        self.merge_threshold = float(os.environ.get('GALLERY_MERGE_THRESHOLD', str(similarity_threshold)))
+        self.maintenance = GalleryMaintenance(self, interval=float(os.environ.get('GALLERY_MERGE_INTERVAL', '600')))
+        self.evicted = 0
+        self.merged = 0
+        self.last_merge = None  # {'at', 'seconds', 'merged'} of the latest duplicate pass
+        self.snapshots = 0
+        self.snapshot_seconds = 0.0  # Total time spent writing snapshots
+
+        self.lock = threading.RLock()
+        self.gallery = self.create_gallery()  # Normalised embeddings, one matrix row per person
+        self.learned_faces = FaceRecords()  # {person_id: {'age': int, 'name': str, 'count': int, 'last_seen': float}}
+        self.face_id_counter = 0
+
+        self.store = FaceStore(self.store_dir)
+        # Every gallery change is appended to this journal; it is folded into the store
+        # every JOURNAL_COMPACT_EVERY records or JOURNAL_COMPACT_INTERVAL seconds
+        self.journal = GalleryJournal(
+            self.db_file + '.journal', self.write_snapshot,
+            compact_every=int(os.environ.get('JOURNAL_COMPACT_EVERY', '1000')),
+            compact_interval=float(os.environ.get('JOURNAL_COMPACT_INTERVAL', '300')))
+
+    def create_gallery(self, **arrays):
+        """Create the face gallery, optionally adopting existing (memory-mapped) arrays"""
+        index = IVFIndex(nprobe=self.ann_nprobe, min_size=self.ann_min_size) if self.face_index == 'ivf' else None
+        return FaceGallery(index=index, **arrays)
+
+    # Persistence
+
+    def write_snapshot(self):
+        """Write all learned faces to the memory-mapped store (runs on the journal thread)"""
+        started = time.perf_counter()
+        with self.lock:
+            ids = self.gallery.ids.copy()
+            embeddings = self.gallery.embeddings.copy()
+            records = self.learned_faces.copy_view()
+            next_id = self.face_id_counter
+        # Column extraction and file writes happen outside the lock
+        ages, counts, last_seen, names = records.columns(ids)
+        self.store.write(ids, embeddings, ages, counts, last_seen, names, next_id)
+        self.snapshots += 1
+        self.snapshot_seconds += time.perf_counter() - started
+        print(f"Saved {len(ids)} learned faces to disk")
+
+    def save(self):
+        """Ask the journal thread to fold all changes into a fresh snapshot"""
+        self._check_writable()
+        self.journal.request_compaction()
+
+    def close(self):
+        self.maintenance.stop()
+        self.journal.close()
+        if self._lock_file is not None:
+            self._lock_file.close()  # Releases the lock
+            self._lock_file = None
+
+    def acquire_lock(self):
+        """Become the only process writing this gallery; raises GalleryLocked after lock_timeout"""
+        if fcntl is None or self._lock_file is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_file)), exist_ok=True)
+        lock_file = open(self.db_file + '.lock', 'a')
+        deadline = time.time() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.time() >= deadline:
+                    lock_file.close()
+                    raise GalleryLocked(f"The gallery {self.db_file} is in use by another process (a running "
+                                        f"server?); connect to its gallery process with GALLERY_SOCKET instead")
+                time.sleep(0.2)
+        self._lock_file = lock_file
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"The gallery {self.db_file} is open read-only")
+
+    def apply_journal_record(self, record):
+        """Replay one journal record onto the in-memory gallery"""
+        kind = record[0]
+        if kind == 'learn':
+            _, person_id, entry = record
+            entry = dict(entry)
+            self.gallery.add(person_id, entry.pop('embedding'))
+            self.learned_faces[person_id] = entry
+        elif kind == 'update':
+            _, person_id, embedding, age, count, last_seen = record
+            if person_id in self.learned_faces:
+                self.gallery.add(person_id, embedding)
+                self.learned_faces[person_id].update(age=age, count=count, last_seen=last_seen)
+        elif kind == 'remove':
+            _, person_ids = record
+            for person_id in person_ids:
+                if person_id in self.learned_faces:
+                    self.gallery.remove(person_id)
+                    del self.learned_faces[person_id]
+        elif kind == 'merge':
+            _, keep_id, merged_ids, embedding, entry = record
+            for person_id in merged_ids:
+                if person_id in self.learned_faces:
+                    self.gallery.remove(person_id)
+                    del self.learned_faces[person_id]
+            if keep_id in self.learned_faces:
+                self.gallery.add(keep_id, embedding)
+                self.learned_faces[keep_id] = dict(entry)
+        elif kind == 'rename':
+            _, person_id, name = record
+            if person_id in self.learned_faces:
+                self.learned_faces[person_id]['name'] = name
+        elif kind == 'reset':
+            self.learned_faces.clear()
+            self.gallery.clear()
+
+    def load_legacy(self):
+        """Load a learned_faces.pkl written by older versions into the gallery"""
+        with open(self.db_file, 'rb') as f:
+            stored_faces = pickle.load(f)
+        for person_id, data in stored_faces.items():
+            data = dict(data)
+            self.gallery.add(person_id, data.pop('embedding'))
+            self.learned_faces[person_id] = data
+        print(f"Loaded {len(self.learned_faces)} learned faces from legacy {self.db_file}")
+
+    def load(self):
+        """Open the memory-mapped store and replay the journal tail; O(1) in gallery size"""
+        if not self.read_only:
+            self.acquire_lock()
+        with self.lock:
+            try:
+                migrate = False
+                next_id = 0
+                if self.store.exists():
+                    stored = self.store.open()
+                    self.gallery = self.create_gallery(ids=stored['ids'], embeddings=stored['embeddings'],
+                                                       size=stored['count'])
+                    self.learned_faces = FaceRecords(stored['base_ids'], stored['meta'], stored['names'])
+                    next_id = stored['next_id']
+                    print(f"Opened {stored['count']} learned faces from {self.store_dir}")
+                else:
+                    self.gallery = self.create_gallery()
+                    self.learned_faces = FaceRecords()
+                    if os.path.exists(self.db_file):
+                        self.load_legacy()
+                        migrate = True
+                    else:
+                        print("No previous learned faces found")
+
+                replayed = 0
+                for record in self.journal.read_records():
+                    self.apply_journal_record(record)
+                    replayed += 1
+                if replayed:
+                    print(f"Replayed {replayed} gallery journal records")
+
+                self.face_id_counter = max(next_id, self.learned_faces.max_id() + 1)
+
+                if migrate and not self.read_only:
+                    # One-time conversion; keep the pickle around under a new name
+                    self.write_snapshot()
+                    os.replace(self.db_file, self.db_file + '.migrated')
+                    print(f"Migrated {self.db_file} to {self.store_dir}")
+            except Exception as e:
+                print(f"Error loading learned faces: {e}")
+                self.learned_faces = FaceRecords()
+                self.gallery = self.create_gallery()
+                self.face_id_counter = 0
+        if not self.read_only:
+            self.maintenance.start()
+
+    # Recognition
+
+    def match(self, face_embeddings):
+        """Match a batch of face embeddings against all learned faces at once"""
+        with self.lock:
+            return self.gallery.match(face_embeddings, self.similarity_threshold)
+
+    def learn(self, face_embedding, age):
+        """Learn a new face and assign it an ID"""
+        self._check_writable()
+        with self.lock:
+            person_id = self.face_id_counter
+            person_name = f"Person_{person_id}"
+
+            self.gallery.add(person_id, face_embedding)
+            self.learned_faces[person_id] = {
+                'age': age,
+                'name': person_name,
+                'count': 1,
+                'last_seen': time.time()
+            }
+
+            self.face_id_counter += 1
+            self.journal.append(('learn', person_id,
+                                 dict(self.learned_faces[person_id], embedding=self.gallery.get(person_id))))
+
+            if self.max_faces and len(self.learned_faces) > self.max_faces:
+                self.enforce_capacity(keep={person_id})
+
+        return person_id, person_name
+
+    def update(self, person_id, face_embedding, age):
+        """Update an existing learned face (running average of embeddings and age)"""
+        self._check_writable()
+        with self.lock:
+            if person_id not in self.learned_faces:
+                return
+            person_data = self.learned_faces[person_id]
+
+            # Update count
+            person_data['count'] += 1
+
+            # Running average of embeddings (for better stability), updated in place
+            self.gallery.update(person_id, face_embedding, alpha=0.1)
+
+            # Running average of age
+            person_data['age'] = int((person_data['age'] + age) / 2)
+
+            # Update last seen
+            person_data['last_seen'] = time.time()
+
+            # O(1) journal append; the full gallery is only rewritten on compaction
+            self.journal.append(('update', person_id, self.gallery.get(person_id), person_data['age'],
+                                 person_data['count'], person_data['last_seen']))
+
+    def recognize(self, face_embeddings, ages):
+        """Match faces in one batched step, updating known faces and learning unknown ones.
+
+        Returns one identity dict (person_id, name, age, status, similarity)
+        per face. Runs under the gallery lock, so concurrent callers (and
+        workers talking to a gallery process) see consistent ids.
+        """
+        if len(face_embeddings) == 0:
+            return []
+
+        with self.lock:
+            matches = self.match(face_embeddings)
+            # Faces learned earlier in this batch are not in the batched match above;
+            # check unmatched faces against them so one new person is learned once
+            batch_learned = FaceGallery(capacity=8)
+            identities = []
+
+            for face_embedding, age, (match_id, similarity) in zip(face_embeddings, ages, matches):
+                if match_id is None and len(batch_learned):
+                    match_id, similarity = batch_learned.match(face_embedding, self.similarity_threshold)[0]
+
+                if match_id is not None and match_id in self.learned_faces:
+                    # Found a match - use stored information
+                    person_data = self.learned_faces[match_id]
+                    stored_age = person_data['age']
+                    person_name = person_data['name']
+
+                    # Update the learned face
+                    self.update(match_id, face_embedding, age)
+
+                    # Use stored age for stability
+                    identities.append({
+                        'person_id': match_id,
+                        'name': person_name,
+                        'age': stored_age,
+                        'status': 'RECOGNIZED',
+                        'similarity': similarity
+                    })
+                else:
+                    # New face - learn it
+                    person_id, person_name = self.learn(face_embedding, age)
+                    batch_learned.add(person_id, face_embedding)
+                    identities.append({
+                        'person_id': person_id,
+                        'name': person_name,
+                        'age': age,
+                        'status': 'LEARNING',
+                        'similarity': 0.0
+                    })
+
+            return identities
+
+    # Maintenance
+
+    def remove(self, person_ids):
+        """Forget the given people"""
+        self._check_writable()
+        with self.lock:
+            person_ids = [person_id for person_id in person_ids if person_id in self.learned_faces]
+            for person_id in person_ids:
+                self.gallery.remove(person_id)
+                del self.learned_faces[person_id]
+            if person_ids:
+                self.journal.append(('remove', person_ids))
+            return len(person_ids)
+
+    def enforce_capacity(self, keep=()):
+        """Evict down to 95% of max_faces so eviction is not repeated on every new face.
+
+        People renamed by a user, and ids in ``keep``, are never evicted.
+        """
+        with self.lock:
+            target = int(self.max_faces * 0.95)
+            excess = len(self.learned_faces) - target
+            if not self.max_faces or excess <= 0:
+                return 0
+            ids = self.gallery.ids.copy()
+            _, counts, last_seen, names = self.learned_faces.columns(ids)
+            protected = set(keep) | {int(person_id) for person_id, name in zip(ids.tolist(), names)
+                                     if name != f"Person_{person_id}"}
+            evicted = self.remove(eviction_order(ids, counts, last_seen, protected,
+                                                 self.eviction_count_weight)[:excess])
+            self.evicted += evicted
+            return evicted
+
+    def merge(self, keep_id, merged_ids):
+        """Fold near-duplicate identities into keep_id (count-weighted embedding and age)"""
+        self._check_writable()
+        with self.lock:
+            merged_ids = [person_id for person_id in merged_ids
+                          if person_id != keep_id and person_id in self.learned_faces]
+            if keep_id not in self.learned_faces or not merged_ids:
+                return 0
+            members = [keep_id] + merged_ids
+            entries = [self.learned_faces[person_id] for person_id in members]
+            weights = np.array([entry['count'] for entry in entries], dtype=np.float32)
+            embeddings = np.stack([self.gallery.get(person_id) for person_id in members])
+            ages = np.array([entry['age'] for entry in entries], dtype=np.float32)
+
+            # Keep a user-given name if the surviving id only has the default one
+            name = entries[0]['name']
+            if name == f"Person_{keep_id}":
+                name = next((entry['name'] for person_id, entry in zip(members, entries)
+                             if entry['name'] != f"Person_{person_id}"), name)
+            entry = {
+                'age': int(round(float(ages @ weights / weights.sum()))),
+                'name': name,
+                'count': int(weights.sum()),
+                'last_seen': max(entry['last_seen'] for entry in entries),
+            }
+
+            for person_id in merged_ids:
+                self.gallery.remove(person_id)
+                del self.learned_faces[person_id]
+            self.gallery.add(keep_id, normalize_embeddings(weights @ embeddings))
+            self.learned_faces[keep_id] = entry
+            self.journal.append(('merge', keep_id, merged_ids, self.gallery.get(keep_id), dict(entry)))
+            return len(merged_ids)
+
+    def merge_duplicates(self):
+        """Find and merge near-duplicate identities; the search runs outside the lock"""
+        started = time.time()
+        with self.lock:
+            ids = self.gallery.ids.copy()
+            embeddings = self.gallery.embeddings.copy()
+            records = self.learned_faces.copy_view()
+        _, counts, _, _ = records.columns(ids)
+        merged = 0
+        for keep_id, merged_ids in find_duplicate_groups(ids, embeddings, counts, self.merge_threshold):
+            # The gallery may have changed meanwhile; merge re-checks every id
+            merged += self.merge(keep_id, merged_ids)
+        self.merged += merged
+        self.last_merge = {'at': started, 'seconds': round(time.time() - started, 3), 'merged': merged}
+        return merged
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.learned_faces),
+                'max_faces': self.max_faces,
+                'evicted': self.evicted,
+                'merged': self.merged,
+                'merge_threshold': self.merge_threshold,
+                'merge_interval': self.maintenance.interval,
+                'last_merge': self.last_merge,
+                'snapshots': self.snapshots,
+                'snapshot_seconds': round(self.snapshot_seconds, 6),
+            }
+
+    # Management
+
+    def list_faces(self):
+        """All learned faces as JSON-ready dicts"""
+        with self.lock:
+            items = [(person_id, dict(data)) for person_id, data in self.learned_faces.items()]
+        return [{
+            'id': person_id,
+            'name': data['name'],
+            'age': data['age'],
+            'count': data['count'],
+            'last_seen': data['last_seen']
+        } for person_id, data in items]
+
+    def count(self):
+        with self.lock:
+            return len(self.learned_faces)
+
+    def names(self, person_ids):
+        """Current names of the given people; unknown ids are left out"""
+        with self.lock:
+            return {person_id: self.learned_faces[person_id]['name']
+                    for person_id in person_ids if person_id in self.learned_faces}
+
+    def rename(self, person_id, new_name):
+        """Rename a learned person; returns False if the id is unknown"""
+        self._check_writable()
+        with self.lock:
+            if person_id not in self.learned_faces:
+                return False
+            self.learned_faces[person_id]['name'] = new_name
+            self.journal.append(('rename', person_id, new_name))
+            return True
+
+    def reset(self):
+        """Forget all learned faces"""
+        self._check_writable()
+        with self.lock:
+            self.learned_faces.clear()
+            self.gallery.clear()
+            # Ids are not reused, so a person id a client still holds never names someone else
+            self.journal.append(('reset',))
+
+        # Fold the reset into an empty snapshot right away
+        self.save()
+
+
+# Methods a RemoteGallery may call on the gallery process
+REMOTE_METHODS = {'match', 'learn', 'update', 'recognize', 'list_faces', 'count', 'names', 'rename', 'reset',
+                  'save', 'remove', 'merge_duplicates', 'stats'}
+# Safe to send again when the gallery process died before answering
+READ_ONLY_METHODS = {'match', 'list_faces', 'count', 'names', 'stats'}
+
+
+def serve_gallery(address, db_file=None, read_only=False):
+    """Run a GalleryService in this process and answer RemoteGallery calls on a Unix socket"""
+    if os.path.exists(address):
+        os.remove(address)
+    service = GalleryService(db_file, read_only=read_only)
+    service.load()
+    listener = Listener(address, family='AF_UNIX')
+
+    def shutdown(*_):
+        service.close()
+        listener.close()
+        os._exit(0)
+
+    # Ctrl-C reaches the whole process group; let the gunicorn master decide
+    # when to stop us (on_exit), and flush the journal on a plain SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, shutdown)
+    print(f"Gallery process {os.getpid()} serving {service.count()} learned faces on {address}")
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if method == 'shutdown':
+                    conn.send(('ok', None))
+                    shutdown()
+                try:
+                    if method not in REMOTE_METHODS:
+                        raise ValueError(f"Unknown gallery method: {method}")
+                    conn.send(('ok', getattr(service, method)(*args)))
+                except Exception as e:
+                    conn.send(('error', f"{type(e).__name__}: {e}"))
+
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def start_gallery_server(address, db_file=None, read_only=False):
+    """Start the gallery process (called from the gunicorn master and the CLIs).
+
+    A plain subprocess rather than multiprocessing, so forked workers do not
+    inherit it as a child they try to join at exit.
+    """
+    command = [sys.executable, os.path.abspath(__file__), address]
+    if db_file:
+        command.append(db_file)
+    if read_only:
+        command.append('--read-only')
+    return subprocess.Popen(command)
+
+
+def wait_for_gallery_server(address, process, timeout=60):
+    """Block until the gallery process accepts connections; raises GalleryUnavailable if it exits first"""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            Client(address, family='AF_UNIX').close()
+            return
+        except (FileNotFoundError, ConnectionRefusedError):
+            if process.poll() is not None:
+                raise GalleryUnavailable(f"The gallery process exited with code {process.returncode}")
+            if time.time() > deadline:
+                raise GalleryUnavailable(f"The gallery process did not start within {timeout}s")
+            time.sleep(0.1)
+
+
+class GallerySupervisor:
+    """Keeps a gallery process running: a watcher thread restarts it whenever it exits.
+
+    Restarts back off from 1 up to 30 seconds while the process keeps dying
+    right after starting (e.g. on a damaged gallery file), so a crash loop
+    does not spin. Run from the gunicorn master, which has no other hook to
+    notice that the process died.
+    """
+
+    def __init__(self, address, db_file=None):
+        self.address = address
+        self.db_file = db_file
+        self.process = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self.process = start_gallery_server(self.address, self.db_file)
+        self._thread = threading.Thread(target=self._watch, name='gallery-supervisor', daemon=True)
+        self._thread.start()
+        return self.process
+
+    def stop(self):
+        with self._lock:
+            self._stopping.set()
+            process = self.process
+        if process is not None:
+            stop_gallery_server(self.address, process)
+
+    def _watch(self):
+        quick_exits = 0
+        while True:
+            started = time.time()
+            code = self.process.wait()
+            if self._stopping.is_set():
+                return
+            quick_exits = quick_exits + 1 if time.time() - started < 60 else 1
+            delay = min(30.0, 2.0 ** (quick_exits - 1))
+            print(f"Gallery process {self.process.pid} exited with code {code}; restarting in {delay:.0f}s")
+            if self._stopping.wait(delay):
+                return
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+                self.process = start_gallery_server(self.address, self.db_file)
+
+
+def stop_gallery_server(address, process):
+    """Flush the journal and stop the gallery process"""
+    if process.poll() is not None:
+        return
+    try:
+        with Client(address, family='AF_UNIX') as conn:
+            conn.send(('shutdown', ()))
+            conn.recv()
+    except (OSError, EOFError):
+        # Not serving yet (or any more): SIGTERM also flushes the journal once it is loaded
+        process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+class RemoteGallery:
+    """Client for a gallery process; same interface as GalleryService.
+
+    Each thread keeps its own connection, so concurrent requests in one
+    worker do not interleave messages. Calls raise GalleryUnavailable when
+    the process cannot be reached within ``connect_timeout`` seconds.
+    """
+
+    def __init__(self, address, connect_timeout=60):
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # The gallery process may still be loading when the first request arrives
+            deadline = time.time() + self.connect_timeout
+            while True:
+                try:
+                    conn = Client(self.address, family='AF_UNIX')
+                    break
+                except (FileNotFoundError, ConnectionRefusedError) as e:
+                    if time.time() > deadline:
+                        raise GalleryUnavailable(f"Gallery process is not reachable on {self.address}") from e
+                    time.sleep(0.2)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, method, *args):
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.send((method, args))
+            except OSError as e:
+                # Stale connection to a restarted gallery process: the request never arrived, reconnect once
+                self._local.conn = None
+                if attempt:
+                    raise GalleryUnavailable(f"Lost the connection to the gallery process: {e}") from e
+                continue
+            try:
+                status, result = conn.recv()
+                break
+            except (EOFError, OSError) as e:
+                # The change may have been applied and journaled before the process died,
+                # so only lookups are sent again
+                self._local.conn = None
+                if attempt or method not in READ_ONLY_METHODS:
+                    raise GalleryUnavailable(f"Lost the connection to the gallery process: {e}") from e
+        if status == 'error':
+            raise RuntimeError(result)
+        return result
+
+    def load(self):
+        """Loading happens in the gallery process"""
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def match(self, face_embeddings):
+        return self._call('match', face_embeddings)
+
+    def learn(self, face_embedding, age):
+        return self._call('learn', face_embedding, age)
+
+    def update(self, person_id, face_embedding, age):
+        return self._call('update', person_id, face_embedding, age)
+
+    def recognize(self, face_embeddings, ages):
+        return self._call('recognize', face_embeddings, ages)
+
+    def list_faces(self):
+        return self._call('list_faces')
+
+    def count(self):
+        return self._call('count')
+
+    def names(self, person_ids):
+        return self._call('names', person_ids)
+
+    def remove(self, person_ids):
+        return self._call('remove', person_ids)
+
+    def merge_duplicates(self):
+        return self._call('merge_duplicates')
+
+    def stats(self):
+        return self._call('stats')
+
+    def rename(self, person_id, new_name):
+        return self._call('rename', person_id, new_name)
+
+    def reset(self):
+        return self._call('reset')
+
+    def save(self):
+        return self._call('save')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gallery process for gunicorn workers and the CLIs')
+    parser.add_argument('address', help='Unix socket to serve on')
+    parser.add_argument('db_file', nargs='?', help='Gallery file (default: learned_faces.pkl)')
+    parser.add_argument('--read-only', action='store_true', help='Serve lookups only; changes are refused')
+    args = parser.parse_args()
+    serve_gallery(args.address, args.db_file, args.read_only)
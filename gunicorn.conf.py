@@ -8,15 +8,24 @@ bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
 backlog = 2048
 
 # Worker processes
-workers = 1  # Single worker for face learning model consistency
-worker_class = "sync"
+# Scale with WEB_CONCURRENCY (e.g. the core count). With more than one worker the
+# learned-face gallery runs in a separate process that all workers share.
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+# Threaded workers: /video_feed and /ws/analyze hold a connection open for as
+# long as the viewer stays, which would block a sync worker entirely
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
 worker_connections = 1000
-timeout = 120  # Increased timeout for model initialization
+timeout = 120  # Restart a worker that stops responding this long; model loading runs in the background
 keepalive = 2
-# Restart workers
-max_requests = 1000
-max_requests_jitter = 50
-preload_app = True  # Preload app for better performance
+# Workers are not recycled: a fresh worker reloads the model and answers /readyz
+# with 503 until it is warm, which Render's health checks count as failures
+max_requests = 0
+# Each worker imports the app and loads the model on a background thread, so it
+# binds immediately; /readyz turns 200 once that worker's model is warmed up.
+# (Preloading would load the model in the master, where the thread would not
+# survive the fork into workers.)
+preload_app = False
 
 # Logging
 accesslog = "-"  # Log to stdout
@@ -36,4 +45,54 @@ tmp_upload_dir = None
 
 # SSL (not needed for Render, but can be configured)
 keyfile = None
-certfile = None
\ No newline at end of file
+certfile = None
+
+# Shared face gallery
+# The socket path must be in the environment before any worker imports the app
+# module, so it is set at config load time.
+gallery_socket = os.environ.get('GALLERY_SOCKET')
+if workers > 1 and not gallery_socket:
+    gallery_socket = f"/tmp/age_prediction_gallery_{os.getpid()}.sock"
+    os.environ['GALLERY_SOCKET'] = gallery_socket
+
+
+def on_starting(server):
+    """Start the shared gallery process before any worker is forked; it is restarted if it dies"""
+    if workers > 1:
+        from gallery_service import GallerySupervisor
+        server.gallery_supervisor = GallerySupervisor(gallery_socket)
+        process = server.gallery_supervisor.start()
+        server.log.info(f"Started gallery process {process.pid} on {gallery_socket}")
+
+
+# CPU pinning (CPU_AFFINITY=1, Linux only)
+# Each worker is pinned to its own equal slice of the cores and sizes its ONNX
+# Runtime thread pool to that slice (see session_config.py). Without pinning,
+# each worker's pool gets cores / workers threads but may run on any core.
+cpu_affinity = os.environ.get('CPU_AFFINITY') == '1' and hasattr(os, 'sched_setaffinity')
+
+
+def pre_fork(server, worker):
+    """Give the new worker the first CPU slot not held by a live worker"""
+    if cpu_affinity:
+        taken = {getattr(w, 'cpu_slot', None) for w in server.WORKERS.values()}
+        worker.cpu_slot = next(slot for slot in range(workers + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    """Pin the worker to its CPU slot before it loads the model"""
+    if cpu_affinity:
+        cores = sorted(os.sched_getaffinity(0))
+        share = max(1, len(cores) // workers)
+        start = (worker.cpu_slot % workers) * share
+        slot_cores = cores[start:start + share] or cores
+        os.sched_setaffinity(0, slot_cores)
+        os.environ['WORKER_CPU_SLOT'] = str(worker.cpu_slot)
+        server.log.info(f"Worker {worker.pid} pinned to cores {slot_cores}")
+
+
+def on_exit(server):
+    """Flush the gallery journal and stop the gallery process"""
+    supervisor = getattr(server, 'gallery_supervisor', None)
+    if supervisor is not None:
+        supervisor.stop()
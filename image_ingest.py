@@ -0,0 +1,100 @@
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 scale, skipping most of the IDCT work
+JPEG_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                      (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+class UploadTooLarge(ValueError):
+    """Upload over the byte or pixel limit; answered with 413"""
+
+
+def read_limited(stream, max_bytes):
+    """Read a file-like object, refusing to buffer more than ``max_bytes`` (0 = no limit)"""
+    if not max_bytes:
+        return stream.read()
+    data = stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise UploadTooLarge(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+    return data
+
+
+def image_header(image_bytes):
+    """``((width, height), format)`` read from the image header without decoding pixels, or None"""
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            return image.size, image.format
+    except Image.DecompressionBombError as e:
+        raise UploadTooLarge(str(e))
+    except Exception:
+        return None  # Not something PIL knows; OpenCV may still decode it
+
+
+class DecodedImage:
+    """A frame at working resolution plus how it relates to the uploaded image.
+
+    ``scale`` is original pixels per working pixel (1.0 when the image was
+    decoded at full size); ``original_size`` is the uploaded ``(width, height)``.
+    """
+
+    __slots__ = ('frame', 'scale', 'original_size')
+
+    def __init__(self, frame, scale, original_size):
+        self.frame = frame
+        self.scale = scale
+        self.original_size = original_size
+
+
+def decode_bounded(image_bytes, max_side=0, max_pixels=0):
+    """Decode to at most ``max_side`` pixels on the long side (0 = full size); None if not an image.
+
+    The header is read first, so images over ``max_pixels`` are refused
+    before any pixel is decoded, and large JPEGs are decoded at a reduced
+    scale by libjpeg instead of being decoded in full and resized.
+    """
+    header = image_header(image_bytes)
+    flags = cv2.IMREAD_COLOR
+    if header is not None:
+        (width, height), image_format = header
+        if max_pixels and width * height > max_pixels:
+            raise UploadTooLarge(f"Image is {width}x{height}; the limit is {max_pixels / 1e6:g} megapixels")
+        if max_side and image_format == 'JPEG':
+            # Largest reduction that still leaves at least max_side pixels to resize from
+            flags = next((flag for factor, flag in JPEG_REDUCED_FLAGS if max(width, height) / factor >= max_side),
+                         cv2.IMREAD_COLOR)
+
+    frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flags)
+    if frame is None:
+        return None
+    decoded_side = max(frame.shape[:2])
+    # EXIF rotation may swap width and height, so compare long sides only
+    original_side = max(header[0]) if header is not None else decoded_side
+    if max_side and decoded_side > max_side:
+        ratio = max_side / decoded_side
+        frame = cv2.resize(frame, (max(1, round(frame.shape[1] * ratio)), max(1, round(frame.shape[0] * ratio))),
+                           interpolation=cv2.INTER_AREA)
+    h, w = frame.shape[:2]
+    if header is not None and (w > h) != (header[0][0] > header[0][1]) and w != h:
+        original_size = (header[0][1], header[0][0])  # Rotated by EXIF orientation
+    else:
+        original_size = header[0] if header is not None else (w, h)
+    return DecodedImage(frame, original_side / max(h, w), original_size)
+
+
+def scale_boxes(results, scale, original_size):
+    """Copies of face results with boxes in original image coordinates"""
+    if scale == 1.0:
+        return results
+    width, height = original_size
+    scaled = []
+    for result in results:
+        x1, y1, x2, y2 = result['bbox']
+        box = [min(int(round(x1 * scale)), width - 1), min(int(round(y1 * scale)), height - 1),
+               min(int(round(x2 * scale)), width - 1), min(int(round(y2 * scale)), height - 1)]
+        scaled.append(dict(result, bbox=box))
+    return scaled
@@ -0,0 +1,42 @@
+import os
+import threading
+
+
+class ProcessThread:
+    """A daemon background thread, started at most once per process.
+
+    Threads do not survive fork, so a gunicorn worker forked after the thread
+    was started in the master (or a worker recycled from it) starts its own
+    the first time ``ensure`` is called there.
+    """
+
+    def __init__(self, target, name):
+        self.target = target
+        self.name = name
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def started(self):
+        """Whether the thread was started in this process (it may have finished since)"""
+        return self._pid == os.getpid()
+
+    def is_alive(self):
+        thread = self._thread
+        return self.started() and thread is not None and thread.is_alive()
+
+    def ensure(self):
+        """Start the thread unless it is running in this process; returns whether it was started"""
+        if self.is_alive():
+            return False
+        with self._lock:
+            if self.is_alive():
+                return False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.target, name=self.name, daemon=True)
+            self._thread.start()
+            return True
+
+    def join(self, timeout=None):
+        if self.started() and self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,136 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread at a fixed interval.
+
+    cProfile only sees the thread that enabled it, while inference for
+    streams (and batched inference for requests) runs on background threads,
+    so this profiler walks ``sys._current_frames()`` instead. The result is
+    written in the folded-stack format understood by flamegraph.pl and
+    speedscope: one ``thread;outer;...;inner count`` line per distinct stack.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        # Sample before the first wait so even short requests get some samples
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            if self._stop.wait(self.interval):
+                break
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileStore:
+    """Directory of downloadable profile artifacts, keeping only the newest ``keep``"""
+
+    def __init__(self, directory, keep=20, sample_interval=0.005):
+        self.directory = directory
+        self.keep = keep
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+
+    def new_name(self, label, mode):
+        extension = 'prof' if mode == 'cprofile' else 'folded'
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:6]}.{extension}"
+
+    def path(self, name):
+        """Path of an artifact, or None if the name is not one of ours"""
+        if os.path.basename(name) != name or not name.endswith(('.prof', '.folded')):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def list(self):
+        if not os.path.isdir(self.directory):
+            return []
+        artifacts = []
+        for name in os.listdir(self.directory):
+            if name.endswith(('.prof', '.folded')):
+                stat = os.stat(os.path.join(self.directory, name))
+                artifacts.append({'name': name, 'bytes': stat.st_size, 'created': stat.st_mtime})
+        return sorted(artifacts, key=lambda artifact: artifact['created'], reverse=True)
+
+    def _save(self, write, name):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = os.path.join(self.directory, name + '.tmp')
+        write(temp_path)
+        os.replace(temp_path, os.path.join(self.directory, name))
+        with self._lock:
+            for old in self.list()[self.keep:]:
+                try:
+                    os.remove(os.path.join(self.directory, old['name']))
+                except OSError:
+                    pass
+
+    def start(self, label, mode):
+        """Start profiling; returns ``(name, finish)`` where ``finish()`` stops and saves the artifact"""
+        name = self.new_name(label, mode)
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+            def finish():
+                profiler.disable()
+                self._save(profiler.dump_stats, name)
+        else:
+            profiler = SamplingProfiler(self.sample_interval)
+            profiler.start()
+
+            def finish():
+                profiler.stop()
+                self._save(profiler.write, name)
+        return name, finish
+
+    def profile_for(self, label, seconds):
+        """Sample all threads for ``seconds`` in the background; returns the artifact name"""
+        name, finish = self.start(label, 'sample')
+        timer = threading.Timer(seconds, finish)
+        timer.daemon = True
+        timer.start()
+        return name
+
+
+def summarize(path, limit=40):
+    """Human-readable top functions of a cProfile artifact, by cumulative time"""
+    output = io.StringIO()
+    pstats.Stats(path, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
@@ -0,0 +1,122 @@
+import json
+import os
+
+import onnxruntime
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    'sequential': onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+# Setting name -> (environment variable, parser)
+SETTINGS = {
+    'intra_op_threads': ('ORT_INTRA_OP_THREADS', int),
+    'inter_op_threads': ('ORT_INTER_OP_THREADS', int),
+    'graph_optimization': ('ORT_GRAPH_OPTIMIZATION', str),
+    'execution_mode': ('ORT_EXECUTION_MODE', str),
+    'cpu_mem_arena': ('ORT_CPU_MEM_ARENA', lambda value: value not in ('0', 'false', 'False')),
+    'mem_pattern': ('ORT_MEM_PATTERN', lambda value: value not in ('0', 'false', 'False')),
+    'allow_spinning': ('ORT_ALLOW_SPINNING', lambda value: value not in ('0', 'false', 'False')),
+}
+
+
+def worker_count():
+    return max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+
+
+def available_cores():
+    """Cores this process may run on (already narrowed if gunicorn pinned the worker)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS/Windows
+        return os.cpu_count() or 1
+
+
+def default_settings():
+    """Settings that share the cores between gunicorn workers instead of oversubscribing them.
+
+    ONNX Runtime sizes its thread pool to every core by default, so N workers
+    would each start one thread per core. A worker pinned to its own cores
+    (WORKER_CPU_SLOT, see gunicorn.conf.py) uses all of them; an unpinned one
+    gets an equal share. With several workers, idle pool threads stop
+    spinning so they do not steal cycles from the other workers.
+    """
+    cores = available_cores()
+    pinned = 'WORKER_CPU_SLOT' in os.environ
+    return {
+        'intra_op_threads': cores if pinned else max(1, cores // worker_count()),
+        'inter_op_threads': 1,
+        'graph_optimization': 'all',
+        'execution_mode': 'sequential',
+        'cpu_mem_arena': True,
+        'mem_pattern': True,
+        'allow_spinning': worker_count() == 1,
+    }
+
+
+def load_config_file():
+    """Optional JSON from ORT_CONFIG_FILE: {"default": {...}, "<taskname>": {...}}"""
+    path = os.environ.get('ORT_CONFIG_FILE')
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def session_settings(taskname, config=None):
+    """Effective settings for one model: defaults, then env vars, then the config file"""
+    settings = default_settings()
+    for name, (variable, parse) in SETTINGS.items():
+        if os.environ.get(variable):
+            settings[name] = parse(os.environ[variable])
+    config = load_config_file() if config is None else config
+    settings.update(config.get('default', {}))
+    settings.update(config.get(taskname, {}))
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown ONNX Runtime settings for {taskname}: {', '.join(sorted(unknown))}")
+    return settings
+
+
+def session_options(settings):
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = settings['intra_op_threads']
+    options.inter_op_num_threads = settings['inter_op_threads']
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[settings['graph_optimization']]
+    options.execution_mode = EXECUTION_MODES[settings['execution_mode']]
+    options.enable_cpu_mem_arena = settings['cpu_mem_arena']
+    options.enable_mem_pattern = settings['mem_pattern']
+    options.add_session_config_entry('session.intra_op.allow_spinning', '1' if settings['allow_spinning'] else '0')
+    return options
+
+
+def configure_sessions(face_model, providers=('CPUExecutionProvider',)):
+    """Rebuild every InsightFace model session with explicit SessionOptions.
+
+    InsightFace creates its sessions with default options and offers no way
+    to pass them, so each model's session is recreated from its model file.
+    Returns ``{taskname: settings}`` for logging.
+    """
+    config = load_config_file()
+    effective = {}
+    for taskname, model_part in face_model.models.items():
+        settings = session_settings(taskname, config)
+        model_part.session = onnxruntime.InferenceSession(model_part.model_file, sess_options=session_options(settings),
+                                                          providers=list(providers))
+        effective[taskname] = settings
+    return effective
+
+
+def describe_settings(effective):
+    """One log line per model with its effective session settings"""
+    pinning = f", pinned to CPU slot {os.environ['WORKER_CPU_SLOT']}" if 'WORKER_CPU_SLOT' in os.environ else ''
+    lines = [f"ONNX Runtime {onnxruntime.__version__}: {available_cores()} core(s) available, "
+             f"{worker_count()} worker(s){pinning}"]
+    for taskname, settings in effective.items():
+        lines.append(f"  {taskname}: " + ', '.join(f"{name}={value}" for name, value in settings.items()))
+    return '\n'.join(lines)
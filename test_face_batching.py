@@ -0,0 +1,116 @@
+import threading
+
+import numpy as np
+import pytest
+
+from face_batching import InferenceBatcher
+
+
+class FakeSession:
+    """Returns each crop's mean pixel value and records the batch sizes it was run with"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def run(self, output_names, feed):
+        blob = feed['x']
+        with self._lock:
+            self.batch_sizes.append(len(blob))
+        if self.fail:
+            raise RuntimeError('session failed')
+        return [blob.mean(axis=(1, 2, 3)).reshape(-1, 1)]
+
+
+class FakeModel:
+    taskname = 'recognition'
+    input_mean = 0.0
+    input_std = 1.0
+    input_size = (8, 8)
+    input_name = 'x'
+    output_names = ['y']
+
+    def __init__(self, fail=False):
+        self.session = FakeSession(fail)
+
+
+def crops(*values):
+    return [np.full((8, 8, 3), value, dtype=np.uint8) for value in values]
+
+
+def run_concurrently(batcher, jobs_per_caller):
+    results = [None] * len(jobs_per_caller)
+    errors = [None] * len(jobs_per_caller)
+    start = threading.Barrier(len(jobs_per_caller))
+
+    def call(i):
+        start.wait()
+        try:
+            results[i] = batcher.run(jobs_per_caller[i])
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(jobs_per_caller))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_callers_share_batches_and_get_their_own_rows():
+    model = FakeModel()
+    batcher = InferenceBatcher(max_batch_size=64, max_wait=0.05)
+    jobs = [[(model, crops(10 * i, 10 * i + 1))] for i in range(8)]
+    results, errors = run_concurrently(batcher, jobs)
+
+    assert errors == [None] * 8
+    for i, outputs in enumerate(results):
+        np.testing.assert_allclose(outputs[0].ravel(), [10 * i, 10 * i + 1])
+    assert sum(model.session.batch_sizes) == 16
+    assert len(model.session.batch_sizes) < 8
+    assert batcher.snapshot()['requests'] == 8
+
+
+def test_batches_respect_the_size_limit_and_group_by_model():
+    recognition, age = FakeModel(), FakeModel()
+    batcher = InferenceBatcher(max_batch_size=4, max_wait=0.05)
+    jobs = [[(recognition, crops(i, i)), (age, crops(100 + i))] for i in range(6)]
+    results, errors = run_concurrently(batcher, jobs)
+
+    assert errors == [None] * 6
+    for i, (embeddings, ages) in enumerate(results):
+        np.testing.assert_allclose(embeddings.ravel(), [i, i])
+        np.testing.assert_allclose(ages.ravel(), [100 + i])
+    # A batch holds at most 4 crops across both models (a larger single request still runs whole)
+    assert all(size <= 4 for size in recognition.session.batch_sizes)
+    assert batcher.snapshot()['largest_batch'] <= 4
+
+
+def test_full_queue_runs_inline():
+    model = FakeModel()
+    batcher = InferenceBatcher(max_batch_size=4, max_wait=0.05, max_queue=2)
+    outputs = batcher.run([(model, crops(1, 2, 3))])
+    np.testing.assert_allclose(outputs[0].ravel(), [1, 2, 3])
+    assert batcher.snapshot()['overflow_runs'] == 1 and batcher.snapshot()['batches'] == 0
+
+
+def test_empty_jobs_skip_the_queue():
+    model = FakeModel()
+    batcher = InferenceBatcher()
+    assert batcher.run([(model, []), (model, [])]) == [[], []]
+    assert model.session.batch_sizes == []
+
+
+def test_errors_reach_every_caller_in_the_batch():
+    model = FakeModel(fail=True)
+    batcher = InferenceBatcher(max_batch_size=64, max_wait=0.05)
+    _, errors = run_concurrently(batcher, [[(model, crops(i))] for i in range(4)])
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+    # The worker survives and serves later requests
+    with pytest.raises(RuntimeError):
+        batcher.run([(model, crops(1))])
+    model.session.fail = False
+    np.testing.assert_allclose(batcher.run([(model, crops(7))])[0].ravel(), [7])
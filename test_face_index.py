@@ -0,0 +1,108 @@
+import time
+
+import numpy as np
+
+from face_gallery import FaceGallery, normalize_embeddings
+from face_index import IVFIndex
+
+
+def embeddings(count, seed=0, dim=64):
+    return normalize_embeddings(np.random.default_rng(seed).normal(size=(count, dim)))
+
+
+def trained_gallery(count, nprobe, dim=64):
+    index = IVFIndex(nprobe=nprobe, min_size=0, train_sample=count)
+    gallery = FaceGallery(dim=dim, index=index)
+    for person_id, embedding in enumerate(embeddings(count, dim=dim)):
+        gallery.add(person_id, embedding)
+    deadline = time.time() + 60
+    while (index.training or not index.ready(len(gallery))) and time.time() < deadline:
+        time.sleep(0.01)
+    assert index.ready(len(gallery)) and not index.training
+    return gallery, index
+
+
+def exact_search(gallery, queries):
+    similarities = normalize_embeddings(queries) @ gallery.embeddings.T
+    best = np.argmax(similarities, axis=1)
+    return gallery.ids[best], similarities[np.arange(len(queries)), best]
+
+
+def assert_lists_consistent(gallery, index):
+    """Every gallery row is filed exactly once, with its current embedding"""
+    filed = []
+    for list_id, size in enumerate(index._list_sizes):
+        rows = index._list_rows[list_id][:size]
+        filed.extend(rows.tolist())
+        np.testing.assert_allclose(index._list_vectors[list_id][:size], gallery.embeddings[rows], atol=1e-6)
+    assert sorted(filed) == list(range(len(gallery)))
+
+
+def test_probing_every_list_matches_exact_search():
+    gallery, index = trained_gallery(600, nprobe=10_000)
+    queries = embeddings(20, seed=1)
+    ids, similarities = gallery.search(queries)
+    exact_ids, exact_similarities = exact_search(gallery, queries)
+    np.testing.assert_array_equal(ids, exact_ids)
+    np.testing.assert_allclose(similarities, exact_similarities, atol=1e-5)
+
+
+def test_stored_faces_are_found_with_few_probes():
+    gallery, index = trained_gallery(2000, nprobe=4)
+    stored = gallery.embeddings[::50] + np.random.default_rng(2).normal(0, 0.01, (40, gallery.dim))
+    ids, similarities = gallery.search(stored)
+    np.testing.assert_array_equal(ids, gallery.ids[::50])
+    assert (similarities > 0.9).all()
+
+
+def test_updates_and_removals_keep_lists_consistent():
+    gallery, index = trained_gallery(600, nprobe=10_000)
+    rng = np.random.default_rng(3)
+    for person_id in range(0, 600, 7):
+        gallery.update(person_id, rng.normal(size=gallery.dim), alpha=0.9)
+    for person_id in list(range(0, 600, 5)) + [599]:
+        if person_id in gallery:
+            gallery.remove(person_id)
+    for person_id, embedding in enumerate(embeddings(50, seed=4), start=1000):
+        gallery.add(person_id, embedding)
+    assert_lists_consistent(gallery, index)
+
+    queries = embeddings(20, seed=5)
+    np.testing.assert_array_equal(gallery.search(queries)[0], exact_search(gallery, queries)[0])
+
+
+def test_clear_forgets_the_trained_lists():
+    gallery, index = trained_gallery(300, nprobe=2)
+    gallery.clear()
+    assert not index.ready(len(gallery))
+    gallery.add(7, embeddings(1, seed=6)[0])
+    assert gallery.match(embeddings(1, seed=6), 0.5)[0][0] == 7
+
+
+def test_changes_during_training_are_filed(monkeypatch):
+    import face_index
+
+    index = IVFIndex(nprobe=10_000, min_size=400, train_sample=400)
+    gallery = FaceGallery(dim=64, index=index)
+    for person_id, embedding in enumerate(embeddings(399)):
+        gallery.add(person_id, embedding)
+    train = face_index.spherical_kmeans
+
+    def train_while_the_gallery_changes(*args, **kwargs):
+        # Runs on the training thread after the size was taken
+        for person_id in range(0, 399, 20):
+            gallery.remove(person_id)
+        for person_id in range(1, 399, 10):
+            gallery.update(person_id, np.ones(64), alpha=0.9)
+        for person_id, embedding in enumerate(embeddings(30, seed=7), start=500):
+            gallery.add(person_id, embedding)
+        return train(*args, **kwargs)
+
+    monkeypatch.setattr(face_index, 'spherical_kmeans', train_while_the_gallery_changes)
+    gallery.add(399, embeddings(1, seed=8)[0])  # Reaches min_size and starts training
+    deadline = time.time() + 60
+    while (index.training or not index.ready(len(gallery))) and time.time() < deadline:
+        time.sleep(0.01)
+    assert_lists_consistent(gallery, index)
+    queries = embeddings(20, seed=9)
+    np.testing.assert_array_equal(gallery.search(queries)[0], exact_search(gallery, queries)[0])
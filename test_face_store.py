@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+from face_gallery import normalize_embeddings
+from face_store import FaceRecords, FaceStore
+
+
+def write_store(store, ids, names, next_id):
+    embeddings = normalize_embeddings(np.random.default_rng(len(ids)).normal(size=(len(ids), store.dim)))
+    store.write(ids, embeddings, ages=[30 + i for i in range(len(ids))], counts=[1] * len(ids),
+                last_seen=[1000.0 + i for i in range(len(ids))], names=names, next_id=next_id)
+    return embeddings
+
+
+def open_records(store):
+    snapshot = store.open()
+    return snapshot, FaceRecords(snapshot['base_ids'], snapshot['meta'], snapshot['names'])
+
+
+def test_generations_replace_the_snapshot(tmp_path):
+    store = FaceStore(str(tmp_path), dim=8)
+    assert not store.exists()
+    write_store(store, [5, 2], ['Eve', 'Bob'], next_id=6)
+    embeddings = write_store(store, [7, 3, 9], ['Zoë', 'Cy', 'Ann'], next_id=10)
+
+    snapshot, records = open_records(store)
+    assert snapshot['count'] == 3 and snapshot['next_id'] == 10
+    np.testing.assert_array_equal(snapshot['ids'][:3], [3, 7, 9])
+    np.testing.assert_allclose(snapshot['embeddings'][:3], embeddings[[1, 0, 2]], atol=1e-6)
+    # Spare capacity for faces learned after startup
+    assert len(snapshot['ids']) > 3 and not snapshot['embeddings'][3:].any()
+    assert records[7] == {'age': 30, 'name': 'Zoë', 'count': 1, 'last_seen': 1000.0}
+    assert sorted(records) == [3, 7, 9]
+    # Only the current generation's files are left
+    assert sorted(os.listdir(tmp_path)) == ['embeddings-1.f32', 'ids-1.i64', 'manifest.json',
+                                            'meta-1.npy', 'names-1.bin']
+
+
+def test_empty_snapshot_opens(tmp_path):
+    store = FaceStore(str(tmp_path), dim=8)
+    store.write([], np.zeros((0, 8)), [], [], [], [], next_id=4)
+    snapshot, records = open_records(store)
+    assert snapshot['count'] == 0 and snapshot['next_id'] == 4
+    assert len(records) == 0 and records.max_id() == -1
+
+
+def test_overlay_keeps_changes_to_decoded_entries(tmp_path):
+    store = FaceStore(str(tmp_path), dim=8)
+    write_store(store, [1, 2], ['Ann', 'Bob'], next_id=3)
+    _, records = open_records(store)
+
+    records[1]['count'] += 4
+    records[1]['name'] = 'Anna'
+    records[8] = {'age': 50, 'name': 'New', 'count': 1, 'last_seen': 2000.0}
+    records[2] = dict(records[2])  # Replacing an entry does not add one
+    assert records[1]['count'] == 5 and records[1]['name'] == 'Anna'
+    assert len(records) == 3 and records.max_id() == 8
+
+    view = records.copy_view()
+    records[2]['name'] = 'Changed later'
+    ages, counts, last_seen, names = view.columns([8, 1, 2])
+    assert ages.tolist() == [50, 30, 31] and counts.tolist() == [1, 5, 1]
+    assert names == ['New', 'Anna', 'Bob']
+
+
+def test_delete_and_re_add(tmp_path):
+    store = FaceStore(str(tmp_path), dim=8)
+    write_store(store, [1, 2, 3], ['Ann', 'Bob', 'Cy'], next_id=4)
+    _, records = open_records(store)
+
+    del records[2]
+    assert 2 not in records and len(records) == 2 and sorted(records) == [1, 3]
+    with pytest.raises(KeyError):
+        del records[2]
+
+    records[2] = {'age': 60, 'name': 'Bob again', 'count': 1, 'last_seen': 3000.0}
+    assert 2 in records and len(records) == 3 and sorted(records) == [1, 2, 3]
+    assert records[2]['name'] == 'Bob again'
+    assert records.columns([2])[3] == ['Bob again']
+
+    del records[2]
+    assert 2 not in records and len(records) == 2
+    records.clear()
+    assert len(records) == 0 and list(records) == []
@@ -0,0 +1,69 @@
+import numpy as np
+
+from face_tracker import FaceTracker, box_iou
+
+
+class Face:
+    def __init__(self, bbox):
+        self.bbox = np.array(bbox, dtype=np.float32)
+
+
+FRAME = np.zeros((120, 160, 3), dtype=np.uint8)
+
+
+def identity(person_id, similarity=0.9, status='RECOGNIZED'):
+    return {'person_id': person_id, 'status': status, 'similarity': similarity}
+
+
+def test_box_iou():
+    iou = box_iou([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]])
+    np.testing.assert_allclose(iou, [[1.0, 1 / 3, 0.0]], atol=1e-6)
+
+
+def test_detections_follow_the_overlapping_track():
+    tracker = FaceTracker(use_flow=False)
+    first, second = tracker.update(FRAME, [Face([0, 0, 20, 20]), Face([100, 0, 120, 20])])
+
+    # Listed in the other order and moved a little: each still goes to its own track
+    tracks = tracker.update(FRAME, [Face([102, 2, 122, 22]), Face([2, 2, 22, 22])])
+    assert [track.track_id for track in tracks] == [first.track_id, second.track_id]
+    np.testing.assert_array_equal(first.bbox, [2, 2, 22, 22])
+
+    # Too little overlap starts a new track
+    tracks = tracker.update(FRAME, [Face([2, 2, 22, 22]), Face([60, 60, 80, 80])])
+    assert len(tracks) == 3 and tracks[2].track_id not in (first.track_id, second.track_id)
+
+
+def test_missed_tracks_expire_after_max_misses():
+    tracker = FaceTracker(max_misses=2, use_flow=False)
+    track, = tracker.update(FRAME, [Face([0, 0, 20, 20])])
+    tracker.assign([track], [identity(1)])
+
+    for misses in (1, 2):
+        assert tracker.update(FRAME, []) == [track]
+        assert track.misses == misses and track.face is None
+        assert tracker.results() == [(track, track.identity)]
+        assert tracker.results(detected_only=True) == []
+    assert tracker.update(FRAME, []) == []
+
+
+def test_identities_carry_over_until_refresh():
+    tracker = FaceTracker(refresh_interval=3, confident_similarity=0.7, use_flow=False)
+    track, = tracker.update(FRAME, [Face([0, 0, 20, 20])])
+    assert tracker.needs_identity(track)
+    tracker.assign([track], [identity(7)])
+
+    for _ in range(2):
+        tracker.update(FRAME, [Face([1, 1, 21, 21])])
+        assert not tracker.needs_identity(track)
+        assert tracker.results(detected_only=True) == [(track, identity(7))]
+    tracker.update(FRAME, [Face([1, 1, 21, 21])])
+    assert tracker.needs_identity(track)  # refresh_interval rounds since the last recognition
+
+    # Uncertain matches and faces still being learned are recognised again on the next detection
+    tracker.assign([track], [identity(7, similarity=0.65)])
+    tracker.update(FRAME, [Face([1, 1, 21, 21])])
+    assert tracker.needs_identity(track)
+    tracker.assign([track], [identity(None, similarity=0.0, status='LEARNING')])
+    tracker.update(FRAME, [Face([1, 1, 21, 21])])
+    assert tracker.needs_identity(track)
@@ -0,0 +1,55 @@
+import threading
+from multiprocessing.connection import Listener
+
+import pytest
+
+from gallery_service import GalleryUnavailable, RemoteGallery
+
+
+def crashing_gallery(address, replies):
+    """Gallery process stand-in that dies after reading the first request, then answers from a restart"""
+    listener = Listener(address, family='AF_UNIX')
+    received = []
+
+    def serve():
+        conn = listener.accept()
+        received.append(conn.recv())
+        conn.close()  # Died before answering
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            with conn:
+                while True:
+                    try:
+                        received.append(conn.recv())
+                    except EOFError:
+                        break
+                    conn.send(('ok', replies.get(received[-1][0])))
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener, received
+
+
+def test_lookups_are_sent_again_after_the_gallery_dies(tmp_path):
+    listener, received = crashing_gallery(str(tmp_path / 'gallery.sock'), {'count': 3})
+    try:
+        assert RemoteGallery(str(tmp_path / 'gallery.sock'), connect_timeout=1).count() == 3
+        assert [method for method, _ in received] == ['count', 'count']
+    finally:
+        listener.close()
+
+
+def test_changes_are_not_sent_again_after_the_gallery_dies(tmp_path):
+    listener, received = crashing_gallery(str(tmp_path / 'gallery.sock'), {'learn': (5, 'Person_5')})
+    try:
+        gallery = RemoteGallery(str(tmp_path / 'gallery.sock'), connect_timeout=1)
+        # The first request may have been journaled; sending it again would learn the face twice
+        with pytest.raises(GalleryUnavailable):
+            gallery.learn([0.0], 30)
+        assert [method for method, _ in received] == ['learn']
+        # The next call reconnects to the restarted process
+        assert gallery.learn([0.0], 30) == (5, 'Person_5')
+    finally:
+        listener.close()
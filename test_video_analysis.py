@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+
+from face_tracker import FaceTracker
+from video_analysis import analyze_video
+
+
+class Face:
+    def __init__(self, bbox):
+        self.bbox = np.array(bbox, dtype=np.float32)
+
+
+def write_clip(path, fps, frames, face_frames):
+    """A dark clip with a bright square (the "face") on the given frames"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (160, 120))
+    for index in range(frames):
+        frame = np.zeros((120, 160, 3), dtype=np.uint8)
+        if index in face_frames:
+            frame[30:90, 50:110] = 255
+        writer.write(frame)
+    writer.release()
+
+
+def tracking_analyzer():
+    """Like app.create_video_frame_analyzer, with a brightness test for detection and no gallery"""
+    tracker = FaceTracker(refresh_interval=1, use_flow=False)
+
+    def analyze(frame):
+        faces = [Face([50, 30, 110, 90])] if frame[60, 80].mean() > 128 else []
+        tracks = tracker.update(frame, faces)
+        pending = [track for track in tracks if tracker.needs_identity(track)]
+        tracker.assign(pending, [{'person_id': None, 'name': None, 'age': 30, 'status': 'UNKNOWN',
+                                  'similarity': 0.0} for _ in pending])
+        return [dict(identity, track_id=track.track_id) for track, identity in tracker.results(detected_only=True)]
+
+    return analyze
+
+
+def test_interval_ends_at_the_last_sample_with_the_face(tmp_path):
+    path = str(tmp_path / 'clip.avi')
+    write_clip(path, fps=10, frames=40, face_frames=range(20))
+    events = list(analyze_video(path, tracking_analyzer(), sample_fps=2))
+
+    intervals = [event for event in events if event['type'] == 'interval']
+    assert len(intervals) == 1
+    # Samples at 0, 0.5, 1.0 and 1.5 s show the face; the ones after it left must not extend the interval
+    assert intervals[0]['start'] == 0.0 and intervals[0]['end'] == 1.5
+    assert intervals[0]['detections'] == 4 and intervals[0]['age'] == 30
+    assert events[-1]['type'] == 'summary'
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Age and identity timelines for recorded video: the clip is decoded frame by
+frame with cv2.VideoCapture, sampled at a fixed rate and run through the app's
+recognition pipeline with tracking. Output is JSON lines: one ``interval``
+record per continuous appearance of a person (with age estimates) and a final
+``summary``. Only open intervals are kept in memory, so memory use does not
+grow with the length of the clip.
+
+Faces are matched against (and new faces learned into) the same persisted
+gallery as the web app, so person ids agree with it. The gallery files are
+locked by whichever process owns them; while the server runs, pass
+--gallery-socket (or set GALLERY_SOCKET) to use its gallery process.
+
+Usage: python video_analysis.py clip.mp4 [--sample-fps 2] [--output timeline.jsonl]
+       [--gallery-socket /tmp/gallery.sock]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+import cv2
+
+
+class AppearanceTimeline:
+    """Open appearance intervals per person; an interval closes once its person
+    has not been seen for more than ``max_gap`` seconds of video.
+
+    People are keyed by gallery person id, or by tracker id for pipelines
+    without recognition. Ages are summarised as a running mean and range.
+    """
+
+    def __init__(self, max_gap):
+        self.max_gap = max_gap
+        self.open = {}
+        self.closed_count = 0
+        self.people = set()
+
+    @staticmethod
+    def key(result):
+        if result.get('person_id') is not None:
+            return ('person', result['person_id'])
+        return ('track', result.get('track_id'))
+
+    def observe(self, timestamp, results):
+        """Add one sampled frame's face results; returns the intervals this closed"""
+        for result in results:
+            key = self.key(result)
+            interval = self.open.get(key)
+            if interval is None:
+                interval = self.open[key] = {
+                    'person_id': result.get('person_id'),
+                    'track_id': result.get('track_id') if result.get('person_id') is None else None,
+                    'name': result.get('name'),
+                    'start': timestamp,
+                    'end': timestamp,
+                    'detections': 0,
+                    'age_sum': 0,
+                    'age_min': result['age'],
+                    'age_max': result['age'],
+                }
+                self.people.add(key)
+            interval['end'] = timestamp
+            interval['name'] = result.get('name')
+            interval['detections'] += 1
+            interval['age_sum'] += result['age']
+            interval['age_min'] = min(interval['age_min'], result['age'])
+            interval['age_max'] = max(interval['age_max'], result['age'])
+        expired = [key for key, interval in self.open.items() if timestamp - interval['end'] > self.max_gap]
+        return [self._close(key) for key in expired]
+
+    def close_all(self):
+        return [self._close(key) for key in sorted(self.open, key=lambda key: self.open[key]['start'])]
+
+    def _close(self, key):
+        interval = self.open.pop(key)
+        self.closed_count += 1
+        age_sum = interval.pop('age_sum')
+        return {
+            'type': 'interval',
+            **interval,
+            'start': round(interval['start'], 3),
+            'end': round(interval['end'], 3),
+            'duration': round(interval['end'] - interval['start'], 3),
+            'age': int(round(age_sum / interval['detections'])),
+            'age_min': int(interval['age_min']),
+            'age_max': int(interval['age_max']),
+        }
+
+
+def analyze_video(path, analyze_frame, sample_fps=2.0, max_gap=None, progress_every=5.0):
+    """Generator of JSON-serialisable events for one video file.
+
+    ``analyze_frame(frame)`` returns the face results of one sampled frame
+    (dicts with person_id, name, age and, without recognition, track_id).
+    Events: ``start``, ``progress`` (every ``progress_every`` wall-clock
+    seconds), ``interval`` and finally ``summary``.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError('Could not open the video (unsupported format or codec)')
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        if not fps or fps != fps or fps > 1000:
+            fps = 25.0  # Some containers do not report a frame rate
+        total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+        step = max(1, int(round(fps / sample_fps))) if sample_fps > 0 else 1
+        if max_gap is None:
+            # Missing a person on two consecutive samples does not end their appearance
+            max_gap = max(1.0, 2.5 * step / fps)
+        timeline = AppearanceTimeline(max_gap)
+
+        yield {'type': 'start', 'fps': round(fps, 3), 'frames': total_frames,
+               'duration': round(total_frames / fps, 3) if total_frames else None,
+               'sample_every': step, 'max_gap': round(max_gap, 3)}
+
+        started = last_progress = time.perf_counter()
+        index = sampled = 0
+        while True:
+            if index % step:
+                # Skipped frames are only demuxed/decoded, never converted or analysed
+                if not capture.grab():
+                    break
+                index += 1
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+            timestamp = index / fps
+            for interval in timeline.observe(timestamp, analyze_frame(frame)):
+                yield interval
+            sampled += 1
+            index += 1
+
+            now = time.perf_counter()
+            if now - last_progress >= progress_every:
+                last_progress = now
+                yield {'type': 'progress', 'frame': index, 'time': round(timestamp, 3),
+                       'fraction': round(index / total_frames, 4) if total_frames else None,
+                       'elapsed': round(now - started, 1)}
+
+        for interval in timeline.close_all():
+            yield interval
+        yield {'type': 'summary', 'frames': index, 'sampled_frames': sampled,
+               'duration': round(index / fps, 3), 'people': len(timeline.people),
+               'intervals': timeline.closed_count, 'seconds': round(time.perf_counter() - started, 2)}
+    finally:
+        capture.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', help='Video file to analyse')
+    parser.add_argument('--sample-fps', type=float, default=2.0, help='Frames analysed per second of video (0 = all)')
+    parser.add_argument('--max-gap', type=float, help='Seconds a person may be unseen within one interval')
+    parser.add_argument('--pipeline', help='Pipeline profile (default: DEFAULT_PIPELINE)')
+    parser.add_argument('--output', help='JSON lines output file (default: stdout)')
+    parser.add_argument('--gallery-socket', default=os.environ.get('GALLERY_SOCKET'),
+                        help='Use a running server\'s gallery process instead of opening the gallery file')
+    args = parser.parse_args()
+    # Read by app at import time
+    if args.gallery_socket:
+        os.environ['GALLERY_SOCKET'] = args.gallery_socket
+    # Fail at once if a server owns the gallery rather than waiting for its lock
+    os.environ.setdefault('GALLERY_LOCK_TIMEOUT', '0')
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        # The app logs with print; keep stdout for the JSON lines
+        with contextlib.redirect_stdout(sys.stderr):
+            import app
+            app.model_loader.join()
+            if not app.model_ready.is_set():
+                print(f"Model failed to load: {app.model_state['error']}")
+                if not args.gallery_socket:
+                    print("If a server is running, pass its --gallery-socket")
+                return 1
+            pipeline = args.pipeline or app.DEFAULT_PIPELINE
+            if pipeline not in app.enabled_profiles() or not app.supports_profile(app.model, pipeline):
+                print(f"Unknown or disabled pipeline: {pipeline}")
+                return 2
+            events = analyze_video(args.video, app.create_video_frame_analyzer(pipeline),
+                                   sample_fps=args.sample_fps, max_gap=args.max_gap)
+            for event in events:
+                if event['type'] in ('start', 'progress'):
+                    print(json.dumps(event))  # Progress goes to stderr
+                else:
+                    output.write(json.dumps(event) + '\n')
+                    output.flush()
+            # Flush the faces learned from this clip while logs still go to stderr
+            app.save_learned_faces()
+            app.gallery_service.close()
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except Exception as e:
+        # Like the endpoint: a failed sample ends the timeline with an error record
+        print(f"Error analysing video: {e}", file=sys.stderr)
+        output.write(json.dumps({'type': 'error', 'error': str(e)}) + '\n')
+        return 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
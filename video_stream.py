@@ -0,0 +1,310 @@
+import threading
+import time
+
+import cv2
+
+from metrics import moving_average, to_ms
+
+
+class FrameSlot:
+    """Single-item buffer that only keeps the newest value.
+
+    Writers ``publish``; readers ``wait_newer`` than the sequence number
+    they last saw, so a slow reader skips straight to the latest item
+    instead of working through a backlog.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._item = None
+        self._seq = 0
+        self.closed = False
+
+    def publish(self, item):
+        with self._condition:
+            self._item = item
+            self._seq += 1
+            self._condition.notify_all()
+
+    def wait_newer(self, seq, timeout=None):
+        """``(seq, item)`` for an item newer than ``seq``, or ``(seq, None)`` on timeout/close"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > seq or self.closed, timeout)
+            if self._seq > seq:
+                return self._seq, self._item
+            return seq, None
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class AdaptiveScheduler:
+    """Chooses detection cadence and output frame rate from measured stage latencies.
+
+    Keeps exponential moving averages of the inference time of frames with
+    and without detection, of the JPEG encode time and of the end-to-end
+    latency (capture to encoded frame). Detection runs on every
+    ``detect_interval``-th frame, picked as the smallest interval whose
+    average per-frame cost fits the ``target_fps`` budget; while latency is
+    above ``target_latency`` the interval is lengthened further. If even the
+    longest interval does not fit, the output frame rate drops instead of
+    letting frames queue up.
+    """
+
+    def __init__(self, target_fps=15.0, target_latency=0.25, max_detect_interval=10, smoothing=0.2):
+        self.target_fps = target_fps
+        self.target_latency = target_latency
+        self.max_detect_interval = max_detect_interval
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self.detect_time = None
+        self.track_time = None
+        self.encode_time = None
+        self.latency = None
+        self.detect_interval = min(3, max_detect_interval)
+        self.output_fps = target_fps
+        self.frames_since_detect = None
+        self.frames = 0
+        self.dropped = 0
+        self._next_frame_at = None
+
+    def should_detect(self):
+        with self._lock:
+            return self.frames_since_detect is None or self.frames_since_detect + 1 >= self.detect_interval
+
+    def record_inference(self, seconds, detected, dropped=0):
+        with self._lock:
+            self.frames += 1
+            self.dropped += dropped
+            if detected:
+                self.detect_time = moving_average(self.detect_time, seconds, self.smoothing)
+                self.frames_since_detect = 0
+            else:
+                self.track_time = moving_average(self.track_time, seconds, self.smoothing)
+                self.frames_since_detect = (self.frames_since_detect or 0) + 1
+            self._rebalance()
+
+    def record_encode(self, seconds, latency):
+        with self._lock:
+            self.encode_time = moving_average(self.encode_time, seconds, self.smoothing)
+            self.latency = moving_average(self.latency, latency, self.smoothing)
+
+    def frame_cost(self, interval):
+        """Average seconds of inference plus encoding per output frame"""
+        detect = self.detect_time or 0.0
+        track = self.track_time if self.track_time is not None else detect
+        return (detect + (interval - 1) * track) / interval + (self.encode_time or 0.0)
+
+    def _rebalance(self):
+        if self.detect_time is None:
+            return
+        budget = 1.0 / self.target_fps
+        interval = next((n for n in range(1, self.max_detect_interval + 1) if self.frame_cost(n) <= budget),
+                        self.max_detect_interval)
+        if self.latency is not None and self.latency > self.target_latency:
+            interval = max(interval, min(self.detect_interval + 1, self.max_detect_interval))
+        self.detect_interval = interval
+        self.output_fps = min(self.target_fps, 1.0 / max(self.frame_cost(interval), 1e-6))
+
+    def frame_delay(self):
+        """Seconds to wait before the next frame so the output averages output_fps.
+
+        Frames are paced against a running deadline, so a slow detection
+        frame is made up for by shorter waits after the cheap ones.
+        """
+        with self._lock:
+            now = time.perf_counter()
+            interval = 1.0 / self.output_fps
+            # Catch up over one detection cycle at most, never bursts after a long stall
+            if self._next_frame_at is None or now - self._next_frame_at > interval * self.detect_interval:
+                self._next_frame_at = now
+            self._next_frame_at += interval
+            return max(0.0, self._next_frame_at - now)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'target_fps': self.target_fps,
+                'target_latency_ms': to_ms(self.target_latency),
+                'detect_interval': self.detect_interval,
+                'output_fps': round(self.output_fps, 1),
+                'detect_ms': to_ms(self.detect_time),
+                'track_ms': to_ms(self.track_time),
+                'encode_ms': to_ms(self.encode_time),
+                'latency_ms': to_ms(self.latency),
+                'frames': self.frames,
+                'dropped_frames': self.dropped,
+            }
+
+
+class CameraCapture:
+    """Reads the camera on a background thread while anyone is subscribed"""
+
+    def __init__(self, open_camera):
+        self.open_camera = open_camera
+        self._lock = threading.Lock()
+        self._users = 0
+        self._frames = None
+        self._stop = None
+        self._thread = None
+
+    def subscribe(self):
+        """Start capturing if needed; returns the FrameSlot frames are published to"""
+        with self._lock:
+            self._users += 1
+            if self._thread is None or self._stop.is_set() or not self._thread.is_alive():
+                if self._thread is not None and self._thread.is_alive():
+                    self._thread.join()  # Stopping; finishes after its current read
+                self._frames = FrameSlot()
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._frames, self._stop),
+                                                name='camera-capture', daemon=True)
+                self._thread.start()
+            return self._frames
+
+    def unsubscribe(self):
+        with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                self._stop.set()
+
+    def _run(self, frames, stop):
+        camera = self.open_camera()
+        if camera is None:
+            print("Camera not available for streaming")
+            frames.close()
+            return
+        try:
+            while not stop.is_set():
+                ret, frame = camera.read()
+                if not ret:
+                    print("Failed to read frame from camera")
+                    break
+                frames.publish((time.time(), frame))
+        except Exception as e:
+            print(f"Error capturing frames: {e}")
+        finally:
+            frames.close()
+
+
+class VideoBroadcast:
+    """Capture -> inference -> JPEG encode pipeline shared by every viewer of a stream.
+
+    One inference thread always takes the newest captured frame (older ones
+    are dropped) and hands the annotated frame to an encoder thread, which
+    publishes one multipart JPEG chunk per frame. Viewers only read the
+    latest chunk, so adding viewers costs neither inference nor encoding.
+    The threads run while at least one viewer is subscribed;
+    ``create_processor()`` is called at the start of each run and must
+    return a ``process(frame, detect) -> annotated_frame`` callable. Each
+    run gets a fresh AdaptiveScheduler built by ``create_scheduler()``,
+    which decides on which frames ``detect`` is true and paces the output.
+    ``observe(stage, seconds)``, if given, receives the inference and encode
+    time of every frame and its capture-to-output latency.
+    """
+
+    def __init__(self, capture, create_processor, create_scheduler=AdaptiveScheduler, jpeg_quality=85,
+                 observe=None):
+        self.capture = capture
+        self.create_processor = create_processor
+        self.create_scheduler = create_scheduler
+        self.jpeg_quality = jpeg_quality
+        self.observe = observe
+        self._lock = threading.Lock()
+        self._viewers = 0
+        self._output = None
+        self._stop = None
+        self.scheduler = None
+
+    def subscribe(self):
+        """Generator of multipart JPEG chunks for one viewer"""
+        with self._lock:
+            self._viewers += 1
+            if self._viewers == 1:
+                self._start()
+            output = self._output
+        try:
+            seq = 0
+            while True:
+                seq, chunk = output.wait_newer(seq)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            with self._lock:
+                self._viewers -= 1
+                if self._viewers == 0:
+                    self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            stats = {'viewers': self._viewers, 'running': self._viewers > 0}
+            scheduler = self.scheduler
+        if scheduler is not None:
+            stats['scheduler'] = scheduler.snapshot()
+        return stats
+
+    def _start(self):
+        frames = self.capture.subscribe()
+        annotated = FrameSlot()
+        self._output = FrameSlot()
+        self._stop = threading.Event()
+        self.scheduler = self.create_scheduler()
+        threading.Thread(target=self._infer, args=(frames, annotated, self.scheduler, self._stop),
+                         name='video-inference', daemon=True).start()
+        threading.Thread(target=self._encode, args=(annotated, self._output, self.scheduler, self._stop),
+                         name='video-encoder', daemon=True).start()
+
+    def _infer(self, frames, annotated, scheduler, stop):
+        try:
+            process = self.create_processor()
+            seq = 0
+            while not stop.is_set():
+                previous_seq = seq
+                seq, item = frames.wait_newer(seq, timeout=0.5)
+                if item is None:
+                    if frames.closed:
+                        break
+                    continue
+                captured_at, frame = item
+                detect = scheduler.should_detect()
+                started = time.perf_counter()
+                annotated.publish((captured_at, process(frame.copy(), detect)))
+                elapsed = time.perf_counter() - started
+                scheduler.record_inference(elapsed, detect, dropped=seq - previous_seq - 1 if previous_seq else 0)
+                if self.observe is not None:
+                    self.observe('infer', elapsed)
+                # Pace the output to the scheduler's frame rate instead of a fixed sleep
+                stop.wait(scheduler.frame_delay())
+        except Exception as e:
+            print(f"Error in frame inference: {e}")
+        finally:
+            self.capture.unsubscribe()
+            annotated.close()
+
+    def _encode(self, annotated, output, scheduler, stop):
+        try:
+            seq = 0
+            while not stop.is_set():
+                seq, item = annotated.wait_newer(seq, timeout=0.5)
+                if item is None:
+                    if annotated.closed:
+                        break
+                    continue
+                captured_at, frame = item
+                started = time.perf_counter()
+                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                if ret:
+                    output.publish(b'--frame\r\n'
+                                   b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+                    elapsed, latency = time.perf_counter() - started, time.time() - captured_at
+                    scheduler.record_encode(elapsed, latency)
+                    if self.observe is not None:
+                        self.observe('encode', elapsed)
+                        self.observe('latency', latency)
+        except Exception as e:
+            print(f"Error in frame encoding: {e}")
+        finally:
+            output.close()